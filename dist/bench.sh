@@ -0,0 +1,8 @@
+#!/bin/bash
+
+set -eu
+
+current_dir=$(pwd)
+export PYTHONPATH="${current_dir}/src"
+
+python -m bench_teezz "$@"
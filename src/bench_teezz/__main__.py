@@ -0,0 +1,60 @@
+import os
+import argparse
+import logging
+
+from utils.log import init_ini_log
+from .runner import run_benchmarks, format_table
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark DependencyFinder on synthetic firmware.")
+    parser.add_argument(
+        "--scales",
+        default="50,200",
+        help="Comma separated numbers of ELF files to generate. Default `50,200`."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["adb", "local"],
+        default="adb",
+        help="Serve the tree through the fake adb (default) or read it directly."
+    )
+    parser.add_argument(
+        "--fanout",
+        type=int,
+        default=3,
+        help="DT_NEEDED entries per generated ELF. Default 3."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="bench_results.json",
+        help="JSON file receiving the results. Default `bench_results.json`."
+    )
+    parser.add_argument(
+        "--keep",
+        help="Directory to keep generated trees and work dirs in."
+    )
+    parser.add_argument(
+        "--log_level",
+        default="WARNING",
+        help="Level for the dep_finder loggers while benchmarking. Default `WARNING`."
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    os.makedirs(os.path.join(os.getcwd(), "logs"), exist_ok=True)
+    init_ini_log(os.path.join(os.getcwd(), "log.ini"))
+    for name in ("depFinderLogger", "utilsLogger"):
+        logging.getLogger(name).setLevel(args.log_level)
+    results = run_benchmarks([int(s) for s in args.scales.split(",")], args.output,
+                             backend=args.backend, fanout=args.fanout, seed=args.seed,
+                             keep=args.keep)
+    print(format_table(results))
@@ -0,0 +1,148 @@
+"""Stand-in for `adb` serving a synthetic firmware tree as a rooted device.
+
+The device root is taken from `FAKE_ADB_ROOT`. Shell commands are run
+with the local `sh` after device paths have been rewritten into the tree,
+and the tree prefix is stripped from their output again. When
+`FAKE_ADB_LOG` is set every invocation is appended to it, one per line.
+"""
+import os
+import re
+import sys
+import shlex
+import shutil
+import subprocess
+
+ROOT = os.environ.get("FAKE_ADB_ROOT", "")
+DEVICE_PATH = re.compile(r"(?<![\w./:-])/([\w.@+-]+)")
+BARE_ROOT = re.compile(r"(?<=\s)/(?=\s|$)")
+
+
+def _local(path: str) -> str:
+    return os.path.join(ROOT, path.lstrip("/"))
+
+
+def _rewrite(cmd: str) -> str:
+    def repl(m):
+        if os.path.exists(os.path.join(ROOT, m.group(1))):
+            return ROOT + m.group(0)
+        return m.group(0)
+    return BARE_ROOT.sub(ROOT + "/", DEVICE_PATH.sub(repl, cmd))
+
+
+def _getprop(name: str) -> str:
+    for prop_file in ("system/build.prop", "vendor/build.prop"):
+        try:
+            with open(os.path.join(ROOT, prop_file)) as f:
+                for line in f:
+                    key, _, value = line.strip().partition("=")
+                    if key == name:
+                        return value
+        except OSError:
+            pass
+    return ""
+
+
+def _packages():
+    result = []
+    for dirpath, _, filenames in sorted(os.walk(ROOT)):
+        for filename in sorted(filenames):
+            if filename.endswith(".apk"):
+                local_path = os.path.join(dirpath, filename)
+                result.append((filename[:-4], "/" + os.path.relpath(local_path, ROOT)))
+    return result
+
+
+def shell(cmd: str) -> int:
+    cmd = cmd.strip()
+    if cmd.startswith("su -c"):
+        cmd = cmd[len("su -c"):].strip()
+    if cmd == "" or cmd == "whoami":
+        print("root" if cmd else "")
+        return 0
+    if cmd == "getprop":
+        seen = set()
+        for prop_file in ("system/build.prop", "vendor/build.prop"):
+            if not os.path.exists(os.path.join(ROOT, prop_file)):
+                continue
+            with open(os.path.join(ROOT, prop_file)) as f:
+                for line in f:
+                    key, _, value = line.strip().partition("=")
+                    if key and not key.startswith("#") and key not in seen:
+                        seen.add(key)
+                        print(f"[{key}]: [{value}]")
+        return 0
+    if cmd.startswith("getprop "):
+        print(_getprop(cmd.split()[1]))
+        return 0
+    if cmd.startswith("pm list packages"):
+        for name, _ in _packages():
+            print(name)
+        return 0
+    if cmd.startswith("pm path "):
+        name = cmd.split()[2]
+        for package, path in _packages():
+            if package == name:
+                print(path)
+        return 0
+    proc = subprocess.run(["sh", "-c", _rewrite(cmd)], cwd=ROOT,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sys.stdout.write(proc.stdout.decode("utf-8", "ignore").replace(ROOT, ""))
+    sys.stderr.write(proc.stderr.decode("utf-8", "ignore").replace(ROOT, ""))
+    return proc.returncode
+
+
+def exec_out(cmd: str) -> int:
+    """Binary-safe: the output is passed through untouched."""
+    cmd = cmd.strip()
+    if cmd.startswith("su -c "):
+        cmd = shlex.split(cmd)[2]
+    sys.stdout.flush()
+    subprocess.run(["sh", "-c", _rewrite(cmd)], cwd=ROOT, stderr=subprocess.DEVNULL)
+    # like adb, the exit status of the device command is not reported
+    return 0
+
+
+def main(argv) -> int:
+    if os.environ.get("FAKE_ADB_LOG"):
+        with open(os.environ["FAKE_ADB_LOG"], "a") as f:
+            f.write(" ".join(argv).replace("\n", " ") + "\n")
+    if argv[:1] == ["-s"]:
+        argv = argv[2:]
+    if not argv:
+        print("Android Debug Bridge (fake)")
+        return 1
+    command, args = argv[0], argv[1:]
+    if command == "devices":
+        print("List of devices attached\nfake0000\tdevice")
+        return 0
+    if command == "root":
+        print("adbd is already running as root")
+        return 0
+    if command == "shell":
+        return shell(" ".join(args))
+    if command == "exec-out":
+        return exec_out(" ".join(args))
+    if command == "pull":
+        shutil.copyfile(_local(args[0]), args[1])
+        print(f"{args[0]}: 1 file pulled.")
+        return 0
+    if command == "push":
+        shutil.copyfile(args[0], _local(args[1]))
+        return 0
+    print(f"adb: unknown command {command}", file=sys.stderr)
+    return 1
+
+
+def install(bin_dir: str) -> str:
+    """Writes an `adb` wrapper running this module into `bin_dir` and
+    returns its path; put `bin_dir` first on `PATH` to use it."""
+    os.makedirs(bin_dir, exist_ok=True)
+    adb = os.path.join(bin_dir, "adb")
+    with open(adb, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" -S "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(adb, 0o755)
+    return adb
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
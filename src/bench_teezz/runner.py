@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import multiprocessing
+from typing import List
+
+from dep_finder.dependency_finder import DependencyFinder
+from utils import metrics
+from . import fake_adb
+from .synth import FirmwareSpec, generate_firmware
+
+PHASES = ["adb_env", "file_list", "pull", "elf_analysis", "graph_build", "visualization"]
+
+
+class BenchDependencyFinder(DependencyFinder):
+    """`DependencyFinder` keeping the graph it built."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependencies = None
+
+    def build_dependency_graph(self, *args, **kwargs):
+        self.dependencies = super().build_dependency_graph(*args, **kwargs)
+        return self.dependencies
+
+    def create_visualization(self, out_dir, dependencies):
+        try:
+            return super().create_visualization(out_dir, dependencies)
+        except FileNotFoundError as e:
+            # graphviz is not installed; deps.dot has been written anyway
+            self.logger.warning(f"Visualization skipped: {e}")
+
+
+def _peak_rss() -> int:
+    """High-water mark of the resident set of this process in KiB. On Linux
+    `ru_maxrss` keeps that of the process that started us (across exec),
+    `VmHWM` does not."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_scale(n_elfs: int, base_dir: str, backend: str = "adb", fanout: int = 3,
+              seed: int = 0) -> dict:
+    """Generates a tree with about `n_elfs` ELF files and runs the whole
+    pipeline against it through the fake adb (or the local backend)."""
+    out_dir = os.path.join(base_dir, f"scale_{n_elfs}")
+    spec = FirmwareSpec.from_scale(n_elfs, fanout=fanout, seed=seed)
+    start = time.perf_counter()
+    manifest = generate_firmware(out_dir, spec)
+    generate_time = time.perf_counter() - start
+
+    kwargs = {}
+    if backend == "adb":
+        bin_dir = os.path.join(out_dir, "bin")
+        fake_adb.install(bin_dir)
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+        os.environ["FAKE_ADB_ROOT"] = manifest["root"]
+    else:
+        kwargs["local_root"] = manifest["root"]
+
+    finder = BenchDependencyFinder(work_dir=os.path.join(out_dir, "work"),
+                                   target_lib=manifest["target"], **kwargs)
+    start = time.perf_counter()
+    finder.run()
+    total = time.perf_counter() - start
+
+    summary = metrics.get_metrics().summary()
+    peak_rss = max(_peak_rss(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    found = sorted(finder.dependencies or {})
+    expected = manifest["expected_closure"]
+    return {
+        "scale": n_elfs,
+        "backend": backend,
+        "spec": manifest["spec"],
+        "elf_files": len(manifest["elfs"]),
+        "generate_seconds": generate_time,
+        "total_seconds": total,
+        "phases": {phase: summary["phases"].get(phase, {}).get("seconds", 0.0) for phase in PHASES},
+        "utilization": {phase: summary["phases"][phase]["utilization"] for phase in PHASES
+                        if "utilization" in summary["phases"].get(phase, {})},
+        "counters": summary["counters"],
+        "adb_calls": int(summary["counters"].get("adb.commands", 0)),
+        "peak_rss_kb": peak_rss,
+        "graph_nodes": len(found),
+        "expected_nodes": len(expected),
+        "missing_nodes": sorted(set(expected) - set(found)),
+        "unexpected_nodes": sorted(set(found) - set(expected)),
+    }
+
+
+def run_benchmarks(scales: List[int], output: str, backend: str = "adb", fanout: int = 3,
+                   seed: int = 0, keep: str | None = None) -> dict:
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": multiprocessing.cpu_count(),
+        },
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="teezz_bench_") as tmp:
+        base_dir = keep if keep is not None else tmp
+        for n_elfs in scales:
+            results["runs"].append(run_scale(n_elfs, base_dir, backend, fanout, seed))
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    return results
+
+
+def format_table(results: dict) -> str:
+    header = ["scale", "files", "adb"] + PHASES + ["total", "nodes", "ok"]
+    rows = [header]
+    for run in results["runs"]:
+        ok = not run["missing_nodes"] and not run["unexpected_nodes"]
+        rows.append([str(run["scale"]), str(run["elf_files"]), str(run["adb_calls"])]
+                    + [f"{run['phases'][p]:.2f}" for p in PHASES]
+                    + [f"{run['total_seconds']:.2f}", str(run["graph_nodes"]), "yes" if ok else "NO"])
+    widths = [max(len(r[i]) for r in rows) for i in range(len(header))]
+    return "\n".join("  ".join(c.rjust(w) for c, w in zip(r, widths)) for r in rows)
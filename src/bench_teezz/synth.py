@@ -0,0 +1,278 @@
+"""Synthetic firmware trees for benchmarks and device-free tests.
+
+A generated tree looks like an unpacked device (`system/`, `vendor/`,
+`apex/`, ...) filled with minimal but valid ELF64 files. The dependency
+structure is known up front and written to `manifest.json` next to the
+tree, so results of an analysis can be checked against it.
+"""
+import os
+import json
+import random
+import struct
+import zipfile
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+
+EM_AARCH64 = 183
+SHT_PROGBITS = 1
+SHT_STRTAB = 3
+SHT_DYNAMIC = 6
+SHT_DYNSYM = 11
+DT_NULL = 0
+DT_NEEDED = 1
+DT_SONAME = 14
+STB_GLOBAL = 1
+STT_FUNC = 2
+SHN_UNDEF = 0
+TEXT_SECTION = 4
+
+TARGET_LIB = "vendor/lib64/libQSEEComAPI.so"
+LIBC = "system/lib64/libc.so"
+APEX_DIR = "apex/com.android.synth/lib64"
+# with `FirmwareSpec.linker_config`: a HAL that `dlopen`s its module from `hw/`
+HW_SERVICE = "vendor/bin/hw/synth.keystore-service"
+HW_MODULE = "vendor/lib64/hw/keystore.synthhw.so"
+VNDK_VERSION = "30"
+# both sections search `system/` first, like `_resolve`; `hw/` is in no search path
+LD_CONFIG = """dir.system = /system/bin/
+dir.vendor = /vendor/bin/
+
+[system]
+namespace.default.search.paths = /system/${LIB}:/vendor/${LIB}
+
+[vendor]
+namespace.default.search.paths = /system/${LIB}:/vendor/${LIB}
+"""
+
+
+class _StringTable(object):
+
+    def __init__(self):
+        self.data = bytearray(b"\0")
+        self._offsets = {"": 0}
+
+    def add(self, s: str) -> int:
+        if s not in self._offsets:
+            self._offsets[s] = len(self.data)
+            self.data += s.encode() + b"\0"
+        return self._offsets[s]
+
+
+def build_elf(needed: List[str] = (), soname: str | None = None,
+              imports: List[str] = (), exports: List[str] = (),
+              strings: List[str] = ()) -> bytes:
+    """Returns a minimal AArch64 ELF64 shared object with `.dynstr`,
+    `.dynsym`, `.dynamic` and a `.rodata` holding `strings`."""
+    dynstr = _StringTable()
+    dynsym = bytearray(24)
+    for name in imports:
+        dynsym += struct.pack("<IBBHQQ", dynstr.add(name), (STB_GLOBAL << 4) | STT_FUNC,
+                              0, SHN_UNDEF, 0, 0)
+    for i, name in enumerate(exports):
+        dynsym += struct.pack("<IBBHQQ", dynstr.add(name), (STB_GLOBAL << 4) | STT_FUNC,
+                              0, TEXT_SECTION, 0x1000 + 16 * i, 16)
+    dynamic = bytearray()
+    for name in needed:
+        dynamic += struct.pack("<qQ", DT_NEEDED, dynstr.add(name))
+    if soname is not None:
+        dynamic += struct.pack("<qQ", DT_SONAME, dynstr.add(soname))
+    dynamic += struct.pack("<qQ", DT_NULL, 0)
+    rodata = b"".join(s.encode() + b"\0" for s in strings)
+
+    shstrtab = _StringTable()
+    # (name, type, flags, data, link, info, entsize)
+    sections = [
+        (".dynstr", SHT_STRTAB, 0x2, bytes(dynstr.data), 0, 0, 0),
+        (".dynsym", SHT_DYNSYM, 0x2, bytes(dynsym), 1, 1, 24),
+        (".dynamic", SHT_DYNAMIC, 0x3, bytes(dynamic), 1, 0, 16),
+        (".rodata", SHT_PROGBITS, 0x2, rodata, 0, 0, 0),
+    ]
+    for section in sections:
+        shstrtab.add(section[0])
+    shstrtab.add(".shstrtab")
+    sections.append((".shstrtab", SHT_STRTAB, 0, bytes(shstrtab.data), 0, 0, 0))
+
+    body = bytearray()
+    headers = [bytes(64)]
+    offset = 64
+    for name, sh_type, flags, data, link, info, entsize in sections:
+        headers.append(struct.pack("<IIQQQQIIQQ", shstrtab.add(name), sh_type, flags, offset,
+                                   offset, len(data), link, info, 8, entsize))
+        body += data + b"\0" * (-len(data) % 8)
+        offset = 64 + len(body)
+    ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8)
+    header = ident + struct.pack("<HHIQQQIHHHHHH", 3, EM_AARCH64, 1, 0, 0, offset, 0, 64,
+                                 0, 0, 64, len(headers), len(headers) - 1)
+    return header + bytes(body) + b"".join(headers)
+
+
+def mangle_get_service(package: List[str], version: str, interface: str) -> str:
+    """Returns the mangled `package::V<version>::<interface>::getService(bool)`."""
+    parts = package + ["V" + version.replace(".", "_"), interface, "getService"]
+    return "_ZN" + "".join(f"{len(p)}{p}" for p in parts) + "Eb"
+
+
+@dataclass
+class FirmwareSpec:
+    libs: int = 100
+    bins: int = 20
+    services: int = 4
+    fanout: int = 3
+    dlopen_users: int = 2
+    service_clients: int = 4
+    duplicates: int = 5
+    vdexs: int = 10
+    apks: int = 5
+    seed: int = 0
+    linker_config: bool = False
+
+    @staticmethod
+    def from_scale(n_elfs: int, fanout: int = 3, seed: int = 0) -> "FirmwareSpec":
+        """Spreads roughly `n_elfs` ELF files over the different kinds."""
+        services = max(1, n_elfs // 50)
+        return FirmwareSpec(libs=max(1, n_elfs * 7 // 10), bins=max(1, n_elfs // 5),
+                            services=services, fanout=fanout,
+                            dlopen_users=max(1, n_elfs // 100),
+                            service_clients=services * 2,
+                            duplicates=max(1, n_elfs // 20),
+                            vdexs=max(1, n_elfs // 10), apks=max(1, n_elfs // 20),
+                            seed=seed)
+
+
+def _write(root: str, path: str, data: bytes):
+    local_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, "wb") as f:
+        f.write(data)
+
+
+def _resolve(name: str, by_name: Dict[str, List[str]]) -> str | None:
+    """Picks the provider the tool picks: `system/` copies win."""
+    candidates = by_name.get(name, [])
+    system = [c for c in candidates if c.startswith("system/")]
+    return (system or candidates or [None])[0]
+
+
+def reverse_closure(edges: List[Tuple[str, str]], root: str) -> List[str]:
+    """All nodes that (transitively) depend on `root`, `root` included."""
+    users = defaultdict(list)
+    for requester, provider in edges:
+        users[provider].append(requester)
+    seen = {root}
+    queue = deque([root])
+    while queue:
+        for user in users[queue.popleft()]:
+            if user not in seen:
+                seen.add(user)
+                queue.append(user)
+    return sorted(seen)
+
+
+def generate_firmware(out_dir: str, spec: FirmwareSpec) -> dict:
+    """Writes a firmware tree to `<out_dir>/device` and its manifest to
+    `<out_dir>/manifest.json`; returns the manifest."""
+    rng = random.Random(spec.seed)
+    root = os.path.join(out_dir, "device")
+    files: Dict[str, dict] = {}
+
+    def add(path, needed=(), imports=(), exports=(), strings=()):
+        files[path] = {"needed": list(needed), "imports": list(imports),
+                       "exports": list(exports), "strings": list(strings)}
+
+    add(LIBC, exports=["malloc", "free", "dlopen"])
+    add(TARGET_LIB, needed=["libc.so"], imports=["malloc"],
+        exports=["QSEECom_start_app", "QSEECom_send_cmd"])
+    providers = [os.path.basename(TARGET_LIB)]
+    lib_paths = []
+    for i in range(spec.libs):
+        partition = rng.choice(["system", "vendor"])
+        name = f"libsynth_{i:05d}.so"
+        deps = rng.sample(providers, min(spec.fanout, len(providers)))
+        imports = ["QSEECom_send_cmd"] if os.path.basename(TARGET_LIB) in deps else []
+        path = f"{partition}/lib64/{name}"
+        add(path, needed=deps + ["libc.so"], imports=imports, exports=[f"synth_{i}"])
+        providers.append(name)
+        lib_paths.append(path)
+
+    service_paths = []
+    for i in range(spec.services):
+        path = f"vendor/lib64/hw/vendor.synth.hardware.svc{i:04d}@1.0-impl.so"
+        add(path, needed=rng.sample(providers, min(spec.fanout, len(providers))) + ["libc.so"])
+        service_paths.append((path, f"svc{i:04d}", f"ISvc{i:04d}"))
+
+    bin_paths = []
+    for i in range(spec.bins):
+        partition = rng.choice(["system", "vendor"])
+        path = f"{partition}/bin/synth_bin_{i:05d}"
+        add(path, needed=rng.sample(providers, min(spec.fanout, len(providers))) + ["libc.so"])
+        bin_paths.append(path)
+
+    service_edges = []
+    for i in range(min(spec.service_clients, len(bin_paths)) if service_paths else 0):
+        client = bin_paths[i]
+        service, base, interface = service_paths[i % len(service_paths)]
+        files[client]["imports"].append(
+            mangle_get_service(["vendor", "synth", "hardware", base], "1.0", interface))
+        service_edges.append((client, service))
+
+    dlopen_edges = []
+    for path in rng.sample(lib_paths, min(spec.dlopen_users, len(lib_paths))):
+        plugin = rng.choice(lib_paths)
+        files[path]["imports"].append("dlopen")
+        files[path]["strings"].append(os.path.basename(plugin))
+        dlopen_edges.append((path, plugin))
+
+    if spec.linker_config:
+        add(HW_MODULE, needed=[os.path.basename(TARGET_LIB), "libc.so"], imports=["QSEECom_send_cmd"])
+        add(HW_SERVICE, needed=["libc.so"], imports=["dlopen"], strings=[os.path.basename(HW_MODULE)])
+        dlopen_edges.append((HW_SERVICE, HW_MODULE))
+
+    system_libs = [p for p in lib_paths if p.startswith("system/")]
+    for path in rng.sample(system_libs, min(spec.duplicates, len(system_libs))):
+        files[f"{APEX_DIR}/{os.path.basename(path)}"] = files[path]
+
+    by_name = defaultdict(list)
+    for path in files:
+        by_name[os.path.basename(path)].append(path)
+    edges = []
+    for path, info in sorted(files.items()):
+        for name in info["needed"]:
+            provider = _resolve(name, by_name)
+            if provider is not None:
+                edges.append((path, provider))
+        data = build_elf(info["needed"], os.path.basename(path), info["imports"],
+                         info["exports"], info["strings"])
+        _write(root, path, data)
+    edges.extend(service_edges)
+
+    for i in range(spec.vdexs):
+        _write(root, f"system/framework/oat/arm64/synth_{i:04d}.vdex",
+               b"vdex027\0" + rng.randbytes(256))
+    for i in range(spec.apks):
+        apk = os.path.join(root, f"system/app/Synth{i:04d}/Synth{i:04d}.apk")
+        os.makedirs(os.path.dirname(apk), exist_ok=True)
+        with zipfile.ZipFile(apk, "w") as z:
+            z.writestr("AndroidManifest.xml", b"\3\0\x08\0")
+            z.writestr("classes.dex", b"dex\n035\0" + rng.randbytes(128))
+    _write(root, "system/build.prop",
+           f"ro.product.brand=synth\nro.build.fingerprint=synth/synth/synth:14/SYN.{spec.seed}/1:user/release-keys\n".encode())
+    vendor_props = "ro.hardware=synthhw\n"
+    if spec.linker_config:
+        _write(root, f"system/etc/ld.config.{VNDK_VERSION}.txt", LD_CONFIG.encode())
+        vendor_props += f"ro.vndk.version={VNDK_VERSION}\n"
+    _write(root, "vendor/build.prop", vendor_props.encode())
+    os.makedirs(os.path.join(root, "data/local/tmp"), exist_ok=True)
+
+    manifest = {
+        "spec": asdict(spec),
+        "root": root,
+        "target": TARGET_LIB,
+        "elfs": sorted(files),
+        "edges": sorted(edges),
+        "dlopen_edges": sorted(dlopen_edges),
+        "expected_closure": reverse_closure(edges + dlopen_edges, TARGET_LIB),
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
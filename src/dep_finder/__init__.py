@@ -1,6 +0,0 @@
-import os
-from utils.log import init_ini_log
-
-init_ini_log(os.path.join(os.getcwd(), 'log.ini'))
-
-
@@ -1,7 +1,11 @@
 import argparse
+import json
 import os
-from utils.log import init_ini_log
-from .dependency_finder import DependencyFinder
+from utils.log import init_ini_log, init_queue_log, stop_queue_log
+from .backend import DEVICE_JOBS, PULL_MODES
+
+# the modules for the chosen command are imported once the arguments are
+# parsed, `--help` and the queries do not pay for pyelftools and friends
 
 def build_parser():
     parser = argparse.ArgumentParser(argument_default=None)
@@ -14,6 +18,21 @@ def build_parser():
         help="ID of the connected Android device.",
         required=False
     )
+    parser.add_argument(
+        "--local_root",
+        help="Directory holding an unpacked firmware tree (system/, vendor/,"
+             " odm/, ...). Analyse it offline instead of a connected device.",
+        required=False
+    )
+    parser.add_argument(
+        "--image",
+        action="append",
+        dest="images",
+        help="Partition image (system.img, vendor.img, ...) to analyse offline."
+             " Android sparse, raw ext4 and erofs images are read in place."
+             " May be given several times.",
+        required=False
+    )
     parser.add_argument(
         "-w",
         "--workdir",
@@ -22,6 +41,89 @@ def build_parser():
         help="Working directory for intermediate files."
              " Will create a tmpdir if omitted."
     )
+    parser.add_argument(
+        "--pull_mode",
+        choices=PULL_MODES,
+        default="auto",
+        help="How files are pulled from a device: streamed as they are"
+             " (`raw`), compressed on the device (`gzip`, `zstd` if the"
+             " zstandard module is installed), through a copy in"
+             " /data/local/tmp (`legacy`), or chosen from the measured link"
+             " and device speed (`auto`, default)."
+    )
+    parser.add_argument(
+        "--device_jobs",
+        type=int,
+        default=DEVICE_JOBS,
+        help="Most adb operations in flight at a time. Below it the number"
+             " is adapted to the latency, errors and throughput seen, apart"
+             f" from the CPU count used for local work. Default {DEVICE_JOBS}."
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Discover the files again even if the working directory holds"
+             " the lists of an earlier run, and apply only what changed."
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Compare the build fingerprint and the content digests of the"
+             " files with the previous run in the working directory; pull and"
+             " analyse only what was added or changed and patch the stored"
+             " dependency graph."
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="Poll the build fingerprint every SECONDS and run incrementally"
+             " whenever it changed, until interrupted."
+    )
+    parser.add_argument(
+        "--symbol",
+        action="append",
+        dest="symbols",
+        help="Print which libraries export the dynamic symbol and which"
+             " ELFs import it, bound to which library, from the symbol index"
+             " of an earlier run in the working directory. May be given"
+             " several times.",
+        required=False
+    )
+    parser.add_argument(
+        "--diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Diff the dependency graphs of two builds, by fingerprint, stored"
+             " in the working directory: added and removed nodes and edges and"
+             " the change of the --target_lib closure. Writes <workdir>/diff.json"
+             " and the annotated <workdir>/diff.dot.",
+        required=False
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        metavar="PORT",
+        help="Serve closure, path, neighbor and symbol queries on the newest"
+             " graph in the working directory as JSON on 127.0.0.1:PORT."
+             " The graph is reloaded when a new analysis is stored.",
+        required=False
+    )
+    parser.add_argument(
+        "--trace_memory",
+        action="store_true",
+        help="Trace allocations with tracemalloc and report the peak."
+             " Slows down every allocation, off by default."
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        help="Profile every phase, pool workers included, and write merged"
+             " reports to <workdir>/profile. Comma separated modes out of"
+             " `cprofile` (default), `sample` (folded stacks for flamegraphs)"
+             " and `memory` (tracemalloc snapshots)."
+    )
     parser.add_argument(
         "-l",
         "--logconfig",
@@ -30,10 +132,60 @@ def build_parser():
         help="Config file used as logger config. Default value is `log.ini`",
         required=False
     )
+    parser.add_argument(
+        "--log_queue",
+        action="store_true",
+        help="Send log records of all processes through a queue to one"
+             " listener process instead of locking the log file per record."
+    )
+    parser.add_argument(
+        "--debug_rate",
+        type=int,
+        default=None,
+        help="With --log_queue, let at most this many DEBUG records per"
+             " second and call site through."
+    )
 
     return parser
 
 
+def print_symbols(work_dir: str, symbols):
+    from .symbols import SymbolIndex
+    index = SymbolIndex(os.path.join(work_dir, "symbols.db"))
+    try:
+        for symbol in symbols:
+            print(symbol)
+            for provider in index.providers(symbol):
+                print(f"  exported by {provider}")
+            for importer, provider in index.importers(symbol):
+                print(f"  imported by {importer} from {provider or '(unbound)'}")
+    finally:
+        index.close()
+
+
+def write_diff(work_dir: str, old: str, new: str, target_lib: str | None):
+    from .graph_store import GraphStore
+    from .graph_diff import diff_builds
+    store = GraphStore(os.path.join(work_dir, "graph.db"))
+    try:
+        if not (store.has(old) and store.has(new)):
+            print("Stored builds:")
+            for fingerprint, _ in store.builds():
+                print(f"  {fingerprint}")
+            raise SystemExit(f"No graph of build {old if not store.has(old) else new}")
+        diff = diff_builds(store, old, new, target_lib.lstrip("/") if target_lib else None)
+    finally:
+        store.close()
+    with open(os.path.join(work_dir, "diff.json"), "w") as f:
+        json.dump(diff.to_json(), f, indent=4)
+    with open(os.path.join(work_dir, "diff.dot"), "w") as f:
+        f.write(diff.to_dot())
+    print(f"nodes: +{len(diff.added_nodes)} -{len(diff.removed_nodes)}, "
+          f"edges: +{len(diff.added_edges)} -{len(diff.removed_edges)}")
+    if diff.target is not None:
+        print(f"closure of {diff.target}: +{len(diff.closure_added)} -{len(diff.closure_removed)}")
+
+
 if __name__ == "__main__":
     parser = build_parser()
     args = parser.parse_args()
@@ -42,8 +194,29 @@ if __name__ == "__main__":
         os.makedirs(log_directory)
         
     init_ini_log(args.log_config)
+    if args.symbols:
+        print_symbols(args.work_dir, args.symbols)
+        raise SystemExit(0)
+    if args.diff:
+        write_diff(args.work_dir, *args.diff, args.target_lib)
+        raise SystemExit(0)
+    if args.serve is not None:
+        from .query_server import serve
+        serve(args.work_dir, args.serve)
+        raise SystemExit(0)
+
+    if args.log_queue:
+        init_queue_log(args.debug_rate)
     
-    # Prepare arguments for DependencyFinder without log_config parameter
-    df_args = {k: v for k, v in vars(args).items() if k != "log_config"}
+    # Prepare arguments for DependencyFinder without logging parameters
+    log_args = {"log_config", "log_queue", "debug_rate", "symbols", "watch", "diff", "serve"}
+    df_args = {k: v for k, v in vars(args).items() if k not in log_args}
+    from .dependency_finder import DependencyFinder
     df = DependencyFinder(**df_args)
-    df.run()
\ No newline at end of file
+    try:
+        if args.watch:
+            df.watch(args.watch)
+        else:
+            df.run()
+    finally:
+        stop_queue_log()
\ No newline at end of file
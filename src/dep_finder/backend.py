@@ -0,0 +1,541 @@
+import os
+import re
+import shlex
+import hashlib
+import shutil
+import fnmatch
+import logging
+import posixpath
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+from utils.adb import Adb
+from utils.log import get_logger
+from utils import metrics
+from utils.concurrency import AimdController
+from utils.transfer import CODECS, HASH_COMMAND, calibrate, device_tools, stream_pull
+from .image_reader import DirEntry, FsReader, ImageError, UnsupportedLayout, open_filesystem
+
+logger = get_logger('depFinderLogger')
+
+ELF_MAGIC = b"\x7fELF"
+VDEX_PATTERN = "*.?dex"
+PULL_MODES = ["auto", "legacy", "raw"] + list(CODECS)
+# most adb operations in flight, the controller adapts below it
+DEVICE_JOBS = 16
+# length of the path arguments of one device side `md5sum`
+DIGEST_BATCH_CHARS = 32 << 10
+# a line of `getprop` without arguments
+PROP_LINE = re.compile(r"^\[([^\]]+)\]: \[(.*)\]\s*$", re.MULTILINE)
+BUILD_PROP_FILES = [
+    "/system/build.prop",
+    "/system/system/build.prop",
+    "/system/etc/build.prop",
+    "/vendor/build.prop",
+    "/vendor/etc/build.prop",
+    "/odm/build.prop",
+    "/odm/etc/build.prop",
+    "/product/etc/build.prop",
+]
+
+
+class StorageBackend(object):
+    """Source of the firmware files that get analysed.
+
+    Paths handed to and returned by a backend are absolute device paths
+    (`/vendor/lib64/libfoo.so`), no matter where the bytes really live.
+    """
+
+    # limits the concurrent operations of a device, `None`: a process per CPU
+    controller: AimdController | None = None
+
+    def list_root(self) -> List[str]:
+        """Returns the absolute paths of all entries under `/`."""
+        raise NotImplementedError
+
+    def is_directory(self, path: str) -> bool:
+        raise NotImplementedError
+
+    def count_files(self, paths: List[str]) -> Dict[str, int]:
+        """Returns the number of regular files directly in each directory
+        below `paths` that holds any. Used to split the scans, so it has to
+        be much cheaper than `find_elfs`."""
+        raise NotImplementedError
+
+    def find_elfs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        """Yields all regular files below `path` (directly in `path` unless
+        `recursive`) starting with the ELF magic, as they are found."""
+        raise NotImplementedError
+
+    def find_vdexs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        """Yields all regular files below `path` (directly in `path` unless
+        `recursive`) matching `*.?dex`, as they are found."""
+        raise NotImplementedError
+
+    def list_packages(self) -> List[Tuple[str, str]]:
+        """Returns `(package_name, apk_path)` for every installed package."""
+        raise NotImplementedError
+
+    def prepare_pull(self, sample_paths: List[str]) -> None:
+        """Called with a few of the files before a batch of pulls."""
+        pass
+
+    def pull(self, what: str, where: str) -> str:
+        """Copies the device file `what` to the local path `where`."""
+        raise NotImplementedError
+
+    def getprop(self, name: str) -> str:
+        raise NotImplementedError
+
+    def read_file(self, path: str) -> bytes | None:
+        """Returns the content of the small file `path`, `None` if there is
+        no such file."""
+        raise NotImplementedError
+
+    def file_digests(self, paths: List[str]) -> Dict[str, str]:
+        """Returns the md5 hex digest of each of the files `paths`; files
+        that cannot be read are left out."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class AdbBackend(StorageBackend):
+    """Backend talking to a rooted device through `Adb`.
+
+    Files are pulled with one streamed `exec-out` each (`pull_mode` `raw`),
+    optionally compressed on the device (`gzip`, `zstd`), and checked
+    against the device side hash. `auto` picks the mode from a short
+    calibration in `prepare_pull()`; `legacy` copies every file to
+    `/data/local/tmp` first and uses `adb pull`, which is also the
+    fallback when a streamed pull fails.
+    """
+
+    def __init__(self, adb: Adb, pull_mode: str = "auto", device_jobs: int = DEVICE_JOBS):
+        self.adb = adb
+        self.pull_mode = pull_mode
+        self.controller = AimdController(maximum=device_jobs)
+        self._mode = None if pull_mode == "auto" else pull_mode
+        self._verify = True
+        self._props: Dict[str, str] | None = None
+
+    def list_root(self) -> List[str]:
+        return self.adb.adb_ls_privileged("/")
+
+    def is_directory(self, path: str) -> bool:
+        out = self.adb.call_privileged_adb_shell([f'stat {path}']).split("\n")
+        if len(out) > 2:
+            return "directory" in out[1]
+        assert False, f'Error: `stat` returned {out}'
+
+    def count_files(self, paths: List[str]) -> Dict[str, int]:
+        # one round trip; the output has one line per directory, not per file
+        cmd = f"find {' '.join(paths)} -type f 2>/dev/null | sed 's|/[^/]*$||' | sort | uniq -c"
+        counts = {}
+        for line in self.adb.iter_privileged_shell_lines([cmd]):
+            count, _, directory = line.strip().partition(" ")
+            if count.isdigit() and directory:
+                counts[directory.strip()] = int(count)
+        return counts
+
+    def find_elfs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        depth = "" if recursive else " -maxdepth 1"
+        cmd = f"for node in `find {path}{depth} -type f`; do echo -n \"$node: \"; dd if=$node bs=1 count=4 2>/dev/null | grep -q 'ELF'; echo $?; done"
+        for line in self.adb.iter_privileged_shell_lines([cmd]):
+            node, sep, status = line.rpartition(": ")
+            if sep and status == "0":
+                yield node
+
+    def find_vdexs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        depth = "" if recursive else " -maxdepth 1"
+        cmd = f'find {path}{depth} -type f -iname "{VDEX_PATTERN}"'
+        for line in self.adb.iter_privileged_shell_lines([cmd]):
+            if line:
+                yield line
+
+    def list_packages(self) -> List[Tuple[str, str]]:
+        result = []
+        get_names_cmd = "pm list packages | tr -d '\r' | sed 's/package://g'"
+        for name in self.adb.iter_privileged_shell_lines([get_names_cmd]):
+            get_path_cmd = "pm path {} | tr -d '\r' | sed 's/package://g'".format(name.strip())
+            path = self.adb.call_adb_shell([get_path_cmd]).strip()
+            result.append((name, path))
+        return result
+
+    def prepare_pull(self, sample_paths: List[str]) -> None:
+        if self._mode == "legacy" or not sample_paths:
+            return
+        if self.pull_mode != "auto":
+            self._verify = HASH_COMMAND in device_tools(self.adb, [HASH_COMMAND])
+            return
+        stats = calibrate(self.adb, sample_paths)
+        self._mode = stats.choose()
+        self._verify = stats.verify
+        logger.info("Pull mode %s: link %.1f MB/s, %s", self._mode, stats.bandwidth / 1e6,
+                    ", ".join(f"{n} {speed / 1e6:.1f} MB/s ratio {ratio:.2f}"
+                              for n, (speed, ratio) in stats.codecs.items()) or "no codecs")
+
+    def pull(self, what: str, where: str) -> str:
+        mode = self._mode or "raw"
+        if mode != "legacy":
+            error = stream_pull(self.adb, what, where, mode, self._verify)
+            if not error:
+                return ""
+            logger.info("Streamed pull failed, falling back to adb pull: %s", error)
+            metrics.count("pull.fallbacks")
+        return self.adb.adb_pull_privileged(what, where)
+
+    def getprop(self, name: str) -> str:
+        # all properties with one unprivileged call, no root probing needed
+        if self._props is None:
+            self._props = dict(PROP_LINE.findall(self.adb.call_adb_shell(["getprop"])))
+        if name in self._props:
+            return self._props[name]
+        return self.adb.call_privileged_adb_shell(["getprop", name]).strip()
+
+    def file_digests(self, paths: List[str]) -> Dict[str, str]:
+        # hashed on the device, a few commands for all files
+        batches, batch, size = [], [], 0
+        for path in paths:
+            quoted = shlex.quote(path)
+            if batch and size + len(quoted) > DIGEST_BATCH_CHARS:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(quoted)
+            size += len(quoted) + 1
+        if batch:
+            batches.append(batch)
+        digests = {}
+        for batch in batches:
+            for line in self.adb.iter_privileged_shell_lines([f"{HASH_COMMAND} {' '.join(batch)} 2>/dev/null"]):
+                digest, _, path = line.strip().partition("  ")
+                if len(digest) == 32 and path:
+                    digests[path] = digest
+        return digests
+
+    def read_file(self, path: str) -> bytes | None:
+        quoted = shlex.quote(path)
+        with self.adb.exec_out(f"test -f {quoted} && echo 1 && cat {quoted}", privileged=True) as proc:
+            out = proc.stdout.read()
+        if not out.startswith(b"1\n"):
+            return None
+        return out[2:]
+
+    def close(self) -> None:
+        self.adb.kill_all_adb_process()
+
+
+class TreeBackend(StorageBackend):
+    """Shared discovery for backends that walk the file tree in-process."""
+
+    def __init__(self, logger=None):
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self._props = None
+        # images already reported to hold files the readers cannot decode
+        self._unsupported_images = set()
+
+    def _iter_files(self, path: str, recursive: bool = True) -> Iterator[str]:
+        """Yields the device paths of all regular files below `path` (only
+        directly in `path` unless `recursive`); like `find -type f` this
+        does not follow symlinks."""
+        raise NotImplementedError
+
+    def _read(self, path: str, size: int = -1) -> bytes:
+        """Returns the first `size` bytes (everything for -1) of `path`."""
+        raise NotImplementedError
+
+    def _md5(self, path: str) -> str:
+        """Returns the md5 hex digest of `path`, read in chunks."""
+        raise NotImplementedError
+
+    def count_files(self, paths: List[str]) -> Dict[str, int]:
+        counts = Counter()
+        for path in paths:
+            for p in self._iter_files(path):
+                counts[posixpath.dirname(p)] += 1
+        return dict(counts)
+
+    def find_elfs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        for p in self._iter_files(path, recursive):
+            try:
+                if self._read(p, 4) == ELF_MAGIC:
+                    yield p
+            except UnsupportedLayout as e:
+                self._skip_unsupported(p, e)
+            except (OSError, ImageError) as e:
+                self.logger.debug("Skip %s: %s", p, e)
+
+    def _skip_unsupported(self, path: str, error: UnsupportedLayout):
+        # a compressed image would otherwise silently yield an almost empty graph
+        metrics.count("image.unsupported_files")
+        if error.image not in self._unsupported_images:
+            self._unsupported_images.add(error.image)
+            self.logger.warning(f"{error}: {path} and every other file stored like it are skipped, "
+                                "the graph misses them")
+
+    def find_vdexs(self, path: str, recursive: bool = True) -> Iterator[str]:
+        for p in self._iter_files(path, recursive):
+            if fnmatch.fnmatch(posixpath.basename(p).lower(), VDEX_PATTERN):
+                yield p
+
+    def list_packages(self) -> List[Tuple[str, str]]:
+        """Without a package manager the package name is taken from the APK
+        file name (or its directory for `base.apk`)."""
+        result = []
+        for root_dir in self.list_root():
+            if not self.is_directory(root_dir):
+                continue
+            for p in self._iter_files(root_dir):
+                if not p.endswith(".apk"):
+                    continue
+                stem = posixpath.splitext(posixpath.basename(p))[0]
+                name = posixpath.basename(posixpath.dirname(p)) if stem == "base" else stem
+                result.append((name, p))
+        return result
+
+    def _load_props(self):
+        props = {}
+        for prop_file in BUILD_PROP_FILES:
+            try:
+                text = self._read(prop_file).decode("utf-8", "ignore")
+            except (OSError, ImageError):
+                continue
+            for line in text.splitlines():
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                props.setdefault(key.strip(), value.strip())
+        return props
+
+    def getprop(self, name: str) -> str:
+        if self._props is None:
+            self._props = self._load_props()
+        return self._props.get(name, "")
+
+    def read_file(self, path: str) -> bytes | None:
+        try:
+            return self._read(path)
+        except (OSError, ImageError):
+            return None
+
+    def file_digests(self, paths: List[str]) -> Dict[str, str]:
+        digests = {}
+        for path in paths:
+            try:
+                digests[path] = self._md5(path)
+            except (OSError, ImageError):
+                continue
+        return digests
+
+
+class LocalBackend(TreeBackend):
+    """Backend reading an unpacked firmware tree from the local disk.
+
+    `root` is the directory holding `system/`, `vendor/`, `odm/`, ... so
+    that `/vendor/lib64/libfoo.so` lives at `<root>/vendor/lib64/libfoo.so`.
+    Discovery runs in-process with `os.scandir`, no device is needed.
+    """
+
+    def __init__(self, root: str, logger=None):
+        super().__init__(logger)
+        self.root = os.path.abspath(root)
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f"Firmware root {self.root} does not exist")
+
+    def _local_path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def _device_path(self, local_path: str) -> str:
+        return "/" + os.path.relpath(local_path, self.root).replace(os.sep, "/")
+
+    def _iter_files(self, path: str, recursive: bool = True) -> Iterator[str]:
+        stack = [self._local_path(path)]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield self._device_path(entry.path)
+            except OSError as e:
+                self.logger.debug("Skip %s: %s", current, e)
+
+    def _read(self, path: str, size: int = -1) -> bytes:
+        with open(self._local_path(path), "rb") as f:
+            return f.read(size)
+
+    def _md5(self, path: str) -> str:
+        with open(self._local_path(path), "rb") as f:
+            return hashlib.file_digest(f, "md5").hexdigest()
+
+    def list_root(self) -> List[str]:
+        return sorted("/" + name for name in os.listdir(self.root))
+
+    def is_directory(self, path: str) -> bool:
+        return os.path.isdir(self._local_path(path))
+
+    def pull(self, what: str, where: str) -> str:
+        src = self._local_path(what)
+        try:
+            try:
+                os.link(src, where)
+            except OSError:
+                shutil.copyfile(src, where)
+        except OSError as e:
+            self.logger.error("Copy %s failed: %s", src, e)
+            return str(e)
+        return ""
+
+
+class ImageBackend(TreeBackend):
+    """Backend reading partition images (`system.img`, `vendor.img`, ...).
+
+    Android sparse, raw ext4 and erofs images are read in place: only the
+    metadata and file blocks that are asked for are touched, nothing is
+    mounted or unpacked. Every image is mounted at `/<name>` derived from
+    its file name; a system-as-root `system.img` is mounted at `/`.
+    """
+
+    PULL_CHUNK_SIZE = 1 << 20
+    MAX_SYMLINK_DEPTH = 40
+
+    def __init__(self, images: List[str], logger=None):
+        super().__init__(logger)
+        self.images = [os.path.abspath(i) for i in images]
+        self._mounts = None
+
+    def __getstate__(self):
+        # open image handles stay in the process that opened them
+        state = self.__dict__.copy()
+        state["_mounts"] = None
+        return state
+
+    def _mount_table(self) -> Dict[str, FsReader]:
+        if self._mounts is None:
+            mounts = {}
+            for image in self.images:
+                reader = open_filesystem(image)
+                name = os.path.basename(image).split(".")[0]
+                if name == "system" and "system" in reader.listdir(reader.root):
+                    mount_point = "/"
+                else:
+                    mount_point = "/" + name
+                mounts[mount_point] = reader
+            self._mounts = mounts
+        return self._mounts
+
+    def _find_mount(self, path: str) -> Tuple[str, FsReader | None]:
+        mounts = self._mount_table()
+        candidate = path
+        while True:
+            if candidate in mounts:
+                return candidate, mounts[candidate]
+            if candidate == "/":
+                return candidate, None
+            candidate = posixpath.dirname(candidate)
+
+    def _resolve(self, path: str, follow: bool = True) -> Tuple[FsReader, DirEntry]:
+        """Maps the device path `path` to its file system and entry."""
+        path = posixpath.normpath("/" + path.lstrip("/"))
+        for _ in range(self.MAX_SYMLINK_DEPTH):
+            mount_point, reader = self._find_mount(path)
+            if reader is None:
+                raise FileNotFoundError(path)
+            rel = posixpath.relpath(path, mount_point)
+            parts = [] if rel == "." else rel.split("/")
+            entry = DirEntry(reader.root, "d")
+            restart = None
+            for i, part in enumerate(parts):
+                if entry.kind != "d":
+                    raise NotADirectoryError(path)
+                entry = reader.listdir(entry.node).get(part)
+                if entry is None:
+                    raise FileNotFoundError(path)
+                if entry.kind == "l" and (follow or i + 1 < len(parts)):
+                    target = reader.readlink(entry.node)
+                    parent = posixpath.join(mount_point, *parts[:i])
+                    restart = posixpath.normpath(posixpath.join(parent, target, *parts[i + 1:]))
+                    break
+            if restart is None:
+                return reader, entry
+            path = restart
+        raise OSError(f"Too many levels of symbolic links: {path}")
+
+    def _iter_files(self, path: str, recursive: bool = True) -> Iterator[str]:
+        try:
+            reader, entry = self._resolve(path)
+        except (OSError, ImageError) as e:
+            self.logger.debug("Skip %s: %s", path, e)
+            return
+        mounts = self._mount_table()
+        stack = [(path.rstrip("/") or "/", reader, entry.node)]
+        while stack:
+            current, reader, node = stack.pop()
+            try:
+                children = reader.listdir(node)
+            except ImageError as e:
+                self.logger.debug("Skip %s: %s", current, e)
+                continue
+            for name, child in children.items():
+                child_path = posixpath.join(current, name)
+                if not recursive and (child_path in mounts or child.kind == "d"):
+                    continue
+                if child_path in mounts:
+                    stack.append((child_path, mounts[child_path], mounts[child_path].root))
+                elif child.kind == "d":
+                    stack.append((child_path, reader, child.node))
+                elif child.kind == "f":
+                    yield child_path
+
+    def _read(self, path: str, size: int = -1) -> bytes:
+        reader, entry = self._resolve(path)
+        if entry.kind == "d":
+            raise IsADirectoryError(path)
+        if size < 0:
+            size = reader.file_size(entry.node)
+        return reader.read(entry.node, 0, size)
+
+    def _md5(self, path: str) -> str:
+        reader, entry = self._resolve(path)
+        if entry.kind == "d":
+            raise IsADirectoryError(path)
+        digest = hashlib.md5()
+        for offset in range(0, reader.file_size(entry.node), self.PULL_CHUNK_SIZE):
+            digest.update(reader.read(entry.node, offset, self.PULL_CHUNK_SIZE))
+        return digest.hexdigest()
+
+    def list_root(self) -> List[str]:
+        mounts = self._mount_table()
+        names = {m for m in mounts if m != "/"}
+        if "/" in mounts:
+            names.update("/" + n for n in mounts["/"].listdir(mounts["/"].root))
+        return sorted(names)
+
+    def is_directory(self, path: str) -> bool:
+        try:
+            return self._resolve(path)[1].kind == "d"
+        except (OSError, ImageError):
+            return False
+
+    def pull(self, what: str, where: str) -> str:
+        try:
+            reader, entry = self._resolve(what)
+            size = reader.file_size(entry.node)
+            with open(where, "wb") as f:
+                for offset in range(0, size, self.PULL_CHUNK_SIZE):
+                    f.write(reader.read(entry.node, offset, self.PULL_CHUNK_SIZE))
+        except (OSError, ImageError) as e:
+            self.logger.error("Extract %s failed: %s", what, e)
+            return str(e)
+        return ""
+
+    def close(self) -> None:
+        if self._mounts is not None:
+            for reader in self._mounts.values():
+                reader.close()
+            self._mounts = None
@@ -0,0 +1,174 @@
+import os
+import shutil
+import subprocess
+from typing import Dict, Iterable, List
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger('depFinderLogger')
+
+CXXFILT = "c++filt"
+# names written to c++filt before reading their lines back; below the smallest
+# common pipe buffer, so the writes never block on a c++filt stuck writing
+CXXFILT_BATCH_BYTES = 16 * 1024
+
+# mangled name -> demangled, "" when it does not demangle; per process, for the whole run
+_cache: Dict[str, str] = {}
+# the `c++filt` of this process, fed a batch at a time; False once it is known to be unusable
+_pipe: subprocess.Popen | None | bool = None
+# in a forked child: the pipe of the parent, closed here but not ours to wait for
+_parent_pipe: subprocess.Popen | None = None
+
+
+def nested_name(mangled: str) -> List[str] | None:
+    """Components of the plain nested name of a function, e.g.
+    `["android", "hardware", "foo", "V1_0", "IFoo", "getService"]` for the
+    HIDL `IFoo::getService`. None for anything with substitutions,
+    templates or special names, which needs a real demangler."""
+    if not mangled.startswith("_ZN"):
+        return None
+    i = 3
+    if mangled.startswith("K", i):
+        i += 1
+    parts = []
+    while i < len(mangled) and mangled[i].isdigit():
+        j = i
+        while j < len(mangled) and mangled[j].isdigit():
+            j += 1
+        length = int(mangled[i:j])
+        if length == 0 or j + length > len(mangled):
+            return None
+        parts.append(mangled[j:j + length])
+        i = j + length
+    if i >= len(mangled) or mangled[i] != "E" or len(parts) < 2:
+        return None
+    return parts
+
+
+def _fast_path(mangled: str) -> str | None:
+    """The qualified name, without its parameter list, when the interface
+    (the first `I...` component) is there to be read off the nested name."""
+    parts = nested_name(mangled)
+    if parts is None:
+        return None
+    for i, part in enumerate(parts):
+        if part.startswith("I"):
+            return "::".join(parts) if i >= 2 else None
+    return None
+
+
+def start():
+    """Starts the long-lived `c++filt` of this process, e.g. in a pool
+    initializer; otherwise it is started on first use."""
+    global _pipe
+    if _pipe:
+        return
+    path = shutil.which(CXXFILT)
+    if path is None:
+        _pipe = False
+        return
+    try:
+        _pipe = subprocess.Popen([path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, text=True)
+    except OSError as e:
+        logger.warning(f"{CXXFILT} failed to start, demangling in process: {e}")
+        _pipe = False
+
+
+def stop():
+    global _pipe
+    if _pipe:
+        with _pipe:
+            _pipe.stdin.close()
+    _pipe = None
+
+
+def _forget_pipe():
+    # a forked child must neither share the parent's pipe nor keep it open
+    global _pipe, _parent_pipe
+    if _pipe:
+        _pipe.stdin.close()
+        _pipe.stdout.close()
+        _parent_pipe = _pipe
+    _pipe = None
+
+
+os.register_at_fork(after_in_child=_forget_pipe)
+
+
+def _batches(names: List[str]) -> Iterable[List[str]]:
+    batch, size = [], 0
+    for name in names:
+        if batch and size + len(name) + 1 > CXXFILT_BATCH_BYTES:
+            yield batch
+            batch, size = [], 0
+        batch.append(name)
+        size += len(name) + 1
+    if batch:
+        yield batch
+
+
+def _run_cxxfilt(names: List[str]) -> List[str] | None:
+    global _pipe
+    if _pipe is None:
+        start()
+    if not _pipe:
+        return None
+    out = []
+    try:
+        # one write per batch, then a line back for every name of it
+        for batch in _batches(names):
+            _pipe.stdin.write("".join(name + "\n" for name in batch))
+            _pipe.stdin.flush()
+            for name in batch:
+                line = _pipe.stdout.readline()
+                if not line:
+                    raise OSError(f"{CXXFILT} exited")
+                text = line.rstrip("\n")
+                out.append(text if text != name else "")
+    except OSError as e:
+        logger.warning(f"{CXXFILT} failed, demangling in process: {e}")
+        with _pipe:
+            _pipe.kill()
+        _pipe = False
+        return None
+    return out
+
+
+def _demangle_in_process(names: List[str]) -> List[str]:
+    import cxxfilt
+    out = []
+    for name in names:
+        try:
+            out.append(cxxfilt.demangle(name, external_only=False))
+        except cxxfilt.InvalidName:
+            out.append("")
+    return out
+
+
+def demangle_all(names: Iterable[str]) -> Dict[str, str]:
+    """Demangles `names`; "" for a name that does not demangle. Names
+    are memoized for the run; plain nested names are read off directly and
+    the rest go through the `c++filt` of this process, or `cxxfilt`
+    without it."""
+    result = {}
+    pending = []
+    for name in dict.fromkeys(names):
+        demangled = _cache.get(name)
+        if demangled is None:
+            demangled = _fast_path(name)
+            if demangled is None:
+                pending.append(name)
+                continue
+            metrics.count("demangle.fast")
+            _cache[name] = demangled
+        result[name] = demangled
+    if pending:
+        metrics.count("demangle.batched", len(pending))
+        demangled = _run_cxxfilt(pending)
+        if demangled is None:
+            demangled = _demangle_in_process(pending)
+        for name, text in zip(pending, demangled):
+            _cache[name] = result[name] = text
+    return result
@@ -2,41 +2,102 @@ from collections import defaultdict, deque
 from pathlib import Path
 import logging
 import os
+import json
+import hashlib
+import posixpath
 import logging
 import tempfile
+import time
 import multiprocessing
 import tracemalloc
 from typing import List, Dict, Tuple, Union
 
 from elftools.common.exceptions import ELFError
-import cxxfilt
 
 from utils.adb import Adb
 from utils.log import get_logger
+from utils import metrics, profiling
 from .command import *
 from .file_type import *
 from .file_extractor import FileExtractor
+from .file_store import FileListStore, StoredFileList
+from .journal import RunJournal
+from .symbols import ElfInfo, SymbolIndex, read_elf_info, library_names, prefer_system
+from .linker_config import LinkerConfig, LibraryResolver, apex_name, config_digest, load_linker_configs
+from .graph_store import GraphStore, closure_skips
+from . import demangle
+from .demangle import demangle_all
+from .backend import DEVICE_JOBS, StorageBackend, AdbBackend, LocalBackend, ImageBackend
 
 
 logger = get_logger('depFinderLogger')
 
+# finder and ELF table of the analysis pools, handed to every worker once
+_shared_finder: "DependencyFinder | None" = None
+_shared_elf_files: ExecutableTable | None = None
+
+
+def _share_run(finder: "DependencyFinder", elf_files: ExecutableTable):
+    global _shared_finder, _shared_elf_files
+    _shared_finder = finder
+    _shared_elf_files = elf_files
+    # one c++filt per worker, for all the ELFs it analyses
+    demangle.start()
+
+
+# pool tasks; they only carry an index or a VDEX, not the finder
+def _elf_task(index: int):
+    return _shared_finder._elf_task(index)
+
+
+def _vdex_task(vdex: Vdex):
+    return _shared_finder._vdex_task(vdex)
+
 
 class DependencyFinder(object):
 
     _thread_count = multiprocessing.cpu_count()
 
-    def __init__(self, work_dir, target_lib: str, device_id=None):
+    def __init__(self, work_dir, target_lib: str, device_id=None, local_root=None,
+                 images: List[str] | None = None, trace_memory: bool = False,
+                 profile: str | None = None, rescan: bool = False, pull_mode: str = "auto",
+                 incremental: bool = False, device_jobs: int = DEVICE_JOBS):
         self.work_dir = work_dir
         self.target_lib = target_lib[1:] if target_lib.startswith("/") else target_lib
         self.device_id = None
         self.source_dir = os.path.join(self.work_dir, "jadx_source")
         if device_id is not None:
             self.device_id = device_id
+        self.local_root = local_root
+        self.images = images
+        self.trace_memory = trace_memory
+        self.profile = profile.split(",") if isinstance(profile, str) else profile
+        self.rescan = rescan
+        self.pull_mode = pull_mode
+        self.incremental = incremental
+        self.device_jobs = device_jobs
+        self.adb = None
+        self.backend: StorageBackend | None = None
+        self.journal: RunJournal | None = None
+        self.symbols: SymbolIndex | None = None
+        self.graph: GraphStore | None = None
+        # incremental runs: build the graph is patched from, paths whose edges changed
+        self._base_build: str | None = None
+        self._stale: set | None = None
+        self.linker_configs: Dict[str, LinkerConfig] = {}
         if logger is not None:
             self.logger = logger
         else:
             self.logger = logging.Logger(__name__)
 
+    def __getstate__(self):
+        # sent to every pool worker once; journal, symbol index and graph stay with the parent
+        state = self.__dict__.copy()
+        state["journal"] = None
+        state["symbols"] = None
+        state["graph"] = None
+        return state
+
     ################################################################################
     # ELF files
     ################################################################################
@@ -45,46 +106,38 @@ class DependencyFinder(object):
         """Returns a list of libraries required by the given ELF file."""
         return elf.get_needed_libraries()
 
-    def _check_for_dynamic_symbols(self, elf: Elf):
-        """Checks if specific dynamic symbols exist in an ELF file."""
-        hw_get_mod = elf.contains_dynamic_symbol("hw_get_module")
-        dlopen = elf.contains_dynamic_symbol("dlopen")
-        return hw_get_mod, dlopen
-
-    def _find_dependencies_from_strings(self, elf: Elf, elf_files: List[Elf], deps: List[str]) -> None:
+    def _find_dependencies_from_strings(self, elf: Elf, elf_files: ExecutableTable, deps: List[str],
+                                        info: ElfInfo | None = None) -> None:
         """Finds additional ELF dependencies based on strings."""
-        to_check = [d for d in elf_files if d.name not in deps and d.name != elf.name]
-        hw_get_mod, dlopen = self._check_for_dynamic_symbols(elf)
-        if dlopen or hw_get_mod:
-            for file in to_check:
-                names = []
-                if (hw_get_mod and f".{self.platform}.so" in file.path) or \
-                    (hw_get_mod and f"{self.brand}" in file.path and file.name.endswith(".so")):
-                    names.append(file.name)
-                if dlopen and file.name.endswith(".so"):
-                    names.append(file.name)
-                for name in names:
-                    if elf.contains_string(elf.work_path, name):
-                        deps.append(name)
-            # self.logger.debug(f"find_dependencies_from_strings {elf.name} {deps}")
-
-    def _find_dependencies_by_symbol(self, elf: Elf, deps: List[str], elf_files: List[Elf]) -> None:
+        local_path = os.path.join(elf.work_path, elf.path.lstrip("/"))
+        if info is None:
+            info = read_elf_info(local_path)
+        hw_get_mod = "hw_get_module" in info.imports
+        dlopen = "dlopen" in info.imports
+        if not (dlopen or hw_get_mod):
+            return
+        mentioned = library_names(local_path)
+        for index, path in enumerate(elf_files.paths):
+            file_name = elf_files.name(index)
+            if file_name in deps or file_name == elf.name or file_name not in mentioned:
+                continue
+            if dlopen or f".{self.platform}.so" in path or f"{self.brand}" in path:
+                deps.append(file_name)
+
+    def _find_dependencies_by_symbol(self, elf: Elf, deps: List[str], elf_files: ExecutableTable,
+                                     info: ElfInfo | None = None) -> None:
         """Finds dependencies by symbol name."""
         try:
-            with open(os.path.join(elf.work_path, elf.path.lstrip("/")), "rb") as f:
-                elffile = ELFFile(f)
-                dynsym = elffile.get_section_by_name(".dynsym")
-                if dynsym:
-                    for symbol in dynsym.iter_symbols():
-                        if "getService" in symbol.name and symbol['st_info']['bind'] == 'STB_GLOBAL':
-                            func_name = symbol.name if type(symbol.name) == str else symbol.name.decode('utf-8')
-                            demangled = cxxfilt.demangle(func_name, external_only=False)
-                            if demangled: # TODO: handle exception for _demangle_symbol
-                                self._find_service_dependencies(demangled, deps, elf_files)
+            if info is None:
+                info = read_elf_info(os.path.join(elf.work_path, elf.path.lstrip("/")))
+            demangled = demangle_all(info.services)
+            for func_name in info.services:
+                if demangled[func_name]:
+                    self._find_service_dependencies(demangled[func_name], deps, elf_files)
         except Exception as e:
             self.logger.error(f"find_dependencies_by_symbol error {elf.name}: {str(e)}")
 
-    def _find_service_dependencies(self, demangled: str, deps: List[str], elf_files: List[Elf]) -> None:
+    def _find_service_dependencies(self, demangled: str, deps: List[str], elf_files: ExecutableTable) -> None:
         """Finds service dependencies and updates the deps list."""
         splitted = demangled.split("::")
         base_name, version = self._extract_service_data(splitted)
@@ -100,37 +153,56 @@ class DependencyFinder(object):
                 return splitted[i - 2], splitted[i - 1][1:].replace("_", ".")
         return None, None
 
-    def _find_matching_elf_files(self, base_name: str, version: str, elf_files: List[Elf]) -> List[Elf]:
+    def _find_matching_elf_files(self, base_name: str, version: str, elf_files: ExecutableTable) -> List[Elf]:
         """Finds matching ELF files."""
         ver_string = version + "-impl.so"
-        candidates = [c for c in elf_files if base_name in c.path and ver_string in c.path]
+        paths = elf_files.paths
+        candidates = [i for i, path in enumerate(paths) if base_name in path and ver_string in path]
         if len(candidates) > 1:
             try:
-                candidates = [c for c in candidates if (c.get_arch()[1]) == 64]  
-                system_path_candidates = [c for c in candidates if c.path.startswith("system")]
+                candidates = [i for i in candidates if (elf_files.arch(i)[1]) == 64]
+                system_path_candidates = [i for i in candidates if paths[i].startswith("system")]
                 if system_path_candidates:
                     candidates = system_path_candidates
                 else:
                     candidates = candidates[:1]
             except (FileNotFoundError, ELFError) as e:
-                self.logger.error(f"Error reading ELF file: {str(e)}")                
-        return candidates   
-
-    def _build_dependency_graph_helper_elf(self, elf: Elf, elf_files: List[Elf]):
+                self.logger.error(f"Error reading ELF file: {str(e)}")
+        return [elf_files[i] for i in candidates]
+
+    def _analyse_elf(self, elf: Elf, elf_files: ExecutableTable) -> Tuple[List[str], ElfInfo | None]:
+        """Returns the dependencies of `elf` and what was read from it, from
+        one parse of the file. 32 bit ELFs are skipped."""
+        info = read_elf_info(os.path.join(elf.work_path, elf.path.lstrip("/")))
+        elf.arch = info.arch
+        if info.arch[1] != 64:
+            return [], None
+        metrics.count("elf.parsed")
+        deps = list(info.needed)
+        self._find_dependencies_from_strings(elf, elf_files, deps, info)
+        self._find_dependencies_by_symbol(elf, deps, elf_files, info)
+        self.logger.debug("build elf %s %s", elf.name, deps)
+        return deps, info
+
+    def _build_dependency_graph_helper_elf(self, elf: Elf, elf_files: ExecutableTable):
         """
         Refactored function to assist in determining the list of 
         dependencies for a given ELF.
         """
-        if elf.get_arch()[1] != 64:
-            return []
-        deps = self._get_needed_libraries(elf)
-        if type(deps) is str:
-            self.logger.error(deps)
+        try:
+            return self._analyse_elf(elf, elf_files)[0]
+        except (OSError, ELFError) as e:
+            self.logger.error(f"{elf.name} analysis error {e}")
             return []
-        self._find_dependencies_from_strings(elf, elf_files, deps)
-        self._find_dependencies_by_symbol(elf, deps, elf_files)
-        self.logger.debug(f"build elf {elf.name} {deps}")
-        return deps
+
+    def _elf_task(self, index: int):
+        """Returns `(index, deps, info, arch, error)`; an exception fails only this ELF."""
+        elf = _shared_elf_files[index]
+        try:
+            deps, info = self._analyse_elf(elf, _shared_elf_files)
+            return index, deps, info, elf.arch, None
+        except Exception as e:
+            return index, [], None, elf.arch, f"{type(e).__name__}: {e}"
 
     ################################################################################
     # JAR files
@@ -209,53 +281,139 @@ class DependencyFinder(object):
             jni_libs = [l for l in elf_files if l.path.endswith(".so")]
             deps.extend(self._find_jni_library_dependencies(output_path, jni_libs, vdex.path))
         return deps
-    
+
+    def _vdex_task(self, vdex: Vdex):
+        return self._build_dependency_graph_helper_vdex(vdex, _shared_elf_files)
+
     ################################################################################
     # main graph builder
     ################################################################################
 
-    def _collect_elf_dependencies(self, elf_files: List[Elf]) -> List[Tuple[str, List[str]]]:
+    def _group_identical(self, elf_files: ExecutableTable, indices: List[int]) -> Dict[int, List[int]]:
+        """Groups the ELFs `indices` by name and content. Returns the first
+        index of every group mapped to the other ones. Only files of equal
+        size are hashed."""
+        by_size = defaultdict(list)
+        for index in indices:
+            try:
+                size = os.stat(elf_files.local_path(index)).st_size
+            except OSError:
+                size = None
+            by_size[(elf_files.name(index), size)].append(index)
+        groups = {}
+        for (_, size), members in by_size.items():
+            if len(members) == 1 or size is None:
+                groups.update((index, []) for index in members)
+                continue
+            by_digest = defaultdict(list)
+            for index in members:
+                try:
+                    with open(elf_files.local_path(index), "rb") as f:
+                        by_digest[hashlib.file_digest(f, "sha1").digest()].append(index)
+                except OSError:
+                    groups[index] = []
+            for same in by_digest.values():
+                groups[same[0]] = same[1:]
+        return groups
+
+    def _collect_elf_dependencies(self, elf_files: ExecutableTable) -> List[Tuple[str, List[str]]]:
         """
         Collect the dependencies for each ELF file in a list of ELF files using parallel processing.
+        The finder and the table are handed to every worker once; tasks only
+        carry an index.
+        Results are journaled as they arrive, ELFs done by an earlier run are
+        not analysed again. Identical copies of a file (e.g. in `system/` and
+        an APEX) are analysed once and share the result; their dependencies
+        are names, resolved per path later on.
 
         Args:
-            elf_files (List[Elf]): A list of Elf objects that represent ELF files.
+            elf_files (ExecutableTable): The table of ELF files.
 
         Returns:
             dep_list (List[Tuple[str, List[str]]]): A list of tuples, where each 
             tuple consists of an ELF file path and a list of its dependencies' file paths.
         """
         logger.info("ELF dep graph")
-        with multiprocessing.Pool(self._thread_count) as pool:
-            tasks = []
-            for elf in elf_files:
-                task = pool.apply_async(self._build_dependency_graph_helper_elf,
-                                        args=(elf, elf_files))
-                tasks.append((elf, task))
-            pool.close()
-            pool.join()
-            
-        results = [(elf.path, task.get()) for elf, task in tasks]
+        journal = self.journal if self.journal is not None else RunJournal()
+        symbols = self._symbol_index()
+        done = journal.results("elf_analysis")
+        todo = [index for index, path in enumerate(elf_files.paths) if path not in done]
+        if done:
+            self.logger.info(f"Resuming ELF analysis: {len(done)} done, {len(todo)} left")
+            metrics.count("journal.resumed_items", len(elf_files) - len(todo))
+        failed = 0
+        metrics.get_metrics().record_pool("elf_analysis", self._thread_count)
+        with metrics.span("elf_analysis"), multiprocessing.Pool(
+                self._thread_count, initializer=_share_run, initargs=(self, elf_files)) as pool:
+            groups = self._group_identical(elf_files, todo)
+            metrics.count("elf.duplicates", len(todo) - len(groups))
+            helper = metrics.instrument(_elf_task, "elf_analysis")
+            for packed in pool.imap_unordered(helper, list(groups)):
+                index, deps, info, arch, error = metrics.collect(packed)
+                for copy in [index] + groups[index]:
+                    path = elf_files.paths[copy]
+                    if arch is not None:
+                        elf_files.set_arch(copy, arch)
+                    if error is None:
+                        if info is not None:
+                            symbols.add(path, info)
+                        journal.record("elf_analysis", path, deps)
+                        done[path] = list(deps)
+                    else:
+                        self.logger.error(f"ELF analysis of {path} failed: {error}")
+                        journal.fail("elf_analysis", path, error)
+                        failed += 1
+        symbols.prune(elf_files.paths)
+        if failed == 0:
+            journal.complete("elf_analysis")
+        journal.commit()
+
+        results = [(path, done.get(path, [])) for path in elf_files.paths]
         return results
-    
-    def _collect_vdex_dependencies(self, vdex_files: List[Vdex], elf_files: List[Elf]):
+
+    def _symbol_index(self) -> SymbolIndex:
+        if self.symbols is None:
+            self.symbols = SymbolIndex()
+        return self.symbols
+
+    def _resolve_symbols(self, resolver: LibraryResolver) -> None:
+        """Binds the imports of every analysed ELF to its providers."""
+        bound, unbound = self._symbol_index().resolve(resolver.resolve)
+        metrics.count("symbols.bound", bound)
+        metrics.count("symbols.unbound", unbound)
+        self.logger.info(f"Resolved symbols: {bound} imports bound, {unbound} unbound")
+
+    def symbol_users(self, lib: str) -> Dict[str, List[str]]:
+        """Returns, for every symbol `lib` exports, the ELFs whose import of
+        it binds to `lib`."""
+        symbols = self._symbol_index()
+        users = {}
+        for symbol in symbols.exports_of(lib):
+            importers = [importer for importer, provider in symbols.importers(symbol) if provider == lib]
+            if importers:
+                users[symbol] = importers
+        return users
+
+    def _collect_vdex_dependencies(self, vdex_files: List[Vdex], elf_files: ExecutableTable):
         logger.info("Vdex dep graph")
-        with multiprocessing.Pool(self._thread_count) as pool:
+        metrics.get_metrics().record_pool("vdex_analysis", self._thread_count)
+        with metrics.span("vdex_analysis"), multiprocessing.Pool(
+                self._thread_count, initializer=_share_run, initargs=(self, elf_files)) as pool:
+            helper = metrics.instrument(_vdex_task, "vdex_analysis")
             tasks = []
             for vdex in vdex_files:
-                task = pool.apply_async(self._build_dependency_graph_helper_vdex,
-                                        args=(vdex, elf_files))
+                task = pool.apply_async(helper, args=(vdex,))
                 tasks.append((vdex, task))
             pool.close()
             pool.join()
             
-        results = [(vdex.path, task.get()) for vdex, task in tasks]
+        results = [(vdex.path, metrics.collect(task.get())) for vdex, task in tasks]
         return results
 
 
     def build_dependency_graph(
         self, 
-        elf_list: List[Elf], 
+        elf_list: List[Elf] | ExecutableTable,
         vdex_list: List[Vdex] | None, 
         apk_list: List[Apk] | None,
         dep_root: str
@@ -265,77 +423,125 @@ class DependencyFinder(object):
         """
         self.logger.info("Building dependency graph")
 
-        dependencies_full = {}
-
+        elf_list = ExecutableTable.of(Elf, elf_list)
         elf_results = self._collect_elf_dependencies(elf_list)
         if vdex_list != None:
-            vdex_results = self._collect_vdex_dependencies(vdex_list)
+            vdex_results = self._collect_vdex_dependencies(vdex_list, elf_list)
             results = elf_results + vdex_results
         else:
             results = elf_results
-        self.logger.info("Accumulating results 1")
-        for elf_path, deps in results:
-            # add `Elf` if it does not exist yet
-            if not elf_path in dependencies_full.keys():
-                dependencies_full[elf_path] = {"to": [], "from": []}
+        with metrics.span("graph_build"):
+            resolver = LibraryResolver(elf_list.paths, self.linker_configs)
+            self._resolve_symbols(resolver)
+            return self._accumulate_dependencies(results, elf_list, dep_root, resolver)
 
+    def _is_64bit(self, elf_list: ExecutableTable, index: int) -> bool:
+        try:
+            return elf_list.arch(index)[1] == 64
+        except (OSError, ELFError) as e:
+            self.logger.error(f"Error reading ELF file {elf_list.paths[index]}: {e}")
+            return False
+
+    def _fallback_provider(self, dep: str, elf_list: ExecutableTable, by_name: Dict[str, List[int]]) -> str | None:
+        """Picks a library named `dep` outside the linker's search paths, e.g.
+        a `dlopen`ed module in `hw/`: 64 bit, `system/` first."""
+        candidates = by_name.get(posixpath.basename(dep), [])
+        if len(candidates) > 1:
+            candidates = [i for i in candidates if self._is_64bit(elf_list, i)]
+        return prefer_system([elf_list.paths[i] for i in candidates])
+
+    def _resolve_edges(self, results, elf_list: ExecutableTable, resolver: LibraryResolver,
+                       needed: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Maps every requester in `results` to the paths of its dependencies.
+        `needed` holds the `DT_NEEDED` names of every requester; only these
+        are bound through the linker namespaces, names found in strings
+        (`dlopen`, `hw_get_module`) are loaded from elsewhere."""
+        by_name = defaultdict(list)
+        for i, path in enumerate(elf_list.paths):
+            by_name[posixpath.basename(path)].append(i)
+        edges = {}
+        resolved = fallbacks = unbound = 0
+        for elf_path, deps in results:
+            providers = edges.setdefault(elf_path, [])
+            linked = set(needed.get(elf_path, ()))
             for dep in deps:
-                # find lib in elf_files
-                candidates = [c for c in elf_list if dep in c.path]
-                if len(candidates) == 0:
+                # the library the linker loads for `elf_path`
+                dep_path = resolver.resolve(elf_path, dep)
+                if dep_path is not None:
+                    resolved += 1
+                elif resolver.configs and dep in linked:
+                    # not in the namespace of `elf_path` nor in one it links to
+                    self.logger.debug(f"{elf_path}: {dep} not visible to the linker, left unbound")
+                    unbound += 1
                     continue
-                elif len(candidates) > 1:
-                    # only 64 bit elfs
-                    candidates = [c for c in candidates if c.get_arch()[1] == 64]
-                    candidates_tmp = [
-                        c for c in candidates if c.path.startswith("system/")
-                    ]
-
-                    if len(candidates_tmp) == 0:
-                        candidates = candidates[:1]
-                    else:
-                        candidates = candidates_tmp
-
-                dep_path = candidates[0].path
-
-                # add dep in both entries
-                dependencies_full[elf_path]["to"].append(dep_path)
-                if dep_path not in dependencies_full.keys():
-                    dependencies_full[dep_path] = {"to": [], "from": []}
-                dependencies_full[dep_path]["from"].append(elf_path)
-
-        self.logger.info(f"Accumulting results 2 {len(dependencies_full)}")
+                else:
+                    dep_path = self._fallback_provider(dep, elf_list, by_name)
+                    if dep_path is None:
+                        continue
+                    fallbacks += 1
+                providers.append(dep_path)
+        metrics.count("linker.resolved", resolved)
+        metrics.count("linker.fallbacks", fallbacks)
+        metrics.count("linker.unbound", unbound)
+        if unbound:
+            self.logger.info(f"{unbound} dependencies not visible in their linker namespace left unbound")
+        return edges
+
+    def _graph_edges(self, results, elf_list: ExecutableTable, resolver: LibraryResolver) -> Dict[str, List[str]]:
+        """Returns the edges of the whole graph and saves them as the graph
+        of this build. An incremental run copies the graph of the previous
+        build and re-resolves only the requesters that changed, or that
+        need a library by the name of one that was added, changed or
+        removed."""
+        fingerprint = getattr(self, "fingerprint", None)
+        needed = self._symbol_index().needed()
+        if self.graph is None or not fingerprint:
+            return self._resolve_edges(results, elf_list, resolver, needed)
+        config = config_digest(self.linker_configs)
+        base = self._base_build
+        if self._stale is None or base is None or self.graph.config(base) != config:
+            edges = self._resolve_edges(results, elf_list, resolver, needed)
+            self.graph.replace(fingerprint, config, edges)
+            return edges
+        stale_names = {posixpath.basename(path) for path in self._stale}
+        affected = [(path, deps) for path, deps in results
+                    if path in self._stale or any(posixpath.basename(d) in stale_names for d in deps)]
+        if base != fingerprint:
+            self.graph.copy(base, fingerprint, config)
+        present = set(elf_list.paths)
+        patch = dict((path, []) for path in self._stale if path in present)
+        patch.update(self._resolve_edges(affected, elf_list, resolver, needed))
+        self.graph.patch(fingerprint, patch, [path for path in self._stale if path not in present])
+        metrics.count("graph.patched_nodes", len(patch))
+        self.logger.info(f"Patched the graph of {base} with {len(patch)} changed requesters")
+        return self.graph.edges(fingerprint)
+
+    def _accumulate_dependencies(self, results, elf_list: ExecutableTable, dep_root: str,
+                                 resolver: LibraryResolver | None = None) -> Dict[str, list[str]]:
+        if resolver is None:
+            resolver = LibraryResolver(elf_list.paths, self.linker_configs)
+        self.logger.info("Accumulating results")
+        edges = self._graph_edges(results, elf_list, resolver)
+        users = defaultdict(list)
+        for requester, providers in sorted(edges.items()):
+            for provider in providers:
+                users[provider].append(requester)
+        self.logger.info(f"Accumulated {len(edges)} requesters")
+
+        # everything depending on `dep_root`, visualization only needs from
         dependencies = {}
-        queue = [dep_root]
-
-        self.logger.info(f"len of queue={len(queue)}")
-        while len(queue) > 0:
-            cur_node = queue.pop(0)
-            if "libc.so" in cur_node:
+        queue = deque([dep_root])
+        while queue:
+            cur_node = queue.popleft()
+            if closure_skips(cur_node):
                 self.logger.debug("found libc...NOPE")
                 continue
-            
-            dependencies[cur_node] = dependencies_full[cur_node]
-            for neighbor in dependencies[cur_node]["from"]:
-                if neighbor not in dependencies.keys():
+            dependencies[cur_node] = users[cur_node]
+            for neighbor in dependencies[cur_node]:
+                if neighbor not in dependencies:
                     queue.append(neighbor)
+        return dependencies
 
-        self.logger.info("Cleanup refs")
-        # cleanup to references
-        for key in dependencies.keys():
-            to_remove = []
-            for dep in dependencies[key]["to"]:
-                if dep not in dependencies.keys():
-                    to_remove.append(dep)
-            for rem in to_remove:
-                dependencies[key]["to"].remove(rem)
-
-        # visualization only needs from
-        deps_for_vis = {}
-        for key in dependencies.keys():
-            deps_for_vis[key] = dependencies[key]["from"]
-        return deps_for_vis
-    
     def create_visualization(self, out_dir: str, dependencies):
         """Create a visualization of the dependency graph."""
 
@@ -380,87 +586,259 @@ class DependencyFinder(object):
             self.adb = Adb(device=self.device_id, logger=logger)
         else:
             self.adb = Adb(logger=logger)
-        self.platform = self.adb.call_privileged_adb_shell(["getprop", "ro.hardware"])
-        self.brand = self.adb.call_privileged_adb_shell(["getprop", "ro.product.brand"])
-        self.fingerprint = self.adb.call_privileged_adb_shell(["getprop", "ro.build.fingerprint"])
+        self.backend = AdbBackend(self.adb, pull_mode=self.pull_mode, device_jobs=self.device_jobs)
+
+    def _init_local_env(self):
+        self.logger.info(f"Local firmware tree {self.local_root} initializing")
+        self.backend = LocalBackend(self.local_root, logger=logger)
+
+    def _init_image_env(self):
+        self.logger.info(f"Partition images {', '.join(self.images)} initializing")
+        self.backend = ImageBackend(self.images, logger=logger)
+
+    def _init_backend(self):
+        if self.images:
+            self._init_image_env()
+        elif self.local_root is not None:
+            self._init_local_env()
+        else:
+            self._init_adb_env()
+        self.platform = self.backend.getprop("ro.hardware")
+        self.brand = self.backend.getprop("ro.product.brand")
+        self.fingerprint = self.backend.getprop("ro.build.fingerprint")
 
     def _end_adb_env(self):
-        if self.adb is not None:
-            self.adb.kill_all_adb_process()
+        if self.backend is not None:
+            self.backend.close()
 
     def _init_work_dir(self):
         self.logger.info("Working directory initializing")
         if self.work_dir is None:
             self.work_dir = tempfile.mkdtemp(prefix="teezz_")
-        if self.adb is None:
+        if self.backend is None:
             return False
         self.elf_work_dir = os.path.join(self.work_dir, "Elf")
         self.vdex_work_dir = os.path.join(self.work_dir, "Vdex")
         self.apk_work_dir = os.path.join(self.work_dir, "Apk")
 
-    def _init_file_list(self, fe: FileExtractor, flag: Executable) -> List[Executable] | None:
-        """Init file list by FileExtractor"""
+    def _init_file_list(self, fe: FileExtractor, flag: Executable, rescan: bool = False) -> StoredFileList | None:
+        """Init file list by FileExtractor, or from the file store of an
+        earlier run. With `rescan` the store is updated with what changed."""
         self.logger.info(f"Executable {flag.get_name()} initializing")
         Path(self.work_dir).mkdir(parents=True, exist_ok=True)
-        target_file_list_path = os.path.join(self.work_dir, f"{flag.get_name()}.json")
-        if os.path.exists(target_file_list_path) and os.path.getsize(target_file_list_path) > 0:
-            return import_executables_from_json(target_file_list_path, flag)
         method_name = f"get_{flag.get_name().lower()}s_list"
-        if hasattr(fe, method_name):
-            file_list = getattr(fe, method_name)()
-            export_executables_to_json(file_list, target_file_list_path)
-            return file_list
-        else:
+        if not hasattr(fe, method_name):
             return None
+        store = FileListStore(os.path.join(self.work_dir, "files.db"))
+        if not (self.rescan or rescan):
+            if store.has(flag):
+                metrics.count("file_list.cache_hits")
+                return store.lazy(flag)
+            legacy_path = os.path.join(self.work_dir, f"{flag.get_name()}.json")
+            if os.path.exists(legacy_path) and os.path.getsize(legacy_path) > 0:
+                metrics.count("file_list.cache_hits")
+                store.replace(flag, import_executables_from_json(legacy_path, flag), fe.work_dir)
+                return store.lazy(flag)
+        file_list = getattr(fe, method_name)()
+        if store.has(flag):
+            added, removed = store.update(flag, file_list, fe.work_dir)
+            self.logger.info(f"Rescanned {flag.get_name()}: {len(added)} added, {len(removed)} removed")
+            if (added or removed) and self.journal is not None:
+                self.journal.reopen(f"pull:{flag.get_name()}")
+                if flag is Elf:
+                    self.journal.reopen("elf_analysis")
+            if flag is Elf and self._stale is not None:
+                self._stale.update(added, removed)
+        else:
+            store.replace(flag, file_list, fe.work_dir)
+        return store.lazy(flag)
+
+    def _refresh_changed(self, fe: FileExtractor, file_list: StoredFileList | None,
+                         upgraded: bool) -> Dict[str, str]:
+        """Compares the content digests of `file_list` with the snapshot of
+        the previous run. Local copies of the files that changed are dropped,
+        so they are pulled again, and changed ELFs are analysed again.
+        Returns the new snapshot, saved once the graph is. After a build
+        change, files without a previous digest count as changed."""
+        if not file_list:
+            return {}
+        store = FileListStore(os.path.join(self.work_dir, "files.db"))
+        previous = store.digests(file_list.cls)
+        paths = [executable.path.lstrip("/") for executable in file_list]
+        digests = dict((path.lstrip("/"), digest) for path, digest in
+                       self.backend.file_digests(["/" + path for path in paths]).items())
+        changed = [path for path, digest in digests.items()
+                   if previous.get(path, None if upgraded else digest) != digest]
+        self.logger.info(f"{len(changed)} of {len(paths)} {file_list.cls.get_name()}s changed")
+        metrics.count("incremental.changed", len(changed))
+        if changed:
+            for path in changed:
+                Path(fe.work_dir, path).unlink(missing_ok=True)
+            self.journal.reopen(f"pull:{file_list.cls.get_name()}")
+            if file_list.cls is Elf:
+                self.journal.forget("elf_analysis", changed)
+                self.journal.reopen("elf_analysis")
+                self._stale.update(changed)
+        return digests
+
+    def _init_linker_configs(self, elf_list: StoredFileList | None):
+        """Reads the linker namespace configuration of the build."""
+        apexes = [apex_name(elf.path) for elf in elf_list or ()]
+        self.linker_configs = load_linker_configs(self.backend, [a for a in apexes if a])
+        if self.linker_configs:
+            self.logger.info(f"Linker namespaces from {len(self.linker_configs)} ld.config file(s)")
+        else:
+            self.logger.info("No linker configuration, using the default search paths")
 
-    def _init_source_file(self, fe: FileExtractor, file_list: List[Executable] | None) -> bool | None:
-        if file_list is None:
+    def _init_source_file(self, fe: FileExtractor, file_list: StoredFileList | None) -> bool:
+        """Pulls the files of `file_list` that are missing, unless a run on
+        the same build did so already. Returns `True` if pulls failed."""
+        if not file_list:
             return False
-        self.logger.info(f"Pull source file {file_list[0].get_instance_name()}s")
-        fe.collect_files(fe._pull_files, file_list)
+        phase = f"pull:{file_list.cls.get_name()}"
+        if self.journal.is_complete(phase):
+            self.logger.info(f"Source files {file_list.cls.get_name()}s already pulled")
+            return False
+        self.logger.info(f"Pull source file {file_list.cls.get_name()}s")
+        fe.prepare_pull(file_list)
+        failures = fe.pull_files(file_list)
+        for path, error in failures:
+            self.journal.fail(phase, path, error)
+        if failures:
+            self.logger.error(f"{len(failures)} {file_list.cls.get_name()} pulls failed, first: {failures[0][1]}")
+            self.journal.commit()
+            return True
+        self.journal.complete(phase)
+        return False
 
     ################################################################################
     # run function
     ################################################################################
         
     def run(self):
-        tracemalloc.start()
-        self._init_adb_env()
-        if self._init_work_dir() is False:
-            self._end_adb_env()
-            return False
+        metrics.get_metrics().reset()
+        if self.profile:
+            profiling.enable(self.profile)
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            return self._run()
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if self.symbols is not None:
+                self.symbols.close()
+                self.symbols = None
+            if self.graph is not None:
+                self.graph.close()
+                self.graph = None
+            self._report_metrics()
+
+    def _run(self):
+        with metrics.span("adb_env"):
+            self._init_backend()
         if self._init_work_dir() is False:
             self._end_adb_env()
             return False
-        elf_file_extractor = FileExtractor(self.elf_work_dir, self.adb)
-        vdex_file_extractor = FileExtractor(self.vdex_work_dir, self.adb)
-        apk_file_extractor = FileExtractor(self.apk_work_dir, self.adb)
-
-        elf_list = self._init_file_list(elf_file_extractor, Elf)
-        vdex_list = self._init_file_list(vdex_file_extractor, Vdex)
-        apk_list = self._init_file_list(apk_file_extractor, Apk)
-
-        if self._init_source_file(elf_file_extractor, elf_list) or \
-            self._init_source_file(vdex_file_extractor, vdex_list) or \
-            self._init_source_file(apk_file_extractor, apk_list):
+        Path(self.work_dir).mkdir(parents=True, exist_ok=True)
+        self.journal = RunJournal(os.path.join(self.work_dir, "journal.db"))
+        self.symbols = SymbolIndex(os.path.join(self.work_dir, "symbols.db"))
+        self.graph = GraphStore(os.path.join(self.work_dir, "graph.db"))
+        previous = self.journal.run_key()
+        # an incremental run keeps the analysis of the previous build and redoes what changed
+        keep = ("elf_analysis",) if self.incremental else ()
+        if self.journal.open_run(self.fingerprint, keep=keep):
+            self.logger.info("Resuming the run journaled in the working directory")
+        elif not self.incremental:
+            self.symbols.clear()
+        self.journal.add_commit_hook(self.symbols.commit)
+        upgraded = self.incremental and previous not in (None, self.fingerprint)
+        if self.incremental:
+            self._base_build = previous or self.fingerprint
+            self._stale = set()
+            if upgraded:
+                self.logger.info(f"Build changed from {previous} to {self.fingerprint}")
+        elf_file_extractor = FileExtractor(self.elf_work_dir, self.backend)
+        vdex_file_extractor = FileExtractor(self.vdex_work_dir, self.backend)
+        apk_file_extractor = FileExtractor(self.apk_work_dir, self.backend)
+
+        with metrics.span("file_list"):
+            elf_list = self._init_file_list(elf_file_extractor, Elf, self.incremental)
+            self._init_linker_configs(elf_list)
+            vdex_list = self._init_file_list(vdex_file_extractor, Vdex, self.incremental)
+            apk_list = self._init_file_list(apk_file_extractor, Apk, self.incremental)
+
+        snapshots = {}
+        if self.incremental:
+            with metrics.span("snapshot"):
+                for fe, file_list in ((elf_file_extractor, elf_list), (vdex_file_extractor, vdex_list)):
+                    if file_list:
+                        snapshots[file_list.cls] = self._refresh_changed(fe, file_list, upgraded)
+
+        with metrics.span("pull"):
+            pull_failed = [self._init_source_file(elf_file_extractor, elf_list),
+                           self._init_source_file(vdex_file_extractor, vdex_list),
+                           self._init_source_file(apk_file_extractor, apk_list)]
+        if any(pull_failed):
             self._end_adb_env()
-            self.logger.error("Pull source file error")
+            self.logger.error("Pull source file error, failed files are retried on the next run")
 
         if elf_list is not None:
+            elf_table = elf_list.load()
             dependencies = self.build_dependency_graph(
-                elf_list=elf_list,
+                elf_list=elf_table,
                 vdex_list=None, # Not completed
                 apk_list=None,
                 dep_root=self.target_lib
             )
-            self.create_visualization(self.work_dir, dependencies)
-
-
-
-        
-
-
-            
-            
-    
-        
\ No newline at end of file
+            with open(os.path.join(self.work_dir, "target_symbols.json"), "w") as f:
+                json.dump(self.symbol_users(self.target_lib), f, indent=4)
+            with metrics.span("visualization"):
+                self.create_visualization(self.work_dir, dependencies)
+        store = FileListStore(os.path.join(self.work_dir, "files.db"))
+        if elf_list is not None:
+            # read by the analysis workers, so later runs do not parse the headers again
+            store.set_archs(Elf, elf_table.archs())
+        for cls, digests in snapshots.items():
+            store.set_digests(cls, digests)
+
+    def watch(self, interval: float):
+        """Polls the build fingerprint every `interval` seconds and runs
+        incrementally whenever it changed, until interrupted."""
+        self.incremental = True
+        analysed = None
+        while True:
+            try:
+                self._init_backend()
+                fingerprint = self.fingerprint
+            except Exception as e:
+                self.logger.warning(f"Reading the build fingerprint failed: {e}")
+                fingerprint = None
+            finally:
+                self._end_adb_env()
+            # adb answers with its error message while no device is attached
+            if not fingerprint or " " in fingerprint:
+                self.logger.info("No device, waiting")
+            elif fingerprint != analysed:
+                self.logger.info(f"Analysing build {fingerprint}")
+                self.run()
+                analysed = fingerprint
+            time.sleep(interval)
+
+    def _report_metrics(self):
+        """Logs the metrics summary and writes `metrics.json` and the Chrome
+        trace `trace.json` to the working directory."""
+        run_metrics = metrics.get_metrics()
+        if self.trace_memory and tracemalloc.is_tracing():
+            run_metrics.count("memory.peak_bytes", tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        self.logger.info("Run metrics:\n%s", run_metrics.format_table())
+        if self.work_dir is not None and os.path.isdir(self.work_dir):
+            run_metrics.write_json(os.path.join(self.work_dir, "metrics.json"))
+            run_metrics.write_trace(os.path.join(self.work_dir, "trace.json"))
+        if profiling.get_options() is not None:
+            if self.work_dir is not None:
+                profile_dir = os.path.join(self.work_dir, "profile")
+                self.logger.info("Profile (%s):\n%s", profile_dir, profiling.write_reports(profile_dir))
+            profiling.disable()
@@ -1,13 +1,19 @@
 import os
+import heapq
+import itertools
+import posixpath
 import multiprocessing
 from pathlib import Path
 from enum import Enum
 import logging
-from functools import reduce
-from typing import List
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Tuple
 
 from utils.adb import Adb
 from utils.log import get_logger
+from utils import metrics
+from utils.concurrency import run_adaptive
+from .backend import StorageBackend, AdbBackend
 from .command import *
 from .file_type import *
 
@@ -31,29 +37,122 @@ FILTERS = [
     "/data/dalvik-cache",
 ]
 
+# files handed to `StorageBackend.prepare_pull`
+PULL_SAMPLE_FILES = 16
+# scan tasks per worker a large tree is split into
+SCAN_GRANULARITY = 4
+# every task costs a few device round trips; smaller subtrees are not split
+SCAN_MIN_TASK_FILES = 500
+
 class FileType(Enum):
     FILE = 1
     DIRECTORY = 0
 
 
+class ScanTask(NamedTuple):
+    path: str
+    recursive: bool
+    files: int
+
+
+def plan_scan_tasks(roots: List[str], counts: Dict[str, int], workers: int,
+                    granularity: int = SCAN_GRANULARITY,
+                    min_files: int = SCAN_MIN_TASK_FILES) -> List[ScanTask]:
+    """Splits the scan of `roots` into tasks of similar size, largest first.
+
+    `counts` holds the number of files directly in each directory, see
+    `StorageBackend.count_files`. A subtree holding more than
+    1/(workers * granularity) of all files, and more than `min_files`, is
+    replaced by a task for the files directly in it and one task per
+    subdirectory. Without counts every root is one task.
+    """
+    totals = Counter()
+    children: Dict[str, set] = {}
+    for directory, n in counts.items():
+        root = next((r for r in roots if directory == r or directory.startswith(r.rstrip("/") + "/")), None)
+        if root is None:
+            continue
+        current = directory
+        while True:
+            totals[current] += n
+            if current == root:
+                break
+            parent = posixpath.dirname(current)
+            children.setdefault(parent, set()).add(current)
+            current = parent
+    limit = max(min_files, sum(totals[r] for r in roots) // (workers * granularity))
+    heap = [(-totals[r], r) for r in roots]
+    heapq.heapify(heap)
+    tasks = []
+    while heap:
+        size, directory = heapq.heappop(heap)
+        if -size <= limit or directory not in children:
+            tasks.append(ScanTask(directory, True, -size))
+            continue
+        if counts.get(directory):
+            tasks.append(ScanTask(directory, False, counts[directory]))
+        for child in children[directory]:
+            heapq.heappush(heap, (-totals[child], child))
+    tasks.sort(key=lambda t: t.files, reverse=True)
+    return tasks
+
+
 class FileExtractor(object):
 
     _thread_count = multiprocessing.cpu_count()
 
-    def __init__(self, work_dir, adb: Adb):
+    def __init__(self, work_dir, backend: StorageBackend | Adb):
         self.work_dir = work_dir
-        self._adb = adb
+        if isinstance(backend, Adb):
+            backend = AdbBackend(backend)
+        self._backend = backend
         self.logger = logger if logger != None else logging.getLogger(__name__)
 
-    def collect_files(self, func, files_list: List[Executable]):
+    def collect_files(self, func, files_list: List[Executable], phase="pull") -> list:
+        """Runs `func` on every file and returns the results. On a device
+        the number of concurrent operations is adapted by the backend's
+        controller, otherwise a process per CPU runs them."""
+        controller = self._backend.controller
+        if controller is not None:
+            return list(run_adaptive(func, files_list, controller, phase,
+                                     failed=lambda result: result is not None, size=self._local_size))
         if MP:
+            metrics.get_metrics().record_pool(phase, FileExtractor._thread_count)
             with multiprocessing.Pool(FileExtractor._thread_count) as p:
-                p.map(func, files_list)
+                return [metrics.collect(packed) for packed in p.map(metrics.instrument(func, phase), files_list)]
         else:
-            for f in files_list:
-                func(f)
+            return [func(f) for f in files_list]
+
+    def _local_path(self, file: Executable) -> Path:
+        return Path(self.work_dir) / file.path.lstrip("/")
 
-    def _pull_files(self, file: Executable):
+    def _local_size(self, file: Executable) -> int:
+        try:
+            return self._local_path(file).stat().st_size
+        except OSError:
+            return 0
+
+    def pull_files(self, files_list: Iterable[Executable]) -> List[Tuple[str, str]]:
+        """Pulls the files of `files_list` that are not there yet. Returns
+        `(path, error)` of the pulls that failed."""
+        missing = []
+        for file in files_list:
+            if self._local_path(file).exists():
+                metrics.count("pull.cache_hits")
+            else:
+                missing.append(file)
+        return [r for r in self.collect_files(self._pull_files, missing) if r is not None]
+
+    def prepare_pull(self, files_list: Iterable[Executable]):
+        """Lets the backend calibrate on a few of the files still to pull."""
+        missing = (f for f in files_list if not self._local_path(f).exists())
+        self._backend.prepare_pull(["/" + f.path.lstrip("/")
+                                    for f in itertools.islice(missing, PULL_SAMPLE_FILES)])
+
+    def _pull_files(self, file: Executable) -> Tuple[str, str] | None:
+        """Pulls `file` unless it is there already. The copy is written
+        next to its final path and renamed when complete, so an existing
+        file is always whole. Returns `(path, error)` if the pull failed."""
         work_dir_path = Path(self.work_dir)
         work_dir_path.mkdir(parents=True, exist_ok=True)
 
@@ -63,81 +162,83 @@ class FileExtractor(object):
             file_path = work_dir_path / file.path
 
         if not file_path.exists():
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            self._adb.adb_pull_privileged(str(file.path), str(file_path)) 
+            part_path = file_path.with_name(file_path.name + ".part")
+            try:
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                out = self._backend.pull("/" + file.path.lstrip("/"), str(part_path))
+                if not part_path.exists():
+                    return file.path, out.strip() or "pull failed"
+                os.replace(part_path, file_path)
+            except Exception as e:
+                return file.path, f"{type(e).__name__}: {e}"
+            metrics.count("pull.files")
+            metrics.count("pull.bytes", file_path.stat().st_size)
+        else:
+            metrics.count("pull.cache_hits")
+        return None
 
     def get_type(self, path) -> FileType:
-        out = self._adb.call_privileged_adb_shell([f'stat {path}']).split("\n")
-        if len(out) > 2:
-            if "directory" in out[1]:
-                return FileType.DIRECTORY
-            else:
-                return FileType.FILE
-        assert False, f'Error: `stat` returned {out}'
+        if self._backend.is_directory(path):
+            return FileType.DIRECTORY
+        return FileType.FILE
 
     def get_apks_list(self) -> List[Apk]:
-        result: List[Apk] = []
         # 1. Get all apks installed
-        get_names_cmd = "pm list packages | tr -d '\r' | sed 's/package://g'"
-        package_names = self._adb.call_privileged_adb_shell([get_names_cmd])
-        package_name_list = package_names.splitlines()
-        for name in package_name_list:
-            get_path_cmd = "pm path {} | tr -d '\r' | sed 's/package://g'".format(name.strip())
-            path = self._adb.call_adb_shell([get_path_cmd]).strip()
-            result.append(Apk.parse_package_name(name, path, self.work_dir))
+        return [Apk.parse_package_name(name, path, self.work_dir)
+                for name, path in self._backend.list_packages()]
 
-        return result
-
-    def get_vdexs_list(self) -> List[Vdex]:
-        directories = self._adb.adb_ls_privileged("/")
+    def _scan_directories(self, scan) -> List[Executable]:
+        """Runs `scan` over the scan tasks planned for all top-level
+        directories. Workers take the next task when they are done, so a
+        large subtree does not keep the others waiting."""
+        directories = self._backend.list_root()
         allowed_list = [i for i in directories if i not in set(SKIP_DIR)]
         allowed_list = [i for i in allowed_list if self.get_type(i) == FileType.DIRECTORY]
-        start_value: list[Elf] = []
-        new_vdexs = []
-        if MP:
+        controller = self._backend.controller
+        workers = controller.maximum if controller is not None else FileExtractor._thread_count
+        tasks = plan_scan_tasks(allowed_list, self._backend.count_files(allowed_list), workers)
+        self.logger.debug("Scan plan: %d tasks for %d directories", len(tasks), len(allowed_list))
+        metrics.count("file_list.tasks", len(tasks))
+        result = []
+        if controller is not None:
+            for found in run_adaptive(scan, tasks, controller, "file_list"):
+                result.extend(found)
+        elif MP:
+            metrics.get_metrics().record_pool("file_list", FileExtractor._thread_count)
             with multiprocessing.Pool(FileExtractor._thread_count) as p:
-                new_vdexs = list(p.map(
-                    self._get_vdex_from_directory, allowed_list))
+                for packed in p.imap_unordered(metrics.instrument(scan, "file_list"), tasks):
+                    result.extend(metrics.collect(packed))
         else:
-            for d in allowed_list:
-                __vdexs = self._get_vdex_from_directory(d)
-                new_vdexs.extend(__vdexs)
-        return reduce(lambda a, b: a + b, new_vdexs, start_value)
+            for task in tasks:
+                result.extend(scan(task))
+        result.sort(key=lambda e: e.path)
+        return result
 
+    def get_vdexs_list(self) -> List[Vdex]:
+        return self._scan_directories(self._scan_vdexs)
+
+    def _scan_vdexs(self, task: ScanTask) -> List[Vdex]:
+        return self._get_vdex_from_directory(task.path, task.recursive)
 
-    def _get_vdex_from_directory(self, path) -> List[Vdex]:
+    def _get_vdex_from_directory(self, path, recursive=True) -> List[Vdex]:
         def check_filter(vdex: Vdex):
             for fp in FILTERS:
                 if fp in vdex.path:
                     return False
             return True
-        cmd = f'find {path} -type f -iname "*.?dex"'
-        out = self._adb.call_privileged_adb_shell([cmd])
-        temp_list = list(map(lambda l: Vdex.parse_from_string(l, self.work_dir), out.splitlines()))
-        return list(filter(check_filter, temp_list))
+        # parsed while the backend is still listing
+        vdexs = (Vdex.parse_from_string(l, self.work_dir) for l in self._backend.find_vdexs(path, recursive))
+        return [vdex for vdex in vdexs if check_filter(vdex)]
 
     def get_elfs_list(self) -> List[Elf]:
-        directories = self._adb.adb_ls_privileged("/")
-        allowed_list = [i for i in directories if i not in set(SKIP_DIR)]
-        allowed_list = [i for i in allowed_list if self.get_type(i) == FileType.DIRECTORY]
-        start_value: list[Elf] = []
-        new_elfs = []
-        if MP:
-            with multiprocessing.Pool(FileExtractor._thread_count) as p:
-                new_elfs = list(p.map(
-                    self._get_elf_from_directory, allowed_list))
-        else:
-            for d in allowed_list:
-                __elfs = self._get_elf_from_directory(d)
-                new_elfs.extend(__elfs)
-        return reduce(lambda a, b: a + b, new_elfs, start_value)
-
-    def _get_elf_from_directory(self, path) -> List[Elf]:
-        cmd = f"for node in `find {path} -type f`; do echo -n \"$node: \"; dd if=$node bs=1 count=4 2>/dev/null | grep -q 'ELF'; echo $?; done"
-        files = self._adb.call_privileged_adb_shell([cmd])
-        elf_paths = [f.split(": ")[0] for f in files.splitlines() if ": " in f and f.split(": ")[1] == "0"]
-        elf_paths = [elf_path for elf_path in elf_paths if ".magisk" not in elf_path]
-        return list(map(lambda l: Elf.parse_elf(l, self.work_dir), elf_paths))
+        return self._scan_directories(self._scan_elfs)
+
+    def _scan_elfs(self, task: ScanTask) -> List[Elf]:
+        return self._get_elf_from_directory(task.path, task.recursive)
+
+    def _get_elf_from_directory(self, path, recursive=True) -> List[Elf]:
+        return [Elf.parse_elf(elf_path, self.work_dir)
+                for elf_path in self._backend.find_elfs(path, recursive) if ".magisk" not in elf_path]
 
     @staticmethod
     def convert_vdex_to_dex(vdex: Vdex, output_dir: str):
@@ -0,0 +1,188 @@
+import sys
+import sqlite3
+import posixpath
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .file_type import Executable, ExecutableTable, Elf
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lists (
+    kind TEXT PRIMARY KEY,
+    work_path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS files (
+    kind TEXT NOT NULL,
+    dir_id INTEGER NOT NULL,
+    base TEXT NOT NULL,
+    name TEXT,
+    arch TEXT,
+    PRIMARY KEY (kind, dir_id, base)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS digests (
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (kind, path)
+) WITHOUT ROWID;
+"""
+
+
+class FileListStore(object):
+    """Discovery results of all executable types in one SQLite file.
+
+    Directory prefixes are stored once and referenced by id, `work_path`
+    once per type. Lists are read lazily, one type at a time, and a rescan
+    can be applied as a diff with `update()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def has(self, cls) -> bool:
+        with closing(self._connect()) as db:
+            return db.execute("SELECT 1 FROM lists WHERE kind = ?", (cls.get_name(),)).fetchone() is not None
+
+    def count(self, cls) -> int:
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM files WHERE kind = ?", (cls.get_name(),)).fetchone()[0]
+
+    def _rows(self, db, cls):
+        row = db.execute("SELECT work_path FROM lists WHERE kind = ?", (cls.get_name(),)).fetchone()
+        if row is None:
+            return
+        work_path = row[0]
+        dirs = {}
+        cursor = db.execute(
+            "SELECT dir_id, dirs.path, base, name, arch FROM files JOIN dirs ON dirs.id = files.dir_id "
+            "WHERE kind = ? ORDER BY dir_id, base", (cls.get_name(),))
+        for dir_id, directory, base, name, arch in cursor:
+            # one string per directory, shared by its files
+            directory = dirs.setdefault(dir_id, sys.intern(directory))
+            path = posixpath.join(directory, base) if directory else base
+            if arch:
+                machine, _, elf_class = arch.partition(":")
+                arch = (machine, int(elf_class))
+            yield path, work_path, name or base, arch
+
+    def iter(self, cls) -> Iterator[Executable]:
+        """Yields the stored executables of type `cls` one by one."""
+        with closing(self._connect()) as db:
+            for path, work_path, name, arch in self._rows(db, cls):
+                if arch is not None:
+                    yield cls(name, path, work_path, arch=arch)
+                else:
+                    yield cls(name, path, work_path)
+
+    def load(self, cls) -> ExecutableTable:
+        """Reads the stored executables of type `cls` into a table, without
+        creating an object per file."""
+        table = ExecutableTable(cls)
+        with closing(self._connect()) as db:
+            for path, work_path, name, arch in self._rows(db, cls):
+                table.add(path, work_path, name, arch)
+        return table
+
+    def lazy(self, cls) -> "StoredFileList":
+        return StoredFileList(self, cls)
+
+    @staticmethod
+    def _row(executable: Executable) -> Tuple[str, str, str | None, str | None]:
+        directory, base = posixpath.split(executable.path)
+        name = executable.name if executable.name != base else None
+        arch = getattr(executable, "arch", None)
+        return directory, base, name, f"{arch[0]}:{arch[1]}" if arch else None
+
+    def _dir_ids(self, db, directories: Iterable[str]) -> dict:
+        db.executemany("INSERT OR IGNORE INTO dirs (path) VALUES (?)", ((d,) for d in set(directories)))
+        return dict((path, dir_id) for dir_id, path in db.execute("SELECT id, path FROM dirs"))
+
+    def _insert(self, db, kind: str, rows: List[tuple]):
+        ids = self._dir_ids(db, (r[0] for r in rows))
+        db.executemany("INSERT OR REPLACE INTO files (kind, dir_id, base, name, arch) VALUES (?, ?, ?, ?, ?)",
+                       ((kind, ids[d], base, name, arch) for d, base, name, arch in rows))
+
+    def replace(self, cls, executables: Iterable[Executable], work_path: str):
+        """Stores `executables` as the complete list of type `cls`."""
+        kind = cls.get_name()
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM files WHERE kind = ?", (kind,))
+            db.execute("INSERT OR REPLACE INTO lists (kind, work_path) VALUES (?, ?)", (kind, work_path))
+            self._insert(db, kind, [self._row(e) for e in executables])
+
+    def set_archs(self, cls, archs: Dict[str, Tuple]):
+        """Stores the architectures of already listed executables of type `cls`."""
+        kind = cls.get_name()
+        with closing(self._connect()) as db, db:
+            ids = dict((path, dir_id) for dir_id, path in db.execute("SELECT id, path FROM dirs"))
+            rows = []
+            for path, arch in archs.items():
+                directory, base = posixpath.split(path)
+                if directory in ids:
+                    rows.append((f"{arch[0]}:{arch[1]}", kind, ids[directory], base))
+            db.executemany("UPDATE files SET arch = ? WHERE kind = ? AND dir_id = ? AND base = ?", rows)
+
+    def update(self, cls, executables: Iterable[Executable], work_path: str) -> Tuple[List[str], List[str]]:
+        """Brings the stored list of type `cls` in line with a rescan,
+        touching only what changed. Returns the added and removed paths."""
+        kind = cls.get_name()
+        new_rows = {}
+        for e in executables:
+            row = self._row(e)
+            new_rows[(row[0], row[1])] = row
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO lists (kind, work_path) VALUES (?, ?)", (kind, work_path))
+            old = dict(((d, base), (dir_id, name)) for dir_id, d, base, name in db.execute(
+                "SELECT f.dir_id, d.path, f.base, f.name FROM files f JOIN dirs d ON d.id = f.dir_id "
+                "WHERE f.kind = ?", (kind,)))
+            removed = [k for k in old if k not in new_rows]
+            added = [k for k in new_rows if k not in old or old[k][1] != new_rows[k][2]]
+            db.executemany("DELETE FROM files WHERE kind = ? AND dir_id = ? AND base = ?",
+                           ((kind, old[k][0], k[1]) for k in removed))
+            self._insert(db, kind, [new_rows[k] for k in added])
+        return ([posixpath.join(*k) for k in added], [posixpath.join(*k) for k in removed])
+
+    def digests(self, cls) -> Dict[str, str]:
+        """Returns the content digests stored by `set_digests()`."""
+        with closing(self._connect()) as db:
+            return dict(db.execute("SELECT path, digest FROM digests WHERE kind = ?", (cls.get_name(),)))
+
+    def set_digests(self, cls, digests: Dict[str, str]):
+        """Stores `digests` (path -> digest) as the snapshot of type `cls`."""
+        kind = cls.get_name()
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM digests WHERE kind = ?", (kind,))
+            db.executemany("INSERT INTO digests (kind, path, digest) VALUES (?, ?, ?)",
+                           ((kind, path, digest) for path, digest in digests.items()))
+
+
+class StoredFileList(object):
+    """Lazy, re-iterable view of one type in a `FileListStore`."""
+
+    def __init__(self, store: FileListStore, cls):
+        self.store = store
+        self.cls = cls
+
+    def __iter__(self) -> Iterator[Executable]:
+        return self.store.iter(self.cls)
+
+    def __len__(self) -> int:
+        return self.store.count(self.cls)
+
+    def load(self) -> ExecutableTable:
+        return self.store.load(self.cls)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
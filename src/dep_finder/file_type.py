@@ -1,20 +1,27 @@
 import subprocess
 import os
+import sys
+from array import array
+from collections.abc import Sequence
 from dataclasses import dataclass, asdict, field
 import json
-from typing import List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from elftools.elf.elffile import ELFFile
 from elftools.elf.sections import SymbolTableSection
 from elftools.elf.dynamic import DynamicSection
 
 
-@dataclass
+@dataclass(slots=True)
 class Executable:
     name: str
     path: str
     work_path: str
-    
+
+    def __post_init__(self):
+        # one work path per file type, shared by all instances
+        self.work_path = sys.intern(self.work_path)
+
     def contains_string(self, path, s):
         """Returns `True` if file `path` contains string `s`,
         `False` otherwise."""
@@ -35,14 +42,10 @@ class Executable:
         return self.__class__.__name__
 
 
-@dataclass
+@dataclass(slots=True)
 class Elf(Executable):
 
-    arch: Optional[Tuple] = field(default_factory=None, repr=False, init=False)
-
-    def __init__(self, name: str, path: str, work_path: str, arch: Optional[Tuple] = None):
-        super().__init__(name, path, work_path) 
-        self.arch = arch
+    arch: Optional[Tuple] = field(default=None, repr=False)
 
     @staticmethod
     def parse_elf(path: str, work_path: str):
@@ -88,7 +91,7 @@ class Elf(Executable):
         return self.arch
 
 
-@dataclass
+@dataclass(slots=True)
 class Vdex(Executable):
     @staticmethod
     def parse_from_string(path: str, work_path: str):
@@ -97,14 +100,91 @@ class Vdex(Executable):
         return Vdex(name, path, work_path)
 
 
-@dataclass
+@dataclass(slots=True)
 class Apk(Executable):
     @staticmethod
     def parse_package_name(package_name:str, path: str, work_path:str):
         name = package_name
         path = path if path[0] != "/" else path[1:]
         return Apk(name, path, work_path)
-    
+
+
+class ExecutableTable(Sequence):
+    """Array-backed, read-only list of executables of one type.
+
+    Holds one path string per file; work paths are kept in a small table
+    and referenced by index, names and architectures only where they are
+    not derived from the path. `Executable` objects are created when an
+    item is accessed, so scans over many files should use `paths`.
+    """
+
+    def __init__(self, cls, executables: Iterable[Executable] = ()):
+        self.cls = cls
+        self.paths: List[str] = []
+        self._work_paths: List[str] = []
+        self._work_ids = array("H")
+        self._names: Dict[int, str] = {}
+        self._archs: Dict[int, Tuple] = {}
+        for executable in executables:
+            self.append(executable)
+
+    @staticmethod
+    def of(cls, executables: Iterable[Executable]) -> "ExecutableTable":
+        if isinstance(executables, ExecutableTable):
+            return executables
+        return ExecutableTable(cls, executables)
+
+    def add(self, path: str, work_path: str, name: str | None = None, arch: Tuple | None = None):
+        index = len(self.paths)
+        self.paths.append(path)
+        if work_path not in self._work_paths:
+            self._work_paths.append(sys.intern(work_path))
+        self._work_ids.append(self._work_paths.index(work_path))
+        if name is not None and name != path.rpartition("/")[2]:
+            self._names[index] = name
+        if arch is not None:
+            self._archs[index] = arch
+
+    def append(self, executable: Executable):
+        self.add(executable.path, executable.work_path, executable.name, getattr(executable, "arch", None))
+
+    def name(self, index: int) -> str:
+        return self._names.get(index) or self.paths[index].rpartition("/")[2]
+
+    def local_path(self, index: int) -> str:
+        """Where the file of item `index` lives in the working directory."""
+        return os.path.join(self._work_paths[self._work_ids[index]], self.paths[index].lstrip("/"))
+
+    def arch(self, index: int) -> Tuple:
+        """`Elf.get_arch()` of item `index`, cached in the table."""
+        arch = self._archs.get(index)
+        if arch is None:
+            arch = self._archs[index] = self[index].get_arch()
+        return arch
+
+    def set_arch(self, index: int, arch: Tuple):
+        self._archs[index] = arch
+
+    def archs(self) -> Dict[str, Tuple]:
+        """The architectures known so far, by path."""
+        return dict((self.paths[index], arch) for index, arch in self._archs.items())
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        path = self.paths[index]
+        work_path = self._work_paths[self._work_ids[index]]
+        arch = self._archs.get(index)
+        if arch is not None:
+            return self.cls(self.name(index), path, work_path, arch=arch)
+        return self.cls(self.name(index), path, work_path)
+
+
 def export_executables_to_json(executable_list: List[Executable], filepath) -> None:
     with open(filepath, 'w') as f:
         json.dump([asdict(executable) for executable in executable_list], f, ensure_ascii=False, indent=4)
@@ -0,0 +1,105 @@
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .graph_store import GraphStore, closure_skips
+
+
+@dataclass(slots=True)
+class GraphDiff:
+    """Differences of the dependency graph of build `new` to that of
+    build `old`. Edges are `(requester, provider)`; the closure lists are
+    the ELFs that start or stop depending on `target`."""
+    old: str
+    new: str
+    target: str | None = None
+    added_nodes: List[str] = field(default_factory=list)
+    removed_nodes: List[str] = field(default_factory=list)
+    added_edges: List[Tuple[str, str]] = field(default_factory=list)
+    removed_edges: List[Tuple[str, str]] = field(default_factory=list)
+    closure_added: List[str] = field(default_factory=list)
+    closure_removed: List[str] = field(default_factory=list)
+    # unchanged edges of the ELFs that moved in or out of the closure, context for the DOT output
+    closure_edges: List[Tuple[str, str]] = field(default_factory=list, repr=False)
+
+    def to_json(self) -> dict:
+        data = asdict(self)
+        del data["closure_edges"]
+        return data
+
+    def to_dot(self) -> str:
+        """Annotated DOT of the changed edges and the target closures:
+        green is added, red dashed removed, grey unchanged."""
+        out = "digraph DependencyDiff {\n"
+        if self.target is not None:
+            out += '  "{}" [shape=box, style=bold];\n'.format(self.target)
+        for node in self.added_nodes:
+            out += '  "{}" [color=green, fontcolor=green];\n'.format(node)
+        for node in self.removed_nodes:
+            out += '  "{}" [color=red, fontcolor=red, style=dashed];\n'.format(node)
+        for node in self.closure_added:
+            out += '  "{}" [style=filled, fillcolor=palegreen];\n'.format(node)
+        for node in self.closure_removed:
+            out += '  "{}" [style=filled, fillcolor=lightpink];\n'.format(node)
+        for requester, provider in self.closure_edges:
+            out += '  "{}" -> "{}" [color=grey];\n'.format(requester, provider)
+        for requester, provider in self.added_edges:
+            out += '  "{}" -> "{}" [color=green];\n'.format(requester, provider)
+        for requester, provider in self.removed_edges:
+            out += '  "{}" -> "{}" [color=red, style=dashed];\n'.format(requester, provider)
+        out += "}\n"
+        return out
+
+
+def reverse_closure(edges: Iterable[Tuple[int, int]], root, skip: Set = frozenset()) -> Set:
+    """Returns `root` and every node depending on it through `edges`;
+    nodes in `skip` are neither part of it nor walked through."""
+    if root in skip:
+        return set()
+    users = defaultdict(list)
+    for requester, provider in edges:
+        users[provider].append(requester)
+    closure = {root}
+    queue = deque([root])
+    while queue:
+        new = set(users.get(queue.popleft(), ())) - closure - skip
+        closure |= new
+        queue.extend(new)
+    return closure
+
+
+def diff_builds(store: GraphStore, old: str, new: str, target: str | None = None) -> GraphDiff:
+    """Diffs the graphs of builds `old` and `new` in `store`. Works on the
+    interned node ids and only maps what differs back to paths. The
+    closures follow the rules of a run, see `closure_skips()`."""
+    for fingerprint in (old, new):
+        if not store.has(fingerprint):
+            raise KeyError(f"No graph of build {fingerprint}")
+    old_edges, new_edges = store.edge_ids(old), store.edge_ids(new)
+    old_nodes, new_nodes = store.node_ids(old), store.node_ids(new)
+    paths = store.paths()
+
+    def sorted_paths(ids):
+        return sorted(paths[i] for i in ids)
+
+    def sorted_edges(edges):
+        return sorted((paths[r], paths[p]) for r, p in edges)
+
+    result = GraphDiff(old, new, target,
+                       added_nodes=sorted_paths(new_nodes - old_nodes),
+                       removed_nodes=sorted_paths(old_nodes - new_nodes),
+                       added_edges=sorted_edges(new_edges - old_edges),
+                       removed_edges=sorted_edges(old_edges - new_edges))
+    target_id = store.node_id(target) if target is not None else None
+    if target_id is not None:
+        skip = set(i for i in old_nodes | new_nodes if closure_skips(paths[i]))
+        old_closure = reverse_closure(old_edges, target_id, skip)
+        new_closure = reverse_closure(new_edges, target_id, skip)
+        result.closure_added = sorted_paths(new_closure - old_closure)
+        result.closure_removed = sorted_paths(old_closure - new_closure)
+        # how the nodes that moved reach the target, or reached it before
+        moved = old_closure ^ new_closure
+        closure = old_closure | new_closure
+        result.closure_edges = sorted_edges(
+            (r, p) for r, p in old_edges & new_edges if r in moved and p in closure)
+    return result
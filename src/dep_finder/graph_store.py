@@ -0,0 +1,167 @@
+import time
+import sqlite3
+from urllib.parse import quote
+from typing import Dict, Iterable, List, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    config TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS edges (
+    build_id INTEGER NOT NULL,
+    requester INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    provider INTEGER NOT NULL,
+    PRIMARY KEY (build_id, requester, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS build_nodes (
+    build_id INTEGER NOT NULL,
+    node INTEGER NOT NULL,
+    PRIMARY KEY (build_id, node)
+) WITHOUT ROWID;
+"""
+
+
+def closure_skips(path: str) -> bool:
+    """Nodes the closure of a run neither holds nor walks through: libc,
+    which everything needs."""
+    return "libc.so" in path
+
+
+class GraphStore(object):
+    """Resolved dependency edges, requester -> providers, of every
+    analysed build, keyed by its fingerprint.
+
+    A build is written whole with `replace()`, or derived from an earlier
+    one with `copy()` and `patch()` touching only the requesters whose
+    edges changed. The nodes of a build are kept apart from its edges, so
+    ELFs without any edge are part of it too. `config` identifies the
+    linker configuration the edges were resolved with. Only the process
+    that opened the store writes.
+    """
+
+    def __init__(self, path: str = ":memory:", read_only: bool = False):
+        # `read_only`: opened by readers next to a writing run, never creates or locks for writing
+        self.path = path
+        if read_only:
+            self._db = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+        else:
+            self._db = sqlite3.connect(path)
+            self._db.executescript(SCHEMA)
+        self._node_ids: Dict[str, int] = dict(
+            (path, node_id) for node_id, path in self._db.execute("SELECT id, path FROM nodes"))
+
+    def _node(self, path: str) -> int:
+        node_id = self._node_ids.get(path)
+        if node_id is None:
+            node_id = self._node_ids[path] = self._db.execute(
+                "INSERT INTO nodes (path) VALUES (?)", (path,)).lastrowid
+        return node_id
+
+    def _build_id(self, fingerprint: str) -> int | None:
+        row = self._db.execute("SELECT id FROM builds WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return row[0] if row is not None else None
+
+    def has(self, fingerprint: str) -> bool:
+        return self._build_id(fingerprint) is not None
+
+    def config(self, fingerprint: str) -> str | None:
+        row = self._db.execute("SELECT config FROM builds WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return row[0] if row is not None else None
+
+    def builds(self) -> List[Tuple[str, float]]:
+        """Returns `(fingerprint, created)` of all stored builds, oldest first."""
+        return self._db.execute("SELECT fingerprint, created FROM builds ORDER BY created, id").fetchall()
+
+    def _new_build(self, fingerprint: str, config: str | None) -> int:
+        build_id = self._build_id(fingerprint)
+        if build_id is not None:
+            self._db.execute("DELETE FROM edges WHERE build_id = ?", (build_id,))
+            self._db.execute("DELETE FROM build_nodes WHERE build_id = ?", (build_id,))
+            self._db.execute("UPDATE builds SET config = ?, created = ? WHERE id = ?",
+                             (config, time.time(), build_id))
+            return build_id
+        return self._db.execute("INSERT INTO builds (fingerprint, config, created) VALUES (?, ?, ?)",
+                                (fingerprint, config, time.time())).lastrowid
+
+    def _insert(self, build_id: int, edges: Dict[str, List[str]]):
+        rows = [(build_id, self._node(requester), position, self._node(provider))
+                for requester, providers in edges.items() for position, provider in enumerate(providers)]
+        self._db.executemany("INSERT INTO edges (build_id, requester, position, provider) VALUES (?, ?, ?, ?)", rows)
+        nodes = set(edges).union(*edges.values())
+        self._db.executemany("INSERT OR IGNORE INTO build_nodes (build_id, node) VALUES (?, ?)",
+                             ((build_id, self._node(path)) for path in nodes))
+
+    def replace(self, fingerprint: str, config: str | None, edges: Dict[str, List[str]]):
+        """Stores `edges` as the complete graph of build `fingerprint`; its
+        nodes are the requesters, with or without providers, and providers."""
+        build_id = self._new_build(fingerprint, config)
+        self._insert(build_id, edges)
+        self._db.commit()
+
+    def copy(self, source: str, fingerprint: str, config: str | None):
+        """Starts build `fingerprint` as a copy of build `source`."""
+        source_id = self._build_id(source)
+        build_id = self._new_build(fingerprint, config)
+        self._db.execute("INSERT INTO edges (build_id, requester, position, provider) "
+                         "SELECT ?, requester, position, provider FROM edges WHERE build_id = ?",
+                         (build_id, source_id))
+        self._db.execute("INSERT INTO build_nodes (build_id, node) "
+                         "SELECT ?, node FROM build_nodes WHERE build_id = ?", (build_id, source_id))
+        self._db.commit()
+
+    def patch(self, fingerprint: str, edges: Dict[str, List[str]], removed: Iterable[str] = ()):
+        """Replaces the edges of the requesters in `edges` and drops the
+        nodes in `removed`, with their edges, from build `fingerprint`."""
+        build_id = self._build_id(fingerprint)
+        removed = [(build_id, self._node(path)) for path in removed]
+        rows = [(build_id, self._node(requester)) for requester in edges]
+        self._db.executemany("DELETE FROM edges WHERE build_id = ? AND requester = ?", rows + removed)
+        self._db.executemany("DELETE FROM build_nodes WHERE build_id = ? AND node = ?", removed)
+        self._insert(build_id, edges)
+        self._db.commit()
+
+    def edges(self, fingerprint: str) -> Dict[str, List[str]]:
+        """Returns the graph of build `fingerprint`, requester -> providers."""
+        paths = self.paths()
+        edges: Dict[str, List[str]] = {}
+        for requester, provider in self._db.execute(
+                "SELECT requester, provider FROM edges WHERE build_id = ? ORDER BY requester, position",
+                (self._build_id(fingerprint),)):
+            edges.setdefault(paths[requester], []).append(paths[provider])
+        return edges
+
+    def edge_ids(self, fingerprint: str) -> Set[Tuple[int, int]]:
+        """Returns the edges of build `fingerprint` as `(requester,
+        provider)` node ids; `paths()` maps them back."""
+        return set(self._db.execute("SELECT requester, provider FROM edges WHERE build_id = ?",
+                                    (self._build_id(fingerprint),)))
+
+    def node_ids(self, fingerprint: str) -> Set[int]:
+        """Returns the node ids of build `fingerprint`. Builds stored before
+        nodes were kept have those of their edges."""
+        build_id = self._build_id(fingerprint)
+        nodes = set(row[0] for row in self._db.execute(
+            "SELECT node FROM build_nodes WHERE build_id = ?", (build_id,)))
+        if not nodes:
+            for requester, provider in self.edge_ids(fingerprint):
+                nodes.update((requester, provider))
+        return nodes
+
+    def node_id(self, path: str) -> int | None:
+        return self._node_ids.get(path)
+
+    def paths(self) -> Dict[int, str]:
+        """Returns node id -> path of all nodes."""
+        return dict((node_id, path) for path, node_id in self._node_ids.items())
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
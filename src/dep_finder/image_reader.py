@@ -0,0 +1,460 @@
+import os
+import stat
+import struct
+import bisect
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+SPARSE_HEADER_MAGIC = 0xED26FF3A
+SPARSE_HEADER = struct.Struct("<IHHHHIIII")
+SPARSE_CHUNK_HEADER = struct.Struct("<HHII")
+CHUNK_TYPE_RAW = 0xCAC1
+CHUNK_TYPE_FILL = 0xCAC2
+CHUNK_TYPE_DONT_CARE = 0xCAC3
+CHUNK_TYPE_CRC32 = 0xCAC4
+
+SUPERBLOCK_OFFSET = 1024
+EXT4_MAGIC = 0xEF53
+EXT4_INCOMPAT_FILETYPE = 0x2
+EXT4_INCOMPAT_64BIT = 0x80
+EXT4_EXTENTS_FL = 0x80000
+EXT4_INLINE_DATA_FL = 0x10000000
+EXT4_EXTENT_MAGIC = 0xF30A
+EXT4_ROOT_INO = 2
+
+EROFS_MAGIC = 0xE0F5E1E2
+EROFS_FLAT_PLAIN = 0
+EROFS_FLAT_INLINE = 2
+
+# dirent file types shared by ext4 and erofs
+FT_REG_FILE = 1
+FT_DIR = 2
+FT_SYMLINK = 7
+
+DirEntry = namedtuple("DirEntry", ["node", "kind"])
+"""`kind` is one of `f` (regular file), `d` (directory), `l` (symlink) or
+`o` (anything else)."""
+
+
+class ImageError(Exception):
+    pass
+
+
+class UnsupportedLayout(ImageError):
+    """A file is stored in a way the readers cannot decode, e.g. compressed
+    erofs; `image` is the image holding it."""
+
+    def __init__(self, image: str, message: str):
+        super().__init__(f"{image}: {message}")
+        self.image = image
+
+
+def _kind_from_ftype(ftype: int) -> str | None:
+    if ftype == FT_REG_FILE:
+        return "f"
+    if ftype == FT_DIR:
+        return "d"
+    if ftype == FT_SYMLINK:
+        return "l"
+    return "o" if ftype else None
+
+
+def _kind_from_mode(mode: int) -> str:
+    if stat.S_ISREG(mode):
+        return "f"
+    if stat.S_ISDIR(mode):
+        return "d"
+    if stat.S_ISLNK(mode):
+        return "l"
+    return "o"
+
+
+################################################################################
+# Block sources
+################################################################################
+
+class RawImage(object):
+    """Random access to a plain (non sparse) image file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read(self, offset: int, size: int) -> bytes:
+        data = os.pread(self._fd, size, offset)
+        if len(data) < size:
+            data += b"\0" * (size - len(data))
+        return data
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SparseImage(RawImage):
+    """Random access to an Android sparse image without unsparsing it.
+
+    Only the chunk headers are read up front; data is fetched from the
+    backing file when a block is actually requested.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        header = os.pread(self._fd, SPARSE_HEADER.size, 0)
+        magic, major, _, file_hdr_sz, chunk_hdr_sz, blk_sz, total_blks, total_chunks, _ = \
+            SPARSE_HEADER.unpack(header)
+        if magic != SPARSE_HEADER_MAGIC or major != 1:
+            raise ImageError(f"{path} is not a sparse image")
+        self.block_size = blk_sz
+        self.total_blocks = total_blks
+        # (first block, block count, chunk type, file offset or fill pattern)
+        self._chunks: List[Tuple[int, int, int, int | bytes]] = []
+        pos = file_hdr_sz
+        block = 0
+        for _ in range(total_chunks):
+            chunk_type, _, chunk_sz, total_sz = SPARSE_CHUNK_HEADER.unpack(
+                os.pread(self._fd, SPARSE_CHUNK_HEADER.size, pos))
+            data_offset = pos + chunk_hdr_sz
+            if chunk_type == CHUNK_TYPE_RAW:
+                self._chunks.append((block, chunk_sz, chunk_type, data_offset))
+            elif chunk_type == CHUNK_TYPE_FILL:
+                self._chunks.append((block, chunk_sz, chunk_type, os.pread(self._fd, 4, data_offset)))
+            elif chunk_type == CHUNK_TYPE_DONT_CARE:
+                self._chunks.append((block, chunk_sz, chunk_type, 0))
+            elif chunk_type != CHUNK_TYPE_CRC32:
+                raise ImageError(f"{path}: unknown sparse chunk type {chunk_type:#x}")
+            block += chunk_sz
+            pos += total_sz
+        self._starts = [c[0] for c in self._chunks]
+
+    def read(self, offset: int, size: int) -> bytes:
+        out = bytearray()
+        end = offset + size
+        while offset < end:
+            block = offset // self.block_size
+            index = bisect.bisect_right(self._starts, block) - 1
+            if index < 0 or block >= self._chunks[index][0] + self._chunks[index][1]:
+                out += b"\0" * (end - offset)
+                break
+            first, count, chunk_type, value = self._chunks[index]
+            chunk_start = first * self.block_size
+            chunk_end = min(end, (first + count) * self.block_size)
+            length = chunk_end - offset
+            if chunk_type == CHUNK_TYPE_RAW:
+                data = os.pread(self._fd, length, value + offset - chunk_start)
+                out += data + b"\0" * (length - len(data))
+            elif chunk_type == CHUNK_TYPE_FILL:
+                shift = (offset - chunk_start) % 4
+                out += (value * (length // 4 + 2))[shift:shift + length]
+            else:
+                out += b"\0" * length
+            offset = chunk_end
+        return bytes(out)
+
+
+def open_image(path: str) -> RawImage:
+    """Opens `path` as sparse image if it carries the sparse magic, as raw
+    image otherwise."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if len(head) == 4 and struct.unpack("<I", head)[0] == SPARSE_HEADER_MAGIC:
+        return SparseImage(path)
+    return RawImage(path)
+
+
+################################################################################
+# File systems
+################################################################################
+
+class FsReader(object):
+    """Read-only view of a file system inside an image.
+
+    Files are addressed by an opaque `node` (inode number, erofs nid).
+    """
+
+    root = None
+
+    def __init__(self, image: RawImage):
+        self.image = image
+        self._dir_cache: Dict[int, Dict[str, DirEntry]] = {}
+
+    def listdir(self, node) -> Dict[str, DirEntry]:
+        entries = self._dir_cache.get(node)
+        if entries is None:
+            entries = self._dir_cache[node] = self._read_dir(node)
+        return entries
+
+    def readlink(self, node) -> str:
+        return self.read(node, 0, self.file_size(node)).decode("utf-8", "ignore")
+
+    def _read_dir(self, node) -> Dict[str, DirEntry]:
+        raise NotImplementedError
+
+    def file_size(self, node) -> int:
+        raise NotImplementedError
+
+    def read(self, node, offset: int, size: int) -> bytes:
+        raise NotImplementedError
+
+    def close(self):
+        self.image.close()
+
+
+class Ext4Reader(FsReader):
+    """ext2/3/4 reader supporting extent trees and classic block maps."""
+
+    root = EXT4_ROOT_INO
+
+    def __init__(self, image: RawImage):
+        super().__init__(image)
+        sb = image.read(SUPERBLOCK_OFFSET, 1024)
+        if struct.unpack_from("<H", sb, 0x38)[0] != EXT4_MAGIC:
+            raise ImageError("no ext4 superblock")
+        self.block_size = 1024 << struct.unpack_from("<I", sb, 0x18)[0]
+        first_data_block = struct.unpack_from("<I", sb, 0x14)[0]
+        self.inodes_per_group = struct.unpack_from("<I", sb, 0x28)[0]
+        rev_level = struct.unpack_from("<I", sb, 0x4C)[0]
+        self.inode_size = struct.unpack_from("<H", sb, 0x58)[0] if rev_level >= 1 else 128
+        self.incompat = struct.unpack_from("<I", sb, 0x60)[0]
+        desc_size = struct.unpack_from("<H", sb, 0xFE)[0]
+        if not self.incompat & EXT4_INCOMPAT_64BIT or desc_size < 32:
+            desc_size = 32
+        self.desc_size = desc_size
+        self.gdt_offset = (first_data_block + 1) * self.block_size
+        self._inode_tables: Dict[int, int] = {}
+        self._inodes: Dict[int, Tuple[int, int, int, bytes]] = {}
+        self._extents: Dict[int, list] = {}
+
+    def _inode_table(self, group: int) -> int:
+        table = self._inode_tables.get(group)
+        if table is None:
+            desc = self.image.read(self.gdt_offset + group * self.desc_size, self.desc_size)
+            table = struct.unpack_from("<I", desc, 0x8)[0]
+            if self.desc_size >= 64:
+                table |= struct.unpack_from("<I", desc, 0x28)[0] << 32
+            self._inode_tables[group] = table
+        return table
+
+    def _inode(self, ino: int) -> Tuple[int, int, int, bytes]:
+        """Returns `(mode, size, flags, i_block)` of inode `ino`."""
+        inode = self._inodes.get(ino)
+        if inode is None:
+            group, index = divmod(ino - 1, self.inodes_per_group)
+            offset = self._inode_table(group) * self.block_size + index * self.inode_size
+            raw = self.image.read(offset, 128)
+            mode, size_lo = struct.unpack_from("<HxxI", raw, 0x0)
+            flags = struct.unpack_from("<I", raw, 0x20)[0]
+            size_hi = struct.unpack_from("<I", raw, 0x6C)[0]
+            inode = (mode, size_lo | (size_hi << 32), flags, raw[0x28:0x28 + 60])
+            self._inodes[ino] = inode
+        return inode
+
+    def file_size(self, node) -> int:
+        return self._inode(node)[1]
+
+    def _read_block(self, block: int) -> bytes:
+        return self.image.read(block * self.block_size, self.block_size)
+
+    def _parse_extent_node(self, data: bytes, out: list):
+        magic, entries, _, depth = struct.unpack_from("<HHHH", data, 0)
+        if magic != EXT4_EXTENT_MAGIC:
+            raise ImageError("bad extent header")
+        for i in range(entries):
+            pos = 12 + 12 * i
+            if depth == 0:
+                logical, length, start_hi, start_lo = struct.unpack_from("<IHHI", data, pos)
+                uninit = length > 32768
+                if uninit:
+                    length -= 32768
+                out.append((logical, length, (start_hi << 32) | start_lo, uninit))
+            else:
+                _, leaf_lo, leaf_hi = struct.unpack_from("<IIH", data, pos)
+                self._parse_extent_node(self._read_block((leaf_hi << 32) | leaf_lo), out)
+
+    def _parse_block_map(self, i_block: bytes, size: int, out: list):
+        per_block = self.block_size // 4
+        total = (size + self.block_size - 1) // self.block_size
+        pointers = struct.unpack("<15I", i_block)
+        logical = 0
+
+        def add(physical):
+            nonlocal logical
+            if physical:
+                last = out[-1] if out else None
+                if last and last[0] + last[1] == logical and last[2] + last[1] == physical:
+                    out[-1] = (last[0], last[1] + 1, last[2], False)
+                else:
+                    out.append((logical, 1, physical, False))
+            logical += 1
+
+        def walk(block, level):
+            nonlocal logical
+            if not block:
+                logical += per_block ** level
+                return
+            for p in struct.unpack(f"<{per_block}I", self._read_block(block)):
+                if logical >= total:
+                    return
+                if level == 1:
+                    add(p)
+                else:
+                    walk(p, level - 1)
+
+        for p in pointers[:12]:
+            if logical >= total:
+                return
+            add(p)
+        for level, block in ((1, pointers[12]), (2, pointers[13]), (3, pointers[14])):
+            if logical >= total:
+                return
+            walk(block, level)
+
+    def _extent_list(self, ino: int) -> list:
+        extents = self._extents.get(ino)
+        if extents is None:
+            _, size, flags, i_block = self._inode(ino)
+            extents = []
+            if flags & EXT4_EXTENTS_FL:
+                self._parse_extent_node(i_block, extents)
+            else:
+                self._parse_block_map(i_block, size, extents)
+            extents.sort()
+            self._extents[ino] = extents
+        return extents
+
+    def read(self, node, offset: int, size: int) -> bytes:
+        mode, file_size, flags, i_block = self._inode(node)
+        size = max(0, min(size, file_size - offset))
+        if size == 0:
+            return b""
+        if flags & EXT4_INLINE_DATA_FL:
+            if file_size > len(i_block):
+                raise UnsupportedLayout(self.image.path, f"inode {node}: inline data in xattrs is not supported")
+            return i_block[offset:offset + size]
+        if stat.S_ISLNK(mode) and not flags & EXT4_EXTENTS_FL and file_size < 60:
+            return i_block[offset:offset + size]
+        result = bytearray(size)
+        end = offset + size
+        bs = self.block_size
+        for logical, length, physical, uninit in self._extent_list(node):
+            ext_start = logical * bs
+            ext_end = ext_start + length * bs
+            if ext_end <= offset:
+                continue
+            if ext_start >= end:
+                break
+            lo = max(offset, ext_start)
+            hi = min(end, ext_end)
+            if not uninit:
+                result[lo - offset:hi - offset] = self.image.read(physical * bs + lo - ext_start, hi - lo)
+        return bytes(result)
+
+    def _read_dir(self, node) -> Dict[str, DirEntry]:
+        data = self.read(node, 0, self.file_size(node))
+        has_ftype = self.incompat & EXT4_INCOMPAT_FILETYPE
+        entries = {}
+        pos = 0
+        while pos + 8 <= len(data):
+            if has_ftype:
+                ino, rec_len, name_len, ftype = struct.unpack_from("<IHBB", data, pos)
+            else:
+                ino, rec_len, name_len = struct.unpack_from("<IHH", data, pos)
+                ftype = 0
+            if rec_len < 8:
+                break
+            name = data[pos + 8:pos + 8 + name_len].decode("utf-8", "surrogateescape")
+            if ino and name not in (".", ".."):
+                kind = _kind_from_ftype(ftype) or _kind_from_mode(self._inode(ino)[0])
+                entries[name] = DirEntry(ino, kind)
+            pos += rec_len
+        return entries
+
+
+class ErofsReader(FsReader):
+    """EROFS reader for the uncompressed (flat) data layouts."""
+
+    def __init__(self, image: RawImage):
+        super().__init__(image)
+        sb = image.read(SUPERBLOCK_OFFSET, 128)
+        if struct.unpack_from("<I", sb, 0)[0] != EROFS_MAGIC:
+            raise ImageError("no erofs superblock")
+        self.block_size = 1 << sb[12]
+        self.root = struct.unpack_from("<H", sb, 14)[0]
+        self.meta_offset = struct.unpack_from("<I", sb, 40)[0] * self.block_size
+        self._inodes: Dict[int, Tuple[int, int, int, int, int]] = {}
+
+    def _inode(self, nid: int) -> Tuple[int, int, int, int, int]:
+        """Returns `(mode, size, layout, raw_blkaddr, inline data offset)`."""
+        inode = self._inodes.get(nid)
+        if inode is None:
+            offset = self.meta_offset + nid * 32
+            raw = self.image.read(offset, 64)
+            i_format, xattr_icount, mode = struct.unpack_from("<HHH", raw, 0)
+            extended = i_format & 1
+            layout = (i_format >> 1) & 0x7
+            if extended:
+                size = struct.unpack_from("<Q", raw, 8)[0]
+            else:
+                size = struct.unpack_from("<I", raw, 8)[0]
+            blkaddr = struct.unpack_from("<I", raw, 16)[0]
+            xattr_size = 12 + 4 * (xattr_icount - 1) if xattr_icount else 0
+            inline = offset + (64 if extended else 32) + xattr_size
+            inode = (mode, size, layout, blkaddr, inline)
+            self._inodes[nid] = inode
+        return inode
+
+    def file_size(self, node) -> int:
+        return self._inode(node)[1]
+
+    def read(self, node, offset: int, size: int) -> bytes:
+        _, file_size, layout, blkaddr, inline = self._inode(node)
+        size = max(0, min(size, file_size - offset))
+        if size == 0:
+            return b""
+        base = blkaddr * self.block_size
+        if layout == EROFS_FLAT_PLAIN:
+            return self.image.read(base + offset, size)
+        if layout != EROFS_FLAT_INLINE:
+            raise UnsupportedLayout(self.image.path, f"nid {node}: erofs data layout {layout} "
+                                    "(compressed or chunked) is not supported")
+        tail_start = ((file_size + self.block_size - 1) // self.block_size - 1) * self.block_size
+        end = offset + size
+        out = b""
+        if offset < tail_start:
+            out += self.image.read(base + offset, min(end, tail_start) - offset)
+        if end > tail_start:
+            lo = max(offset, tail_start)
+            out += self.image.read(inline + lo - tail_start, end - lo)
+        return out
+
+    def _read_dir(self, node) -> Dict[str, DirEntry]:
+        entries = {}
+        size = self.file_size(node)
+        for start in range(0, size, self.block_size):
+            block = self.read(node, start, self.block_size)
+            count = struct.unpack_from("<H", block, 8)[0] // 12
+            for i in range(count):
+                nid, nameoff, ftype = struct.unpack_from("<QHB", block, i * 12)
+                if i + 1 < count:
+                    name_end = struct.unpack_from("<H", block, (i + 1) * 12 + 8)[0]
+                    name = block[nameoff:name_end]
+                else:
+                    name = block[nameoff:].split(b"\0", 1)[0]
+                name = name.decode("utf-8", "surrogateescape")
+                if name not in (".", ".."):
+                    kind = _kind_from_ftype(ftype) or _kind_from_mode(self._inode(nid)[0])
+                    entries[name] = DirEntry(nid, kind)
+        return entries
+
+
+def open_filesystem(path: str) -> FsReader:
+    """Opens the file system inside the (sparse or raw) image `path`."""
+    image = open_image(path)
+    sb = image.read(SUPERBLOCK_OFFSET, 0x3A)
+    if struct.unpack_from("<I", sb, 0)[0] == EROFS_MAGIC:
+        return ErofsReader(image)
+    if struct.unpack_from("<H", sb, 0x38)[0] == EXT4_MAGIC:
+        return Ext4Reader(image)
+    image.close()
+    raise ImageError(f"{path}: unknown file system")
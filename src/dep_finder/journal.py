@@ -0,0 +1,115 @@
+import json
+import time
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS phases (
+    name TEXT PRIMARY KEY,
+    completed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    phase TEXT NOT NULL,
+    item TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (phase, item)
+) WITHOUT ROWID;
+"""
+
+
+class RunJournal(object):
+    """Durable record of what a run has finished.
+
+    A phase is complete once `complete()` was called for it; inside a
+    phase every item is recorded with its result or its error. Records
+    are committed at least every `COMMIT_INTERVAL` seconds and when a
+    phase completes, so a restart loses at most that much work. Only the
+    process that opened the journal writes to it.
+    """
+
+    COMMIT_INTERVAL = 1.0
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        self._last_commit = time.monotonic()
+        self._commit_hooks: List[Callable[[], None]] = []
+
+    def add_commit_hook(self, hook: Callable[[], None]):
+        """Calls `hook` before every commit, so data the journaled results
+        rely on is durable first."""
+        self._commit_hooks.append(hook)
+
+    def run_key(self) -> str | None:
+        """Returns the key of the run the journal belongs to."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+        return row[0] if row is not None else None
+
+    def open_run(self, key: str, keep: Iterable[str] = ()) -> bool:
+        """Starts over unless the journal belongs to a run with the same
+        `key` (the build fingerprint). Returns `True` when resuming. The
+        item records of the phases `keep` survive a new run, the caller
+        `forget()`s the ones that no longer hold."""
+        if self.run_key() == key:
+            return True
+        self._db.execute("DELETE FROM phases")
+        self._db.execute(f"DELETE FROM items WHERE phase NOT IN ({','.join('?' * len(keep))})", tuple(keep))
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('run', ?)", (key,))
+        self._db.commit()
+        return False
+
+    def is_complete(self, phase: str) -> bool:
+        return self._db.execute("SELECT 1 FROM phases WHERE name = ?", (phase,)).fetchone() is not None
+
+    def complete(self, phase: str):
+        self._db.execute("INSERT OR REPLACE INTO phases (name, completed) VALUES (?, ?)", (phase, time.time()))
+        self.commit()
+
+    def reopen(self, phase: str):
+        """Marks `phase` as not complete again; its item records stay."""
+        self._db.execute("DELETE FROM phases WHERE name = ?", (phase,))
+        self.commit()
+
+    def record(self, phase: str, item: str, result: Any = None):
+        self._db.execute("INSERT OR REPLACE INTO items (phase, item, result, error) VALUES (?, ?, ?, NULL)",
+                         (phase, item, json.dumps(result)))
+        self._maybe_commit()
+
+    def forget(self, phase: str, items: Iterable[str]):
+        """Drops the records of `items`, they are done again."""
+        self._db.executemany("DELETE FROM items WHERE phase = ? AND item = ?", ((phase, item) for item in items))
+        self.commit()
+
+    def fail(self, phase: str, item: str, error: str):
+        self._db.execute("INSERT OR REPLACE INTO items (phase, item, result, error) VALUES (?, ?, NULL, ?)",
+                         (phase, item, error))
+        self._maybe_commit()
+
+    def results(self, phase: str) -> Dict[str, Any]:
+        """Returns the results of all items of `phase` that succeeded."""
+        return dict((item, json.loads(result)) for item, result in self._db.execute(
+            "SELECT item, result FROM items WHERE phase = ? AND error IS NULL", (phase,)))
+
+    def failures(self, phase: str) -> Iterable[Tuple[str, str]]:
+        return self._db.execute("SELECT item, error FROM items WHERE phase = ? AND error IS NOT NULL",
+                                (phase,)).fetchall()
+
+    def _maybe_commit(self):
+        if time.monotonic() - self._last_commit >= self.COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        for hook in self._commit_hooks:
+            hook()
+        self._db.commit()
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.commit()
+        self._db.close()
@@ -0,0 +1,246 @@
+import re
+import json
+import hashlib
+import posixpath
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+# search paths of the linker when there is no configuration
+DEFAULT_SEARCH_PATHS = ["/system/${LIB}", "/odm/${LIB}", "/vendor/${LIB}"]
+LINKERCONFIG_DIR = "/linkerconfig"
+VARIABLE = re.compile(r"\$\{(\w+)\}")
+
+
+def config_paths(getprop) -> List[str]:
+    """Candidate `ld.config*.txt` files of a device, in the order bionic
+    looks for them; the first one that exists is used."""
+    paths = [f"{LINKERCONFIG_DIR}/ld.config.txt"]
+    if getprop("ro.vndk.lite") == "true":
+        paths.append("/system/etc/ld.config.vndk_lite.txt")
+    vndk = getprop("ro.vndk.version")
+    if vndk:
+        paths.append(f"/system/etc/ld.config.{vndk}.txt")
+    paths.append("/system/etc/ld.config.txt")
+    return paths
+
+
+def config_variables(getprop, lib: str = "lib64") -> Dict[str, str]:
+    vndk = getprop("ro.vndk.version")
+    return {"LIB": lib, "SDK_VER": getprop("ro.build.version.sdk"),
+            "VNDK_VER": vndk, "VNDK_APEX_VER": f"v{vndk}" if vndk else ""}
+
+
+@dataclass(slots=True)
+class Link:
+    target: str
+    allow_all: bool
+    shared_libs: Set[str]
+
+    def allows(self, name: str) -> bool:
+        return self.allow_all or name in self.shared_libs
+
+
+@dataclass(slots=True)
+class Namespace:
+    name: str
+    search_paths: List[str] = field(default_factory=list)
+    links: List[Link] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class LinkerConfig:
+    """One `ld.config.txt`: which section a binary directory uses and the
+    namespaces of every section."""
+    dirs: List[Tuple[str, str]] = field(default_factory=list)
+    sections: Dict[str, Dict[str, Namespace]] = field(default_factory=dict)
+
+    def section_of(self, binary: str) -> str | None:
+        """Returns the section for the binary at device path `binary`;
+        like bionic the first matching `dir.` entry wins."""
+        for prefix, section in self.dirs:
+            if binary.startswith(prefix):
+                return section
+        return None
+
+
+def _split(value: str, sep: str) -> List[str]:
+    return [v.strip() for v in value.split(sep) if v.strip()]
+
+
+def parse_ld_config(text: str, variables: Dict[str, str]) -> LinkerConfig:
+    """Parses the `ld.config.txt` format shared by the static configs of
+    Android 8 to 10 and the output of `linkerconfig`. `${...}` variables
+    are substituted from `variables`."""
+    config = LinkerConfig()
+    properties = defaultdict(dict)
+    section = None
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1].strip()
+            continue
+        append = "+=" in line
+        name, sep, value = line.partition("+=" if append else "=")
+        if not sep:
+            continue
+        name = name.strip()
+        value = VARIABLE.sub(lambda m: variables.get(m.group(1), m.group(0)), value.strip())
+        if section is None:
+            if name.startswith("dir."):
+                config.dirs.append((value.rstrip("/") + "/", name[len("dir."):]))
+            continue
+        props = properties[section]
+        if append and props.get(name):
+            props[name] += (":" if name.endswith((".paths", ".shared_libs")) else ",") + value
+        else:
+            props[name] = value
+    for section, props in properties.items():
+        namespaces = config.sections[section] = {}
+        for name in ["default"] + _split(props.get("additional.namespaces", ""), ","):
+            prefix = f"namespace.{name}."
+            namespace = namespaces[name] = Namespace(name, _split(props.get(prefix + "search.paths", ""), ":"))
+            for target in _split(props.get(prefix + "links", ""), ","):
+                namespace.links.append(Link(
+                    target, props.get(f"{prefix}link.{target}.allow_all_shared_libs", "") == "true",
+                    set(_split(props.get(f"{prefix}link.{target}.shared_libs", ""), ":"))))
+    return config
+
+
+def load_linker_configs(backend, apexes: Iterable[str] = ()) -> Dict[str, LinkerConfig]:
+    """Reads the linker configuration of the device or image behind
+    `backend`. The result maps "" to the main config and, with the output
+    of `linkerconfig`, APEX names to their own configs. Empty if the
+    build has none."""
+    variables = config_variables(backend.getprop)
+    configs = {}
+    for path in config_paths(backend.getprop):
+        data = backend.read_file(path)
+        if data is None:
+            continue
+        configs[""] = parse_ld_config(data.decode("utf8", "ignore"), variables)
+        if path.startswith(LINKERCONFIG_DIR + "/"):
+            for apex in sorted(set(apexes)):
+                data = backend.read_file(f"{LINKERCONFIG_DIR}/{apex}/ld.config.txt")
+                if data is not None:
+                    configs[apex] = parse_ld_config(data.decode("utf8", "ignore"), variables)
+        break
+    return configs
+
+
+def config_digest(configs: Dict[str, LinkerConfig]) -> str:
+    """Identifies `configs`: equal digests resolve every name the same."""
+    data = json.dumps(dict((key, asdict(config)) for key, config in configs.items()),
+                      sort_keys=True, default=sorted)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def apex_name(path: str) -> str | None:
+    """`com.android.art` for `apex/com.android.art/lib64/libart.so`."""
+    parts = path.lstrip("/").split("/")
+    return parts[1] if len(parts) > 2 and parts[0] == "apex" else None
+
+
+class LibraryResolver(object):
+    """Resolves `(requesting ELF, DT_NEEDED name)` pairs the way bionic does.
+
+    The requester's namespace is picked from the linker configuration: an
+    executable gets the `default` namespace of the section its directory
+    maps to, a library the first namespace of the section of its partition
+    whose search paths hold its directory. A name is looked up in the
+    search paths of that namespace, then in the namespaces it links to, if
+    the link lets the name through. Every namespace gets a table from file
+    name to path, built once, so each lookup is a dict access. Without a
+    configuration the linker's default search paths are used. Paths are
+    relative to the device root, like the paths of the ELF list.
+    """
+
+    def __init__(self, paths: Iterable[str], configs: Dict[str, LinkerConfig] | None = None,
+                 lib: str = "lib64"):
+        self.configs = configs or {}
+        self.lib = lib
+        self._paths = set()
+        self._by_dir = defaultdict(dict)
+        for path in paths:
+            path = path.lstrip("/")
+            self._paths.add(path)
+            directory, base = posixpath.split(path)
+            self._by_dir[directory][base] = path
+        self._tables: Dict[tuple, Dict[str, str]] = {}
+        self._namespaces: Dict[str, tuple] = {}
+        self._cache: Dict[Tuple[tuple, str], str | None] = {}
+        default = [p.replace("${LIB}", lib) for p in DEFAULT_SEARCH_PATHS]
+        self._default = ("", None, None)
+        self._tables[self._default] = self._table(default)
+
+    def _table(self, search_paths: List[str]) -> Dict[str, str]:
+        table = {}
+        for directory in reversed(search_paths):
+            table.update(self._by_dir.get(directory.strip("/"), {}))
+        return table
+
+    def _namespace_key(self, requester: str) -> tuple:
+        """Returns `(config key, section, namespace)` of `requester`."""
+        directory = posixpath.dirname(requester.lstrip("/"))
+        key = self._namespaces.get(directory)
+        if key is not None:
+            return key
+        apex = apex_name(directory + "/")
+        config_key = apex if apex in self.configs else ""
+        config = self.configs.get(config_key)
+        key = self._default
+        if config is not None:
+            device_dir = "/" + directory + "/"
+            section = config.section_of(device_dir)
+            is_binary = section is not None
+            if section is None:
+                # a library: use the section of its partition's binaries
+                parts = directory.split("/")
+                for i, part in enumerate(parts):
+                    if part in ("lib", "lib64"):
+                        section = config.section_of("/" + "/".join(parts[:i] + ["bin"]) + "/")
+                        break
+            namespaces = config.sections.get(section)
+            if namespaces:
+                name = "default"
+                if not is_binary:
+                    for namespace in namespaces.values():
+                        if any(p.strip("/") == directory for p in namespace.search_paths):
+                            name = namespace.name
+                            break
+                key = (config_key, section, name)
+        self._namespaces[directory] = key
+        return key
+
+    def _lookup(self, key: tuple, name: str) -> str | None:
+        table = self._tables.get(key)
+        if table is None:
+            config_key, section, namespace = key
+            namespace = self.configs[config_key].sections[section].get(namespace)
+            table = self._tables[key] = self._table(namespace.search_paths if namespace else [])
+        return table.get(name)
+
+    def resolve(self, requester: str, name: str) -> str | None:
+        """Returns the path of the library `requester` gets for the
+        `DT_NEEDED` (or `dlopen`) name `name`, `None` if the linker would
+        not find one."""
+        if "/" in name:
+            path = name.lstrip("/")
+            return path if path in self._paths else None
+        key = self._namespace_key(requester)
+        cached = self._cache.get((key, name), False)
+        if cached is not False:
+            return cached
+        path = self._lookup(key, name)
+        if path is None and key != self._default:
+            config_key, section, namespace = key
+            links = self.configs[config_key].sections[section].get(namespace)
+            for link in links.links if links else ():
+                if link.allows(name) and link.target in self.configs[config_key].sections[section]:
+                    path = self._lookup((config_key, section, link.target), name)
+                    if path is not None:
+                        break
+        self._cache[(key, name)] = path
+        return path
@@ -0,0 +1,242 @@
+import os
+import json
+import fnmatch
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+from utils.log import get_logger
+from .graph_store import GraphStore
+from .symbols import SymbolIndex
+
+logger = get_logger('depFinderLogger')
+
+# seconds between checks of graph.db for a new analysis
+RELOAD_INTERVAL = 2.0
+
+
+class GraphIndex(object):
+    """In memory adjacency of one stored build, on interned node ids."""
+
+    def __init__(self, fingerprint: str | None, edges: Dict[str, List[str]]):
+        self.fingerprint = fingerprint
+        self.paths: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.deps: List[List[int]] = []
+        self.users: List[List[int]] = []
+        for requester, providers in edges.items():
+            requester_id = self._node(requester)
+            for provider in providers:
+                provider_id = self._node(provider)
+                self.deps[requester_id].append(provider_id)
+                self.users[provider_id].append(requester_id)
+
+    def _node(self, path: str) -> int:
+        node_id = self.ids.get(path)
+        if node_id is None:
+            node_id = self.ids[path] = len(self.paths)
+            self.paths.append(path)
+            self.deps.append([])
+            self.users.append([])
+        return node_id
+
+    def _id(self, path: str) -> int:
+        node_id = self.ids.get(path.lstrip("/"))
+        if node_id is None:
+            raise KeyError(f"No node {path}")
+        return node_id
+
+    def neighbors(self, path: str) -> dict:
+        node_id = self._id(path)
+        return {"deps": sorted(self.paths[i] for i in self.deps[node_id]),
+                "users": sorted(self.paths[i] for i in self.users[node_id])}
+
+    def closure(self, path: str, users: bool = True) -> List[str]:
+        """Returns the ELFs depending on `path` (or the ones it depends on,
+        without `users`), transitively."""
+        adjacency = self.users if users else self.deps
+        root = self._id(path)
+        seen = {root}
+        queue = deque([root])
+        while queue:
+            for neighbor in adjacency[queue.popleft()]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+        seen.discard(root)
+        return sorted(self.paths[i] for i in seen)
+
+    def path(self, source: str, target: str) -> List[str] | None:
+        """Returns a shortest dependency chain from `source` to `target`."""
+        start, goal = self._id(source), self._id(target)
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if node == goal:
+                chain = []
+                while node is not None:
+                    chain.append(self.paths[node])
+                    node = parents[node]
+                return chain[::-1]
+            for neighbor in self.deps[node]:
+                if neighbor not in parents:
+                    parents[neighbor] = node
+                    queue.append(neighbor)
+        return None
+
+
+def load_index(work_dir: str, fingerprint: str | None = None) -> GraphIndex:
+    """Loads build `fingerprint`, by default the newest one, of
+    `<work_dir>/graph.db`, opened read-only."""
+    path = os.path.join(work_dir, "graph.db")
+    if not os.path.exists(path):
+        return GraphIndex(None, {})
+    store = GraphStore(path, read_only=True)
+    try:
+        if fingerprint is None:
+            builds = store.builds()
+            fingerprint = builds[-1][0] if builds else None
+        return GraphIndex(fingerprint, store.edges(fingerprint) if fingerprint else {})
+    finally:
+        store.close()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """JSON answers to `GET /<query>?<parameters>`."""
+
+    server: "QueryServer"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        query = getattr(self, "query_" + url.path.strip("/"), None)
+        if query is None:
+            return self._reply(404, {"error": f"Unknown query {url.path}"})
+        # one index per request, a reload swaps in a new one
+        index = self.server.index
+        try:
+            self._reply(200, query(index, params))
+        except KeyError as e:
+            self._reply(404, {"error": e.args[0]})
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+
+    def do_POST(self):
+        if urlparse(self.path).path.strip("/") != "reload":
+            return self._reply(404, {"error": f"Unknown command {self.path}"})
+        self.server.reload()
+        self._reply(200, {"build": self.server.index.fingerprint})
+
+    @staticmethod
+    def _param(params: dict, name: str) -> str:
+        if name not in params:
+            raise ValueError(f"Parameter {name} is missing")
+        return params[name]
+
+    def query_build(self, index: GraphIndex, params: dict):
+        return {"build": index.fingerprint, "nodes": len(index.paths)}
+
+    def query_neighbors(self, index: GraphIndex, params: dict):
+        return index.neighbors(self._param(params, "node"))
+
+    def query_closure(self, index: GraphIndex, params: dict):
+        direction = params.get("direction", "users")
+        if direction not in ("users", "deps"):
+            raise ValueError("direction is `users` or `deps`")
+        nodes = index.closure(self._param(params, "node"), direction == "users")
+        if "match" in params:
+            nodes = [node for node in nodes if fnmatch.fnmatch(node, params["match"])]
+        return {"nodes": nodes}
+
+    def query_path(self, index: GraphIndex, params: dict):
+        return {"path": index.path(self._param(params, "from"), self._param(params, "to"))}
+
+    def query_symbol(self, index: GraphIndex, params: dict):
+        name = self._param(params, "name")
+        with self.server.symbols_lock:
+            symbols = self.server.symbol_index()
+            providers = symbols.providers(name) if symbols is not None else []
+            importers = symbols.importers(name) if symbols is not None else []
+        return {"providers": providers,
+                "importers": [{"importer": importer, "provider": provider} for importer, provider in importers]}
+
+    def _reply(self, status: int, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    """Answers closure, path, neighbor and symbol queries on the stored
+    graph of a working directory. The graph is loaded once and loaded
+    again when `graph.db` changes, e.g. after a new run."""
+
+    daemon_threads = True
+
+    def __init__(self, work_dir: str, address=("127.0.0.1", 8080), fingerprint: str | None = None,
+                 reload_interval: float = RELOAD_INTERVAL):
+        self.work_dir = work_dir
+        self.fingerprint = fingerprint
+        self.reload_interval = reload_interval
+        self.symbols: SymbolIndex | None = None
+        self.symbols_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._mtime = None
+        self.reload()
+        super().__init__(address, QueryHandler)
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def symbol_index(self) -> SymbolIndex | None:
+        """`symbols.db`, opened read-only once a run wrote it; call with
+        `symbols_lock` held."""
+        if self.symbols is None:
+            path = os.path.join(self.work_dir, "symbols.db")
+            if os.path.exists(path):
+                self.symbols = SymbolIndex(path, shared=True, read_only=True)
+        return self.symbols
+
+    def _graph_mtime(self) -> float | None:
+        try:
+            return os.stat(os.path.join(self.work_dir, "graph.db")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        with self._reload_lock:
+            self._mtime = self._graph_mtime()
+            self.index = load_index(self.work_dir, self.fingerprint)
+        logger.info(f"Serving build {self.index.fingerprint}, {len(self.index.paths)} nodes")
+
+    def _watch(self):
+        while not self._stopped.wait(self.reload_interval):
+            if self._graph_mtime() != self._mtime:
+                try:
+                    self.reload()
+                except Exception as e:
+                    logger.warning(f"Reloading the graph failed: {e}")
+
+    def server_close(self):
+        self._stopped.set()
+        super().server_close()
+        if self.symbols is not None:
+            self.symbols.close()
+
+
+def serve(work_dir: str, port: int, fingerprint: str | None = None):
+    server = QueryServer(work_dir, ("127.0.0.1", port), fingerprint)
+    logger.info(f"Query server listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,250 @@
+import re
+import sqlite3
+import posixpath
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+from urllib.parse import quote
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+from elftools.elf.dynamic import DynamicSection
+
+# bindings the dynamic linker resolves against, STB_LOOS is STB_GNU_UNIQUE
+LINKED_BINDINGS = ("STB_GLOBAL", "STB_WEAK", "STB_LOOS")
+LIBRARY_NAME = re.compile(rb"[\w.+@-]+\.so")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    soname TEXT,
+    needed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS exports (
+    symbol_id INTEGER NOT NULL,
+    object_id INTEGER NOT NULL,
+    PRIMARY KEY (symbol_id, object_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS imports (
+    object_id INTEGER NOT NULL,
+    symbol_id INTEGER NOT NULL,
+    provider_id INTEGER,
+    PRIMARY KEY (object_id, symbol_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS imports_by_symbol ON imports (symbol_id);
+"""
+
+
+@dataclass(slots=True)
+class ElfInfo:
+    """Dynamic section and `.dynsym` of one ELF, read in a single pass."""
+    arch: Tuple[str, int]
+    soname: str | None = None
+    needed: List[str] = field(default_factory=list)
+    exports: List[str] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    # `getService` symbols, defined or not
+    services: List[str] = field(default_factory=list)
+
+
+def read_elf_info(path: str) -> ElfInfo:
+    """Parses the ELF `path` once. Only 64 bit ELFs get their dynamic
+    section and symbols read."""
+    with open(path, "rb") as f:
+        elffile = ELFFile(f)
+        info = ElfInfo((elffile.get_machine_arch(), elffile.elfclass))
+        if info.arch[1] != 64:
+            return info
+        dynamic = elffile.get_section_by_name(".dynamic")
+        if isinstance(dynamic, DynamicSection):
+            for tag in dynamic.iter_tags():
+                if tag.entry.d_tag == "DT_NEEDED":
+                    info.needed.append(tag.needed)
+                elif tag.entry.d_tag == "DT_SONAME":
+                    info.soname = tag.soname
+        dynsym = elffile.get_section_by_name(".dynsym")
+        if isinstance(dynsym, SymbolTableSection):
+            for symbol in dynsym.iter_symbols():
+                name = symbol.name
+                if not name:
+                    continue
+                bind = symbol["st_info"]["bind"]
+                if "getService" in name and bind == "STB_GLOBAL":
+                    info.services.append(name)
+                if bind not in LINKED_BINDINGS:
+                    continue
+                if symbol["st_shndx"] == "SHN_UNDEF":
+                    info.imports.append(name)
+                else:
+                    info.exports.append(name)
+    return info
+
+
+def library_names(path: str) -> Set[str]:
+    """Returns the base names of all `*.so` files mentioned in the strings
+    of file `path`, e.g. `libfoo.so` for "/vendor/lib64/libfoo.so"."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return {m.decode("utf8", "ignore") for m in LIBRARY_NAME.findall(data)}
+
+
+def prefer_system(candidates: List[str]) -> str | None:
+    """The provider picked among libraries of the same name: `system/`
+    copies win, otherwise the first one."""
+    system = [c for c in candidates if c.startswith("system/")]
+    return (system or candidates or [None])[0]
+
+
+class SymbolIndex(object):
+    """Exported and imported dynamic symbols of all analysed ELFs.
+
+    `resolve()` binds every import the way the dynamic linker does: to
+    the first library in breadth first `DT_NEEDED` order, starting at the
+    importing object, that exports the symbol. Afterwards the index can be
+    queried by symbol. Only the process that opened the index writes to it.
+    """
+
+    def __init__(self, path: str = ":memory:", shared: bool = False, read_only: bool = False):
+        # `shared`: queried from several threads, which serialize the calls
+        self.path = path
+        if read_only:
+            self._db = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=not shared)
+        else:
+            self._db = sqlite3.connect(path, check_same_thread=not shared)
+            self._db.executescript(SCHEMA)
+        self._symbol_ids: Dict[str, int] = dict(
+            (name, symbol_id) for symbol_id, name in self._db.execute("SELECT id, name FROM symbols"))
+
+    def clear(self):
+        self._db.executescript("DELETE FROM imports; DELETE FROM exports; DELETE FROM symbols; DELETE FROM objects;")
+        self._symbol_ids.clear()
+        self._db.commit()
+
+    def _intern(self, names: List[str]) -> List[int]:
+        for name in names:
+            if name not in self._symbol_ids:
+                self._symbol_ids[name] = self._db.execute(
+                    "INSERT INTO symbols (name) VALUES (?)", (name,)).lastrowid
+        return [self._symbol_ids[name] for name in names]
+
+    def add(self, path: str, info: ElfInfo):
+        """Stores the symbols of the ELF `path`, replacing earlier ones."""
+        row = self._db.execute("SELECT id FROM objects WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM exports WHERE object_id = ?", row)
+            self._db.execute("DELETE FROM imports WHERE object_id = ?", row)
+            self._db.execute("DELETE FROM objects WHERE id = ?", row)
+        object_id = self._db.execute("INSERT INTO objects (path, soname, needed) VALUES (?, ?, ?)",
+                                     (path, info.soname, "\n".join(info.needed))).lastrowid
+        self._db.executemany("INSERT OR IGNORE INTO exports (symbol_id, object_id) VALUES (?, ?)",
+                             ((s, object_id) for s in self._intern(info.exports)))
+        self._db.executemany("INSERT OR IGNORE INTO imports (object_id, symbol_id) VALUES (?, ?)",
+                             ((object_id, s) for s in self._intern(info.imports)))
+
+    def prune(self, paths: Iterable[str]) -> int:
+        """Drops the ELFs that are not in `paths`; returns how many."""
+        keep = set(paths)
+        stale = [(object_id,) for object_id, path in self._db.execute("SELECT id, path FROM objects")
+                 if path not in keep]
+        for table, column in (("exports", "object_id"), ("imports", "object_id"), ("objects", "id")):
+            self._db.executemany(f"DELETE FROM {table} WHERE {column} = ?", stale)
+        return len(stale)
+
+    def needed(self) -> Dict[str, List[str]]:
+        """Returns the `DT_NEEDED` names of every ELF, by path."""
+        return dict((path, needed.split("\n") if needed else [])
+                    for path, needed in self._db.execute("SELECT path, needed FROM objects"))
+
+    def _default_locator(self, objects: Dict[int, tuple]) -> Callable[[str, str], str | None]:
+        by_name = defaultdict(list)
+        for path, soname, _ in objects.values():
+            by_name[posixpath.basename(path)].append(path)
+            if soname and soname != posixpath.basename(path):
+                by_name[soname].append(path)
+        return lambda importer, name: prefer_system(by_name.get(name, []))
+
+    def resolve(self, locate: Callable[[str, str], str | None] | None = None) -> Tuple[int, int]:
+        """Binds all imports. `locate(importer, name)` maps a `DT_NEEDED`
+        entry of `importer` to a path, by default by file name or soname.
+        Returns the number of bound and of unbound imports."""
+        objects = dict((object_id, (path, soname, needed.split("\n") if needed else []))
+                       for object_id, path, soname, needed in self._db.execute(
+                           "SELECT id, path, soname, needed FROM objects"))
+        if locate is None:
+            locate = self._default_locator(objects)
+        ids = dict((path, object_id) for object_id, (path, _, _) in objects.items())
+        exports = defaultdict(list)
+        for symbol_id, object_id in self._db.execute("SELECT symbol_id, object_id FROM exports"):
+            exports[symbol_id].append(object_id)
+        imports = defaultdict(list)
+        for object_id, symbol_id in self._db.execute("SELECT object_id, symbol_id FROM imports"):
+            imports[object_id].append(symbol_id)
+
+        direct: Dict[int, List[int]] = {}
+
+        def needed_ids(object_id: int) -> List[int]:
+            if object_id not in direct:
+                path, _, needed = objects[object_id]
+                located = (locate(path, name) for name in needed)
+                direct[object_id] = [ids[p] for p in located if p in ids]
+            return direct[object_id]
+
+        bound = unbound = 0
+        bindings = []
+        for object_id, symbol_ids in imports.items():
+            rank = {object_id: 0}
+            queue = deque([object_id])
+            while queue:
+                for dep in needed_ids(queue.popleft()):
+                    if dep not in rank:
+                        rank[dep] = len(rank)
+                        queue.append(dep)
+            for symbol_id in symbol_ids:
+                providers = [p for p in exports.get(symbol_id, ()) if p in rank]
+                provider = min(providers, key=rank.__getitem__) if providers else None
+                if provider is None:
+                    unbound += 1
+                else:
+                    bound += 1
+                bindings.append((provider, object_id, symbol_id))
+        self._db.executemany("UPDATE imports SET provider_id = ? WHERE object_id = ? AND symbol_id = ?", bindings)
+        self._db.commit()
+        return bound, unbound
+
+    def providers(self, symbol: str) -> List[str]:
+        """Returns the libraries exporting `symbol`."""
+        return [path for path, in self._db.execute(
+            "SELECT o.path FROM exports e JOIN symbols s ON s.id = e.symbol_id "
+            "JOIN objects o ON o.id = e.object_id WHERE s.name = ? ORDER BY o.path", (symbol,))]
+
+    def importers(self, symbol: str) -> List[Tuple[str, str | None]]:
+        """Returns `(importer, provider)` for every ELF importing `symbol`;
+        the provider is `None` if the import is not bound."""
+        return self._db.execute(
+            "SELECT o.path, p.path FROM imports i JOIN symbols s ON s.id = i.symbol_id "
+            "JOIN objects o ON o.id = i.object_id LEFT JOIN objects p ON p.id = i.provider_id "
+            "WHERE s.name = ? ORDER BY o.path", (symbol,)).fetchall()
+
+    def imports_of(self, path: str) -> Dict[str, str | None]:
+        """Returns the imports of ELF `path` and the libraries they bind to."""
+        return dict(self._db.execute(
+            "SELECT s.name, p.path FROM imports i JOIN symbols s ON s.id = i.symbol_id "
+            "JOIN objects o ON o.id = i.object_id LEFT JOIN objects p ON p.id = i.provider_id "
+            "WHERE o.path = ?", (path,)))
+
+    def exports_of(self, path: str) -> List[str]:
+        return [name for name, in self._db.execute(
+            "SELECT s.name FROM exports e JOIN symbols s ON s.id = e.symbol_id "
+            "JOIN objects o ON o.id = e.object_id WHERE o.path = ? ORDER BY s.name", (path,))]
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
@@ -1,9 +1,29 @@
 import unittest
 import os
 
+from utils.log import init_ini_log
+
 from .test_dep_finder import TestDependencyFinderModule
+from .test_backend import TestLocalBackend, TestScanPlan
+from .test_image_reader import TestImageReader
+from .test_metrics import TestMetricsModule, TestProfilingModule
+from .test_log import TestQueueLog
+from .test_file_store import TestFileListStore, TestExecutableTable
+from .test_adb import TestAdbStreaming
+from .test_journal import TestRunJournal, TestResume
+from .test_symbols import TestSymbolIndex, TestSyntheticRun
+from .test_linker_config import TestLinkerConfig
+from .test_incremental import TestGraphStore, TestIncrementalRun
+from .test_graph_diff import TestGraphDiff
+from .test_query_server import TestQueryServer
+from .test_startup import TestStartup
+from .test_concurrency import TestAimdController
+from .test_demangle import TestDemangle
+from .test_perf import TestPerformance
 
 
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    os.makedirs(os.path.join(os.getcwd(), "logs"), exist_ok=True)
+    init_ini_log(os.path.join(os.getcwd(), "log.ini"))
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.adb import Adb
+from utils import metrics, transfer
+from dep_finder.backend import AdbBackend
+from bench_teezz import fake_adb
+
+
+def _write(root, path, data: bytes):
+    local_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, "wb") as f:
+        f.write(data)
+
+
+class TestAdbStreaming(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "device")
+        for i in range(50):
+            _write(self.root, f"vendor/lib64/lib{i}.so", b"\x7fELF" + b"\0" * 60)
+        self.blob = os.urandom(1 << 16) + b"\n" * (1 << 18)
+        _write(self.root, "vendor/lib/libblob.so", self.blob)
+        _write(self.root, "vendor/etc/init.rc", b"service foo /vendor/bin/foo\n")
+        _write(self.root, "system/build.prop", b"ro.product.brand=synth\nro.hardware=synthhw\n")
+        self.env = dict(os.environ)
+        bin_dir = os.path.dirname(fake_adb.install(os.path.join(self.tmp.name, "bin")))
+        os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+        os.environ["FAKE_ADB_ROOT"] = self.root
+        self.adb = Adb()
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_deferred_probing(self):
+        metrics.get_metrics().reset()
+        adb = Adb()
+        self.assertNotIn("adb.commands", metrics.get_metrics().summary()["counters"])
+        backend = AdbBackend(adb)
+        self.assertEqual(backend.getprop("ro.hardware"), "synthhw")
+        self.assertEqual(backend.getprop("ro.product.brand"), "synth")
+        self.assertEqual(metrics.get_metrics().summary()["counters"]["adb.commands"], 1)
+        for _ in range(3):
+            adb.call_privileged_adb_shell(["true"])
+        # whoami and su once, then the commands themselves
+        self.assertEqual(metrics.get_metrics().summary()["counters"]["adb.commands"], 6)
+        self.assertTrue(adb.adb_is_root())
+
+    def test_shared_by_threads(self):
+        metrics.get_metrics().reset()
+        adb = Adb()
+        with ThreadPoolExecutor(8) as pool:
+            outs = list(pool.map(lambda i: adb.call_privileged_adb_shell(["echo", str(i)]), range(32)))
+        self.assertEqual(outs, [f"{i}\n" for i in range(32)])
+        # probed once by all threads, no process left behind
+        self.assertEqual(metrics.get_metrics().summary()["counters"]["adb.commands"], 2 + 32)
+        self.assertEqual(adb.process, [])
+
+    def test_iter_shell_lines(self):
+        cmd = ["find /vendor -type f"]
+        lines = list(self.adb.iter_shell_lines(cmd))
+        self.assertEqual(len(lines), 52)
+        self.assertEqual(lines, self.adb.call_adb_shell(cmd).splitlines())
+        self.assertEqual(self.adb.process, [])
+
+    def test_close_early(self):
+        lines = self.adb.iter_shell_lines(["find /vendor -type f"])
+        self.assertTrue(next(lines).startswith("/vendor/"))
+        self.assertEqual(len(self.adb.process), 1)
+        lines.close()
+        self.assertEqual(self.adb.process, [])
+
+    def test_backend_scanners(self):
+        backend = AdbBackend(self.adb)
+        self.assertEqual(sorted(backend.find_elfs("/vendor")),
+                         sorted(f"/vendor/lib64/lib{i}.so" for i in range(50)))
+        self.assertEqual(list(backend.find_vdexs("/vendor")), [])
+        self.assertEqual(backend.count_files(["/vendor"]),
+                         {"/vendor/lib64": 50, "/vendor/lib": 1, "/vendor/etc": 1})
+        self.assertEqual(list(backend.find_elfs("/vendor", recursive=False)), [])
+
+    def test_stream_pull(self):
+        for mode in ["raw"] + list(transfer.CODECS):
+            where = os.path.join(self.tmp.name, f"blob.{mode}")
+            self.assertEqual(transfer.stream_pull(self.adb, "/vendor/lib/libblob.so", where, mode), "")
+            with open(where, "rb") as f:
+                self.assertEqual(f.read(), self.blob)
+        where = os.path.join(self.tmp.name, "missing")
+        self.assertNotEqual(transfer.stream_pull(self.adb, "/vendor/lib/missing.so", where, "gzip"), "")
+        self.assertFalse(os.path.exists(where))
+
+    def test_pull_modes(self):
+        backend = AdbBackend(self.adb)
+        backend.prepare_pull(["/vendor/lib/libblob.so"])
+        self.assertIn(backend._mode, ["raw"] + list(transfer.CODECS))
+        where = os.path.join(self.tmp.name, "blob")
+        self.assertEqual(backend.pull("/vendor/lib/libblob.so", where), "")
+        with open(where, "rb") as f:
+            self.assertEqual(f.read(), self.blob)
+
+    def test_link_stats_choose(self):
+        stats = transfer.LinkStats(0.01, 30e6, {"gzip": (60e6, 0.4)}, True)
+        self.assertEqual(stats.choose(), "gzip")
+        stats = transfer.LinkStats(0.01, 300e6, {"gzip": (60e6, 0.4)}, True)
+        self.assertEqual(stats.choose(), "raw")
+        stats = transfer.LinkStats(0.01, 30e6, {"gzip": (60e6, 0.95)}, True)
+        self.assertEqual(stats.choose(), "raw")
+
+
+if __name__ == '__main__':
+    unittest.main()
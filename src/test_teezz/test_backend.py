@@ -0,0 +1,104 @@
+import unittest
+import os
+import hashlib
+import tempfile
+
+from dep_finder.backend import LocalBackend
+from dep_finder.file_extractor import FileExtractor, FileType, ScanTask, plan_scan_tasks
+from dep_finder.file_type import *
+
+
+def _write(root, path, data: bytes):
+    local_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, "wb") as f:
+        f.write(data)
+
+
+class TestLocalBackend(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "firmware")
+        self.work_dir = os.path.join(self.tmp.name, "work")
+        _write(self.root, "system/lib64/libc.so", b"\x7fELF" + b"\0" * 60)
+        _write(self.root, "vendor/lib64/libQSEEComAPI.so", b"\x7fELF" + b"\0" * 60)
+        _write(self.root, "vendor/etc/init.rc", b"service foo /vendor/bin/foo\n")
+        _write(self.root, "system/framework/oat/arm64/services.vdex", b"vdex027\0")
+        _write(self.root, "system/app/Foo/Foo.apk", b"PK\3\4")
+        _write(self.root, "system/build.prop", b"# comment\nro.product.brand=google\n")
+        _write(self.root, "vendor/build.prop", b"ro.hardware=qcom\nro.product.brand=vendor\n")
+        self.backend = LocalBackend(self.root)
+        self.file_extractor = FileExtractor(self.work_dir, self.backend)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_get_type(self):
+        self.assertEqual(self.file_extractor.get_type("/vendor"), FileType.DIRECTORY)
+        self.assertEqual(self.file_extractor.get_type("/system/build.prop"), FileType.FILE)
+
+    def test_get_elfs(self):
+        out = self.file_extractor.get_elfs_list()
+        self.assertEqual(sorted(e.path for e in out),
+                         ["system/lib64/libc.so", "vendor/lib64/libQSEEComAPI.so"])
+        self.assertTrue(all(e.work_path == self.work_dir for e in out))
+
+    def test_get_vdexs_list(self):
+        out = self.file_extractor.get_vdexs_list()
+        self.assertEqual([v.path for v in out], ["system/framework/oat/arm64/services.vdex"])
+
+    def test_get_apks(self):
+        out = self.file_extractor.get_apks_list()
+        self.assertEqual([(a.name, a.path) for a in out], [("Foo", "system/app/Foo/Foo.apk")])
+
+    def test_getprop(self):
+        self.assertEqual(self.backend.getprop("ro.hardware"), "qcom")
+        self.assertEqual(self.backend.getprop("ro.product.brand"), "google")
+        self.assertEqual(self.backend.getprop("ro.build.fingerprint"), "")
+
+    def test_pull_files(self):
+        out = self.file_extractor.get_elfs_list()
+        self.file_extractor.collect_files(self.file_extractor._pull_files, out)
+        for elf in out:
+            self.assertTrue(os.path.isfile(os.path.join(self.work_dir, elf.path)))
+
+    def test_count_files(self):
+        counts = self.backend.count_files(["/system", "/vendor"])
+        self.assertEqual(counts, {"/system/lib64": 1, "/system/framework/oat/arm64": 1,
+                                  "/system/app/Foo": 1, "/system": 1,
+                                  "/vendor/lib64": 1, "/vendor/etc": 1, "/vendor": 1})
+        self.assertEqual(list(self.backend.find_elfs("/system", recursive=False)), [])
+        self.assertEqual(list(self.backend.find_elfs("/system/lib64", recursive=False)),
+                         ["/system/lib64/libc.so"])
+
+    def test_file_digests(self):
+        digests = self.backend.file_digests(["/system/lib64/libc.so", "/vendor", "/vendor/missing.so"])
+        self.assertEqual(digests, {"/system/lib64/libc.so": hashlib.md5(b"\x7fELF" + b"\0" * 60).hexdigest()})
+
+
+class TestScanPlan(unittest.TestCase):
+
+    def test_splits_large_roots(self):
+        counts = {"/system": 2, "/system/lib64": 400, "/system/bin": 300, "/system/app/Foo": 100,
+                  "/vendor/lib64": 150, "/odm/etc": 3}
+        tasks = plan_scan_tasks(["/system", "/vendor", "/odm", "/oem"], counts, workers=4,
+                                granularity=1, min_files=1)
+        self.assertEqual(tasks[0], ScanTask("/system/lib64", True, 400))
+        self.assertIn(ScanTask("/system", False, 2), tasks)
+        self.assertIn(ScanTask("/oem", True, 0), tasks)
+        self.assertNotIn("/system", [t.path for t in tasks if t.recursive])
+        self.assertEqual(sum(t.files for t in tasks), sum(counts.values()))
+        self.assertEqual([t.files for t in tasks], sorted((t.files for t in tasks), reverse=True))
+
+    def test_small_trees_stay_whole(self):
+        counts = {"/system/lib64": 40, "/vendor/lib64": 10}
+        self.assertEqual(plan_scan_tasks(["/system", "/vendor"], counts, workers=8),
+                         [ScanTask("/system", True, 40), ScanTask("/vendor", True, 10)])
+        self.assertEqual(plan_scan_tasks(["/system"], {}, workers=8), [ScanTask("/system", True, 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
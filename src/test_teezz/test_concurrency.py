@@ -0,0 +1,89 @@
+import unittest
+import threading
+
+from utils import metrics, profiling
+from utils.concurrency import AimdController, run_adaptive
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAimdController(unittest.TestCase):
+
+    def _simulate(self, controller, clock, capacity, rounds=300):
+        """A device serving `capacity` operations at once; more queue up."""
+        limits = []
+        for _ in range(rounds):
+            n = int(controller.limit)
+            for _ in range(n):
+                controller.acquire()
+            latency = 0.02 * max(1.0, n / capacity)
+            clock.now += latency
+            for _ in range(n):
+                controller.release(latency)
+            limits.append(controller.limit)
+        return limits
+
+    def test_converges_to_device_capacity(self):
+        for capacity in (2, 8, 24):
+            clock = FakeClock()
+            controller = AimdController(maximum=64, clock=clock)
+            limits = self._simulate(controller, clock, capacity)
+            average = sum(limits[-100:]) / 100
+            self.assertGreaterEqual(average, capacity / 2, capacity)
+            self.assertLessEqual(average, capacity * 2.5, capacity)
+
+    def test_errors_back_off(self):
+        controller = AimdController(initial=8, maximum=16)
+        for _ in range(8):
+            controller.acquire()
+        for _ in range(8):
+            controller.release(0.01, ok=False)
+        self.assertEqual(controller.limit, 4)
+        for _ in range(10):
+            for _ in range(int(controller.limit)):
+                controller.acquire()
+                controller.release(0.01, ok=False)
+        self.assertEqual(controller.limit, 1)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_run_adaptive_limits_in_flight(self):
+        controller = AimdController(initial=2, maximum=3)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def task(i):
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            with lock:
+                running[0] -= 1
+            return i * i
+
+        metrics.get_metrics().reset()
+        results = sorted(run_adaptive(task, range(50), controller, "pull"))
+        self.assertEqual(results, [i * i for i in range(50)])
+        self.assertLessEqual(running[1], 3)
+        self.assertEqual(len([t for t in metrics.get_metrics().tasks if t[0] == "pull"]), 50)
+
+    def test_worker_threads_are_profiled(self):
+        def spin_on_device(i):
+            return sum(range(1000))
+
+        profiling.enable(["cprofile"])
+        try:
+            list(run_adaptive(spin_on_device, range(20), AimdController(maximum=4), "profiled"))
+            functions = [name for _, _, name in profiling._results["profiled"]["cprofile"]]
+        finally:
+            profiling.disable()
+        self.assertIn("spin_on_device", functions)
+
+
+if __name__ == '__main__':
+    unittest.main()
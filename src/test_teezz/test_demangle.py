@@ -0,0 +1,100 @@
+import os
+import unittest
+from unittest import mock
+
+import cxxfilt
+
+from utils import metrics
+from dep_finder import demangle
+from dep_finder.dependency_finder import DependencyFinder
+
+HIDL = ("_ZN7android8hardware9keymaster4V3_016IKeymasterDevice10getServiceERKNSt3__1"
+        "12basic_stringIcNS3_11char_traitsIcEENS3_9allocatorIcEEEEb")
+HIDL_BOOL = "_ZN6vendor5synth8hardware7svc00014V1_08ISvc000110getServiceEb"
+# template arguments, needs a real demangler
+TEMPLATED = ("_ZN7android14getServiceImplINS_4hidl4base4V1_05IBaseEEENS_2spIT_EERKNSt3__1"
+             "12basic_stringIcNS9_11char_traitsIcEENS9_9allocatorIcEEEEb")
+INVALID = "_ZN3foo10getServiceX"
+
+
+class TestDemangle(unittest.TestCase):
+
+    def setUp(self) -> None:
+        demangle._cache.clear()
+        metrics.get_metrics().reset()
+        return super().setUp()
+
+    def test_nested_name(self):
+        self.assertEqual(demangle.nested_name(HIDL_BOOL),
+                         ["vendor", "synth", "hardware", "svc0001", "V1_0", "ISvc0001", "getService"])
+        self.assertIsNone(demangle.nested_name(TEMPLATED))
+        self.assertIsNone(demangle.nested_name("getService"))
+        self.assertIsNone(demangle.nested_name("_ZN3foo99"))
+
+    def test_fast_path_matches_demangler(self):
+        finder = DependencyFinder.__new__(DependencyFinder)
+        for name in (HIDL, HIDL_BOOL):
+            fast = demangle.demangle_all([name])[name]
+            full = cxxfilt.demangle(name, external_only=False)
+            self.assertTrue(full.startswith(fast))
+            self.assertEqual(finder._extract_service_data(fast.split("::")),
+                             finder._extract_service_data(full.split("::")))
+        self.assertEqual(metrics.get_metrics().counters["demangle.fast"], 2)
+
+    def test_batched_and_memoized(self):
+        names = [HIDL, TEMPLATED, INVALID, TEMPLATED]
+        out = demangle.demangle_all(names)
+        self.assertEqual(out[TEMPLATED], cxxfilt.demangle(TEMPLATED, external_only=False))
+        self.assertEqual(out[INVALID], "")
+        self.assertEqual(metrics.get_metrics().counters["demangle.batched"], 2)
+        self.assertEqual(demangle.demangle_all(names), out)
+        self.assertEqual(metrics.get_metrics().counters["demangle.batched"], 2)
+        self.assertEqual(demangle._demangle_in_process([TEMPLATED, INVALID]), [out[TEMPLATED], ""])
+
+    def test_one_cxxfilt_per_process(self):
+        demangle.stop()
+        demangle.start()
+        pipe = demangle._pipe
+        self.assertEqual(demangle.demangle_all([TEMPLATED])[TEMPLATED],
+                         cxxfilt.demangle(TEMPLATED, external_only=False))
+        self.assertEqual(demangle.demangle_all([INVALID])[INVALID], "")
+        self.assertIs(demangle._pipe, pipe)
+        self.assertIsNone(pipe.poll())
+        demangle.stop()
+        self.assertIsNotNone(pipe.poll())
+
+    def test_batches_bounded(self):
+        names = [f"_ZN7foo{i:04d}3barEv" for i in range(3000)]
+        batches = list(demangle._batches(names))
+        self.assertEqual(sum(batches, []), names)
+        self.assertTrue(all(sum(len(n) + 1 for n in b) <= demangle.CXXFILT_BATCH_BYTES for b in batches))
+        self.assertGreater(len(batches), 1)
+        demangle.stop()
+        out = demangle._run_cxxfilt(names)
+        self.assertEqual(out, [f"foo{i:04d}::bar()" for i in range(3000)])
+        demangle.stop()
+
+    def test_forked_child_starts_its_own(self):
+        demangle.start()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, b"1" if demangle._pipe is None else b"0")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b"1")
+        os.close(read)
+        os.close(write)
+        demangle.stop()
+
+    def test_falls_back_without_cxxfilt(self):
+        demangle.stop()
+        with mock.patch("shutil.which", return_value=None):
+            out = demangle.demangle_all([TEMPLATED, INVALID])
+        self.assertEqual(out, {TEMPLATED: cxxfilt.demangle(TEMPLATED, external_only=False), INVALID: ""})
+        self.assertIs(demangle._pipe, False)
+        demangle.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
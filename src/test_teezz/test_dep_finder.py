@@ -5,7 +5,11 @@ from utils.log import init_ini_log
 from dep_finder.file_type import *
 from dep_finder.dependency_finder import DependencyFinder
 
+# ID of an attached device, the test runs against it only when set
+DEVICE_ID = os.environ.get("TEEZZ_DEVICE")
 
+
+@unittest.skipUnless(DEVICE_ID, "set TEEZZ_DEVICE to the ID of an attached device")
 class TestDependencyFinderModule(unittest.TestCase):
     
     def setUp(self) -> None:
@@ -16,11 +20,12 @@ class TestDependencyFinderModule(unittest.TestCase):
         self.work_dir = "inout"
         self.dfm = DependencyFinder(work_dir="inout",
                                     target_lib="/vendor/lib64/libMcClient.so",
-                                    device_id="AAAAAAAAAAAAA")
+                                    device_id=DEVICE_ID)
         return super().setUp()
     
     def test_run(self):
         self.dfm.run()
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "deps.dot")))
     
     @unittest.skip  
     def test_build_dependency_graph_helper_elf(self):
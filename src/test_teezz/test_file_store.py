@@ -0,0 +1,110 @@
+import unittest
+import os
+import json
+import pickle
+import tempfile
+from contextlib import closing
+
+from dep_finder.file_store import FileListStore
+from dep_finder.file_type import *
+
+
+class TestFileListStore(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FileListStore(os.path.join(self.tmp.name, "files.db"))
+        self.work_dir = os.path.join(self.tmp.name, "Elf")
+        self.elfs = [Elf("libc.so", "system/lib64/libc.so", self.work_dir, arch=("AArch64", 64)),
+                     Elf("libm.so", "system/lib64/libm.so", self.work_dir),
+                     Elf("foo", "vendor/bin/foo", self.work_dir)]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_round_trip(self):
+        self.assertFalse(self.store.has(Elf))
+        self.store.replace(Elf, self.elfs, self.work_dir)
+        self.assertTrue(self.store.has(Elf))
+        self.assertFalse(self.store.has(Vdex))
+        self.assertEqual(sorted(self.store.load(Elf), key=lambda e: e.path),
+                         sorted(self.elfs, key=lambda e: e.path))
+        libc = next(e for e in self.store.iter(Elf) if e.name == "libc.so")
+        self.assertEqual(libc.arch, ("AArch64", 64))
+        self.assertEqual(len(self.store.lazy(Elf)), 3)
+
+    def test_set_archs(self):
+        self.store.replace(Elf, self.elfs, self.work_dir)
+        self.store.set_archs(Elf, {"vendor/bin/foo": ("AArch64", 64), "vendor/bin/gone": ("ARM", 32)})
+        table = self.store.load(Elf)
+        self.assertEqual(table.archs(), {"system/lib64/libc.so": ("AArch64", 64),
+                                         "vendor/bin/foo": ("AArch64", 64)})
+        self.assertEqual(len(table), 3)
+
+    def test_rows_in_one_query(self):
+        self.store.replace(Elf, self.elfs, self.work_dir)
+        statements = []
+        with closing(self.store._connect()) as db:
+            db.set_trace_callback(statements.append)
+            rows = list(self.store._rows(db, Elf))
+        self.assertEqual(sorted(path for path, _, _, _ in rows), sorted(e.path for e in self.elfs))
+        # the work path, then files and their directories together
+        self.assertEqual(len(statements), 2)
+
+    def test_apk_names(self):
+        apk = Apk("com.example.foo", "system/app/Foo/base.apk", "Apk")
+        self.store.replace(Apk, [apk], "Apk")
+        self.assertEqual(list(self.store.load(Apk)), [apk])
+
+    def test_update(self):
+        self.store.replace(Elf, self.elfs, self.work_dir)
+        rescan = self.elfs[1:] + [Elf("libnew.so", "vendor/lib64/libnew.so", self.work_dir)]
+        added, removed = self.store.update(Elf, rescan, self.work_dir)
+        self.assertEqual(added, ["vendor/lib64/libnew.so"])
+        self.assertEqual(removed, ["system/lib64/libc.so"])
+        self.assertEqual(sorted(e.path for e in self.store.iter(Elf)),
+                         sorted(e.path for e in rescan))
+
+    def test_legacy_json(self):
+        path = os.path.join(self.tmp.name, "Elf.json")
+        export_executables_to_json(self.elfs, path)
+        with open(path) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        self.store.replace(Elf, import_executables_from_json(path, Elf), self.work_dir)
+        self.assertEqual(len(self.store.lazy(Elf)), 3)
+
+
+class TestExecutableTable(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.elfs = [Elf(f"lib{i}.so", f"vendor/lib64/lib{i}.so", "/work/Elf") for i in range(100)]
+        self.elfs.append(Elf("foo", "vendor/bin/foo", "/work/Elf", arch=("AArch64", 64)))
+        self.table = ExecutableTable(Elf, self.elfs)
+        return super().setUp()
+
+    def test_items(self):
+        self.assertEqual(len(self.table), 101)
+        self.assertEqual(list(self.table), self.elfs)
+        self.assertEqual(self.table[-1].arch, ("AArch64", 64))
+        self.assertEqual(self.table[1:3], self.elfs[1:3])
+        self.assertEqual(self.table.name(5), "lib5.so")
+        self.assertIs(ExecutableTable.of(Elf, self.table), self.table)
+        with self.assertRaises(IndexError):
+            self.table[101]
+
+    def test_names_and_work_paths(self):
+        apks = ExecutableTable(Apk, [Apk("com.example.foo", "system/app/Foo/base.apk", "/work/Apk"),
+                                     Apk("Bar", "system/app/Bar/Bar.apk", "/work/Apk2")])
+        self.assertEqual([a.name for a in apks], ["com.example.foo", "Bar"])
+        self.assertEqual([a.work_path for a in apks], ["/work/Apk", "/work/Apk2"])
+
+    def test_pickle_is_smaller(self):
+        table = pickle.loads(pickle.dumps(self.table))
+        self.assertEqual(list(table), self.elfs)
+        self.assertLess(len(pickle.dumps(self.table)), len(pickle.dumps(self.elfs)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import time
+import random
+import tempfile
+
+from dep_finder.graph_store import GraphStore
+from dep_finder.graph_diff import diff_builds
+
+TARGET = "vendor/lib64/libQSEEComAPI.so"
+# seconds a diff of 100k edges may take, checked with TEEZZ_PERF=1
+LARGE_DIFF_BUDGET = 1.0
+
+
+class TestGraphDiff(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = GraphStore(os.path.join(self.tmp.name, "graph.db"))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_diff(self):
+        self.store.replace("old", None, {
+            "vendor/bin/qseecomd": [TARGET, "system/lib64/libc.so"],
+            "vendor/lib64/libdrm.so": [TARGET],
+            "vendor/bin/drmserver": ["vendor/lib64/libdrm.so"],
+            "system/bin/gone": ["system/lib64/libc.so"],
+            "vendor/bin/static_gone": [],
+        })
+        self.store.replace("new", None, {
+            "vendor/bin/qseecomd": [TARGET, "system/lib64/libc.so"],
+            "vendor/lib64/libdrm.so": ["system/lib64/libc.so"],
+            "vendor/bin/drmserver": ["vendor/lib64/libdrm.so"],
+            "vendor/bin/keymaster": [TARGET],
+            "vendor/bin/static": [],
+        })
+        diff = diff_builds(self.store, "old", "new", TARGET)
+        self.assertEqual(diff.added_nodes, ["vendor/bin/keymaster", "vendor/bin/static"])
+        self.assertEqual(diff.removed_nodes, ["system/bin/gone", "vendor/bin/static_gone"])
+        self.assertEqual(diff.added_edges, [("vendor/bin/keymaster", TARGET),
+                                            ("vendor/lib64/libdrm.so", "system/lib64/libc.so")])
+        self.assertEqual(diff.removed_edges, [("system/bin/gone", "system/lib64/libc.so"),
+                                              ("vendor/lib64/libdrm.so", TARGET)])
+        self.assertEqual(diff.closure_added, ["vendor/bin/keymaster"])
+        self.assertEqual(diff.closure_removed, ["vendor/bin/drmserver", "vendor/lib64/libdrm.so"])
+        self.assertEqual(diff.closure_edges, [("vendor/bin/drmserver", "vendor/lib64/libdrm.so")])
+        self.assertNotIn("closure_edges", diff.to_json())
+        dot = diff.to_dot()
+        self.assertIn('"vendor/bin/keymaster" -> "{}" [color=green];'.format(TARGET), dot)
+        self.assertIn('"vendor/lib64/libdrm.so" -> "{}" [color=red, style=dashed];'.format(TARGET), dot)
+        with self.assertRaises(KeyError):
+            diff_builds(self.store, "old", "missing")
+
+    def test_closure_skips_libc(self):
+        # like a run, the closure neither holds libc nor reaches its users through it
+        libc = "system/lib64/libc.so"
+        self.store.replace("old", None, {TARGET: [libc], "vendor/bin/a": [TARGET]})
+        self.store.replace("new", None, {TARGET: [], libc: [TARGET], "vendor/bin/a": [TARGET],
+                                         "vendor/bin/b": [libc]})
+        diff = diff_builds(self.store, "old", "new", TARGET)
+        self.assertEqual(diff.closure_added, [])
+        self.assertEqual(diff.closure_removed, [])
+        self.assertEqual(diff_builds(self.store, "old", "new", libc).closure_added, [])
+
+    def test_large_diff(self):
+        rng = random.Random(0)
+        paths = [f"vendor/lib64/lib{i:06d}.so" for i in range(20000)]
+        edges = dict((path, rng.sample(paths[:i], min(5, i))) for i, path in enumerate(paths))
+        self.store.replace("old", None, edges)
+        for path in rng.sample(paths, 1000):
+            edges[path] = rng.sample(paths, 5)
+        self.store.replace("new", None, edges)
+        start = time.perf_counter()
+        diff = diff_builds(self.store, "old", "new", paths[0])
+        elapsed = time.perf_counter() - start
+        changed = set(r for r, _ in diff.added_edges) | set(r for r, _ in diff.removed_edges)
+        self.assertLessEqual(len(changed), 1000)
+        self.assertGreater(len(diff.added_edges), 4000)
+        self.assertEqual(diff.added_nodes, [])
+        if os.environ.get("TEEZZ_PERF"):
+            self.assertLess(elapsed, LARGE_DIFF_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import unittest
+import os
+import shutil
+import stat
+import struct
+import subprocess
+import tempfile
+import hashlib
+from unittest import mock
+
+from dep_finder.backend import ImageBackend
+from dep_finder.file_extractor import FileExtractor, FileType
+from dep_finder.image_reader import *
+from utils import metrics
+
+BLOCK_SIZE = 4096
+EROFS_COMPRESSED_FULL = 1
+FILES = {
+    "lib64/libc.so": b"\x7fELF" + bytes(range(256)) * 40,
+    "lib64/libutils.so": b"\x7fELF" + b"\1" * 5000,
+    "bin/servicemanager": b"\x7fELF" + b"\2" * 100,
+    "etc/init.rc": b"on boot\n",
+    "etc/fill.bin": b"\5" * 3 * BLOCK_SIZE,
+    "build.prop": b"ro.hardware=qcom\nro.build.fingerprint=test/fp\n",
+}
+SYMLINKS = {
+    "lib": "lib64",
+    "bin/libc_link": "/system/lib64/libc.so",
+}
+
+
+def write_sparse(raw_path: str, sparse_path: str, block_size: int = BLOCK_SIZE):
+    """Converts `raw_path` into an Android sparse image using all chunk types."""
+    with open(raw_path, "rb") as f:
+        data = f.read()
+    blocks = [data[i:i + block_size].ljust(block_size, b"\0")
+              for i in range(0, len(data), block_size)]
+    runs = []
+    for block in blocks:
+        if block == b"\0" * block_size:
+            kind, payload = CHUNK_TYPE_DONT_CARE, b""
+        elif block == block[:4] * (block_size // 4):
+            kind, payload = CHUNK_TYPE_FILL, block[:4]
+        else:
+            kind, payload = CHUNK_TYPE_RAW, block
+        if runs and runs[-1][0] == kind and (kind != CHUNK_TYPE_FILL or runs[-1][2] == payload):
+            runs[-1][1] += 1
+            if kind == CHUNK_TYPE_RAW:
+                runs[-1][2] += payload
+        else:
+            runs.append([kind, 1, payload])
+    with open(sparse_path, "wb") as f:
+        f.write(SPARSE_HEADER.pack(SPARSE_HEADER_MAGIC, 1, 0, SPARSE_HEADER.size,
+                                   SPARSE_CHUNK_HEADER.size, block_size, len(blocks),
+                                   len(runs) + 1, 0))
+        for kind, count, payload in runs:
+            f.write(SPARSE_CHUNK_HEADER.pack(kind, 0, count, SPARSE_CHUNK_HEADER.size + len(payload)))
+            f.write(payload)
+        f.write(SPARSE_CHUNK_HEADER.pack(CHUNK_TYPE_CRC32, 0, 0, SPARSE_CHUNK_HEADER.size + 4))
+        f.write(b"\0" * 4)
+
+
+def write_erofs(files: dict, symlinks: dict, path: str, compressed=()):
+    """Writes a minimal uncompressed erofs image. The first regular file
+    uses the inline tail layout, everything else is flat; the files in
+    `compressed` only claim a compressed layout."""
+    nodes = {"": ("d", None)}
+    for name, data in files.items():
+        nodes[name] = ("f", data)
+    for name, target in symlinks.items():
+        nodes[name] = ("l", target.encode())
+    for name in list(nodes):
+        parent = os.path.dirname(name)
+        while name and parent not in nodes:
+            nodes[parent] = ("d", None)
+            parent = os.path.dirname(parent)
+    order = sorted(nodes, key=lambda n: (nodes[n][0] != "f", n))
+    inline_name = order[0]
+    inline_tail = len(files[inline_name]) % BLOCK_SIZE
+    nids, slot = {}, 0
+    for name in order:
+        nids[name] = slot
+        slot += 1 + ((inline_tail + 31) // 32 if name == inline_name else 0)
+    data_block = 1 + (slot * 32 + BLOCK_SIZE - 1) // BLOCK_SIZE
+    meta = bytearray(slot * 32)
+    blocks = bytearray()
+    for name in order:
+        kind, data = nodes[name]
+        if kind == "d":
+            children = sorted(n for n in nodes if n and os.path.dirname(n) == name)
+            entries = [(".", nids[name], FT_DIR), ("..", nids[os.path.dirname(name)], FT_DIR)]
+            entries += [(os.path.basename(c), nids[c],
+                         {"f": FT_REG_FILE, "d": FT_DIR, "l": FT_SYMLINK}[nodes[c][0]])
+                        for c in children]
+            entries.sort()
+            nameoff = 12 * len(entries)
+            head, names = b"", b""
+            for entry_name, nid, ftype in entries:
+                head += struct.pack("<QHBB", nid, nameoff + len(names), ftype, 0)
+                names += entry_name.encode()
+            data = head + names
+            mode = stat.S_IFDIR | 0o755
+        else:
+            mode = (stat.S_IFREG | 0o644) if kind == "f" else (stat.S_IFLNK | 0o777)
+        layout = EROFS_FLAT_INLINE if name == inline_name else EROFS_FLAT_PLAIN
+        if name in compressed:
+            layout = EROFS_COMPRESSED_FULL
+        blkaddr = data_block + len(blocks) // BLOCK_SIZE
+        body = data[:len(data) - inline_tail] if layout == EROFS_FLAT_INLINE else data
+        blocks += body + b"\0" * (-len(body) % BLOCK_SIZE)
+        offset = nids[name] * 32
+        meta[offset:offset + 32] = struct.pack("<HHHHIIIIHHI", layout << 1, 0, mode, 1,
+                                                len(data), 0, blkaddr, nids[name], 0, 0, 0)
+        if layout == EROFS_FLAT_INLINE:
+            meta[offset + 32:offset + 32 + inline_tail] = data[len(data) - inline_tail:]
+    image = bytearray(BLOCK_SIZE)
+    image[1024:1024 + 48] = struct.pack("<IIIBBHQQIIII", EROFS_MAGIC, 0, 0, 12, 0, nids[""],
+                                        len(nodes), 0, 0, data_block + len(blocks) // BLOCK_SIZE, 1, 0)
+    image += meta + b"\0" * (-len(meta) % BLOCK_SIZE)
+    image += blocks
+    with open(path, "wb") as f:
+        f.write(image)
+
+
+class TestImageReader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tree = os.path.join(self.tmp.name, "tree")
+        for name, data in FILES.items():
+            os.makedirs(os.path.join(self.tree, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.tree, name), "wb") as f:
+                f.write(data)
+        for name, target in SYMLINKS.items():
+            os.symlink(target, os.path.join(self.tree, name))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _mke2fs(self, fs_type: str, block_size: int = BLOCK_SIZE) -> str:
+        if shutil.which("mke2fs") is None:
+            self.skipTest("mke2fs not available")
+        path = os.path.join(self.tmp.name, f"{fs_type}-{block_size}.img")
+        subprocess.run(["mke2fs", "-q", "-t", fs_type, "-b", str(block_size),
+                        "-d", self.tree, path, "4M"], check=True, capture_output=True)
+        return path
+
+    def _check_reader(self, reader: FsReader):
+        root = reader.listdir(reader.root)
+        self.assertEqual(root["lib64"].kind, "d")
+        self.assertEqual(root["lib"].kind, "l")
+        self.assertEqual(reader.readlink(root["lib"].node), "lib64")
+        for name, data in FILES.items():
+            entry = root
+            for part in name.split("/")[:-1]:
+                entry = reader.listdir(entry[part].node)
+            node = entry[name.split("/")[-1]].node
+            self.assertEqual(reader.file_size(node), len(data))
+            self.assertEqual(reader.read(node, 0, len(data)), data)
+            self.assertEqual(reader.read(node, 3, 1000), data[3:1003])
+
+    def test_ext4(self):
+        self._check_reader(open_filesystem(self._mke2fs("ext4")))
+
+    def test_ext2_block_map(self):
+        self._check_reader(open_filesystem(self._mke2fs("ext2", 1024)))
+
+    def test_sparse_ext4(self):
+        raw = self._mke2fs("ext4")
+        sparse = os.path.join(self.tmp.name, "sparse.img")
+        write_sparse(raw, sparse)
+        self.assertLess(os.path.getsize(sparse), os.path.getsize(raw))
+        reader = open_filesystem(sparse)
+        self.assertIsInstance(reader.image, SparseImage)
+        self._check_reader(reader)
+
+    def test_erofs(self):
+        path = os.path.join(self.tmp.name, "erofs.img")
+        write_erofs(FILES, SYMLINKS, path)
+        reader = open_filesystem(path)
+        self.assertIsInstance(reader, ErofsReader)
+        self._check_reader(reader)
+
+    def test_image_backend(self):
+        system = os.path.join(self.tmp.name, "system.img")
+        write_sparse(self._mke2fs("ext4"), system)
+        write_erofs({"lib64/libQSEEComAPI.so": b"\x7fELF" + b"\3" * 64,
+                     "build.prop": b"ro.hardware=vendorhw\nro.product.brand=acme\n"},
+                    {}, os.path.join(self.tmp.name, "vendor.img"))
+        backend = ImageBackend([system, os.path.join(self.tmp.name, "vendor.img")])
+        self.assertEqual(backend.list_root(), ["/system", "/vendor"])
+        self.assertEqual(backend.getprop("ro.hardware"), "qcom")
+        self.assertEqual(backend.getprop("ro.product.brand"), "acme")
+
+        work_dir = os.path.join(self.tmp.name, "work")
+        file_extractor = FileExtractor(work_dir, backend)
+        self.assertEqual(file_extractor.get_type("/system/lib"), FileType.DIRECTORY)
+        elfs = file_extractor.get_elfs_list()
+        self.assertEqual(sorted(e.path for e in elfs),
+                         ["system/bin/servicemanager", "system/lib64/libc.so",
+                          "system/lib64/libutils.so", "vendor/lib64/libQSEEComAPI.so"])
+        file_extractor.collect_files(file_extractor._pull_files, elfs)
+        with open(os.path.join(work_dir, "system/lib64/libc.so"), "rb") as f:
+            self.assertEqual(f.read(), FILES["lib64/libc.so"])
+        self.assertEqual(backend._read("/system/bin/libc_link", 4), b"\x7fELF")
+        with mock.patch.object(ImageBackend, "PULL_CHUNK_SIZE", BLOCK_SIZE):
+            digests = backend.file_digests(["/system/lib64/libc.so", "/system/etc/fill.bin", "/system/lib64",
+                                            "/system/missing"])
+        self.assertEqual(digests, {"/system/lib64/libc.so": hashlib.md5(FILES["lib64/libc.so"]).hexdigest(),
+                                   "/system/etc/fill.bin": hashlib.md5(FILES["etc/fill.bin"]).hexdigest()})
+        backend.close()
+
+    def test_compressed_erofs_reported(self):
+        vendor = os.path.join(self.tmp.name, "vendor.img")
+        write_erofs(FILES, {}, vendor, compressed=("lib64/libutils.so", "bin/servicemanager"))
+        backend = ImageBackend([vendor])
+        metrics.get_metrics().reset()
+        with self.assertLogs(backend.logger, "WARNING") as logs:
+            elfs = list(backend.find_elfs("/vendor"))
+        self.assertEqual(elfs, ["/vendor/lib64/libc.so"])
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(vendor, logs.output[0])
+        self.assertEqual(metrics.get_metrics().counters["image.unsupported_files"], 2)
+        backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
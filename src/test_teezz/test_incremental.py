@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+
+from utils import metrics
+from dep_finder.graph_store import GraphStore
+from bench_teezz.runner import BenchDependencyFinder
+from bench_teezz.synth import FirmwareSpec, TARGET_LIB, build_elf, generate_firmware
+
+
+class TestGraphStore(unittest.TestCase):
+
+    def test_copy_and_patch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = GraphStore(os.path.join(tmp, "graph.db"))
+            store.replace("build/1", "c1", {"bin/a": ["lib/x.so", "lib/y.so"], "lib/x.so": ["lib/y.so"]})
+            store.copy("build/1", "build/2", "c1")
+            store.patch("build/2", {"bin/b": ["lib/x.so"], "bin/c": []}, removed=["bin/a"])
+            store.close()
+            store = GraphStore(os.path.join(tmp, "graph.db"))
+            self.assertEqual([fingerprint for fingerprint, _ in store.builds()], ["build/1", "build/2"])
+            self.assertEqual(store.edges("build/1"), {"bin/a": ["lib/x.so", "lib/y.so"], "lib/x.so": ["lib/y.so"]})
+            self.assertEqual(store.edges("build/2"), {"bin/b": ["lib/x.so"], "lib/x.so": ["lib/y.so"]})
+            self.assertEqual(sorted(store.paths()[i] for i in store.node_ids("build/2")),
+                             ["bin/b", "bin/c", "lib/x.so", "lib/y.so"])
+            self.assertEqual(store.config("build/2"), "c1")
+            self.assertFalse(store.has("build/3"))
+            store.close()
+
+
+class TestIncrementalRun(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = generate_firmware(self.tmp.name, FirmwareSpec.from_scale(30))
+        self.root = self.manifest["root"]
+        self.work_dir = os.path.join(self.tmp.name, "work")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _run(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=TARGET_LIB,
+                                       local_root=self.root, incremental=True)
+        finder.run()
+        return finder, metrics.get_metrics().summary()["counters"]
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(os.path.join(self.root, path)), exist_ok=True)
+        with open(os.path.join(self.root, path), "wb") as f:
+            f.write(data)
+
+    def test_new_build_patches_graph(self):
+        self._run()
+        closure = set(self.manifest["expected_closure"])
+        bins = [p for p in self.manifest["elfs"] if "/bin/" in p]
+        changed, removed = [p for p in bins if p in closure][:2]
+        self._write(changed, build_elf(["libc.so"], os.path.basename(changed)))
+        self._write("vendor/bin/synth_added", build_elf([os.path.basename(TARGET_LIB), "libc.so"], "synth_added"))
+        os.remove(os.path.join(self.root, removed))
+        with open(os.path.join(self.root, "system/build.prop"), "r+") as f:
+            build_prop = f.read().replace("SYN.0/1", "SYN.0/2")
+            f.seek(0)
+            f.write(build_prop)
+
+        finder, counters = self._run()
+        self.assertEqual(counters["elf.parsed"], 2)
+        # the added file has no digest from the previous build
+        self.assertEqual(counters["incremental.changed"], 2)
+        self.assertEqual(set(finder.dependencies), closure - {changed, removed} | {"vendor/bin/synth_added"})
+        graph = GraphStore(os.path.join(self.work_dir, "graph.db"))
+        self.assertEqual(len(graph.builds()), 2)
+        self.assertNotIn(removed, graph.edges(finder.fingerprint))
+        graph.close()
+
+    def test_unchanged_build_reuses_everything(self):
+        first, _ = self._run()
+        second, counters = self._run()
+        self.assertNotIn("elf.parsed", counters)
+        self.assertEqual(counters["graph.patched_nodes"], 0)
+        self.assertEqual(second.dependencies, first.dependencies)
+
+
+if __name__ == '__main__':
+    unittest.main()
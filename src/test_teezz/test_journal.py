@@ -0,0 +1,91 @@
+import unittest
+import os
+import tempfile
+
+from utils import metrics
+from dep_finder.journal import RunJournal
+from bench_teezz.runner import BenchDependencyFinder
+from bench_teezz.synth import FirmwareSpec, generate_firmware
+
+
+class TestRunJournal(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "journal.db")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_items_survive_restart(self):
+        journal = RunJournal(self.path)
+        self.assertFalse(journal.open_run("build/1"))
+        journal.record("elf_analysis", "system/lib64/libc.so", [])
+        journal.record("elf_analysis", "vendor/bin/foo", ["libc.so"])
+        journal.fail("elf_analysis", "vendor/bin/bar", "ELFError: bad magic")
+        journal.complete("pull:Elf")
+        journal.close()
+
+        journal = RunJournal(self.path)
+        self.assertTrue(journal.open_run("build/1"))
+        self.assertTrue(journal.is_complete("pull:Elf"))
+        self.assertFalse(journal.is_complete("elf_analysis"))
+        self.assertEqual(journal.results("elf_analysis"),
+                         {"system/lib64/libc.so": [], "vendor/bin/foo": ["libc.so"]})
+        self.assertEqual(journal.failures("elf_analysis"), [("vendor/bin/bar", "ELFError: bad magic")])
+        journal.reopen("pull:Elf")
+        self.assertFalse(journal.is_complete("pull:Elf"))
+        journal.close()
+
+    def test_other_build_starts_over(self):
+        journal = RunJournal(self.path)
+        journal.open_run("build/1")
+        journal.complete("pull:Elf")
+        self.assertFalse(journal.open_run("build/2"))
+        self.assertFalse(journal.is_complete("pull:Elf"))
+        journal.close()
+
+
+class TestResume(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = generate_firmware(self.tmp.name, FirmwareSpec.from_scale(30))
+        self.work_dir = os.path.join(self.tmp.name, "work")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _run(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=self.manifest["target"],
+                                       local_root=self.manifest["root"])
+        finder.run()
+        return finder, metrics.get_metrics().summary()["counters"]
+
+    def test_failed_items_are_retried(self):
+        elf = next(p for p in self.manifest["elfs"] if "/lib64/libsynth" in p)
+        # a corrupt copy from an earlier run: analysing it fails
+        broken = os.path.join(self.work_dir, "Elf", elf)
+        os.makedirs(os.path.dirname(broken))
+        with open(broken, "wb") as f:
+            f.write(b"\x7fELF truncated")
+        self._run()
+        journal = RunJournal(os.path.join(self.work_dir, "journal.db"))
+        self.assertEqual([path for path, _ in journal.failures("elf_analysis")], [elf])
+        self.assertFalse(journal.is_complete("elf_analysis"))
+        journal.close()
+
+        os.unlink(broken)
+        os.link(os.path.join(self.manifest["root"], elf), broken)
+        second, counters = self._run()
+        self.assertEqual(counters["journal.resumed_items"], len(self.manifest["elfs"]) - 1)
+        self.assertEqual(counters["elf.parsed"], 1)
+        self.assertNotIn("pull.files", counters)
+        self.assertEqual(set(second.dependencies), set(self.manifest["expected_closure"]))
+
+if __name__ == '__main__':
+    unittest.main()
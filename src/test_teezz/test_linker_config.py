@@ -0,0 +1,144 @@
+import unittest
+import os
+import logging
+import tempfile
+import dataclasses
+
+from utils import metrics
+from bench_teezz.runner import BenchDependencyFinder
+from bench_teezz.synth import HW_SERVICE, TARGET_LIB, FirmwareSpec, generate_firmware
+from dep_finder.backend import LocalBackend
+from dep_finder.dependency_finder import DependencyFinder
+from dep_finder.file_type import Elf, ExecutableTable
+from dep_finder.linker_config import LibraryResolver, load_linker_configs, parse_ld_config
+
+LD_CONFIG = """
+# Android 10 style
+dir.system = /system/bin/
+dir.vendor = /vendor/bin/
+dir.vendor = /odm/bin/
+
+[system]
+additional.namespaces = sphal,vndk
+namespace.default.isolated = true
+namespace.default.search.paths = /system/${LIB}
+namespace.default.links = sphal
+namespace.default.link.sphal.shared_libs = libvendorapi.so
+namespace.sphal.search.paths = /odm/${LIB}
+namespace.sphal.search.paths += /vendor/${LIB}
+namespace.sphal.links = default,vndk
+namespace.sphal.link.default.shared_libs = libc.so:libm.so
+namespace.vndk.search.paths = /system/${LIB}/vndk-sp-${VNDK_VER}
+
+[vendor]
+additional.namespaces = system
+namespace.default.search.paths = /odm/${LIB}:/vendor/${LIB}
+namespace.default.links = system
+namespace.default.link.system.shared_libs = libc.so:libm.so
+namespace.system.search.paths = /system/${LIB}
+"""
+
+PATHS = [
+    "system/bin/surfaceflinger",
+    "system/lib64/libc.so",
+    "system/lib64/libm.so",
+    "system/lib64/libutils.so",
+    "system/lib64/vndk-sp-29/libutils.so",
+    "vendor/bin/qseecomd",
+    "vendor/lib64/libQSEEComAPI.so",
+    "vendor/lib64/libvendorapi.so",
+    "vendor/lib64/libutils.so",
+]
+
+
+class TestLinkerConfig(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.config = parse_ld_config(LD_CONFIG, {"LIB": "lib64", "VNDK_VER": "29"})
+        self.resolver = LibraryResolver(PATHS, {"": self.config})
+        return super().setUp()
+
+    def test_parse(self):
+        self.assertEqual(self.config.section_of("/odm/bin/"), "vendor")
+        self.assertIsNone(self.config.section_of("/product/bin/"))
+        sphal = self.config.sections["system"]["sphal"]
+        self.assertEqual(sphal.search_paths, ["/odm/lib64", "/vendor/lib64"])
+        self.assertEqual([link.target for link in sphal.links], ["default", "vndk"])
+        self.assertEqual(sphal.links[0].shared_libs, {"libc.so", "libm.so"})
+        self.assertEqual(self.config.sections["system"]["vndk"].search_paths, ["/system/lib64/vndk-sp-29"])
+
+    def test_namespaces(self):
+        # vendor binaries get vendor libraries, and from system only what the link shares
+        self.assertEqual(self.resolver.resolve("vendor/bin/qseecomd", "libutils.so"), "vendor/lib64/libutils.so")
+        self.assertEqual(self.resolver.resolve("vendor/bin/qseecomd", "libc.so"), "system/lib64/libc.so")
+        self.assertEqual(self.resolver.resolve("vendor/lib64/libQSEEComAPI.so", "libm.so"), "system/lib64/libm.so")
+        self.assertEqual(self.resolver.resolve("system/bin/surfaceflinger", "libutils.so"),
+                         "system/lib64/libutils.so")
+        self.assertEqual(self.resolver.resolve("system/bin/surfaceflinger", "libvendorapi.so"),
+                         "vendor/lib64/libvendorapi.so")
+        # not shared with the system namespace
+        self.assertIsNone(self.resolver.resolve("system/bin/surfaceflinger", "libQSEEComAPI.so"))
+        self.assertEqual(self.resolver.resolve("system/bin/surfaceflinger", "/vendor/lib64/libQSEEComAPI.so"),
+                         "vendor/lib64/libQSEEComAPI.so")
+
+    def test_default_search_paths(self):
+        resolver = LibraryResolver(PATHS)
+        self.assertEqual(resolver.resolve("vendor/bin/qseecomd", "libutils.so"), "system/lib64/libutils.so")
+        self.assertEqual(resolver.resolve("system/bin/surfaceflinger", "libQSEEComAPI.so"),
+                         "vendor/lib64/libQSEEComAPI.so")
+
+    def test_unbound_names_without_fallback(self):
+        finder = DependencyFinder.__new__(DependencyFinder)
+        finder.logger = logging.getLogger("depFinderLogger")
+        elf_list = ExecutableTable(Elf, [Elf(os.path.basename(p), p, "Elf") for p in PATHS])
+        results = [("system/bin/surfaceflinger", ["libc.so", "libQSEEComAPI.so"])]
+        needed = {"system/bin/surfaceflinger": ["libc.so", "libQSEEComAPI.so"]}
+        metrics.get_metrics().reset()
+        edges = finder._resolve_edges(results, elf_list, self.resolver, needed)
+        self.assertEqual(edges, {"system/bin/surfaceflinger": ["system/lib64/libc.so"]})
+        self.assertEqual(metrics.get_metrics().counters["linker.unbound"], 1)
+        self.assertEqual(metrics.get_metrics().counters["linker.fallbacks"], 0)
+        # without a configuration any library of that name is taken
+        elf_list = ExecutableTable(Elf, [Elf("libvendorapi.so", "vendor/lib64/hw/libvendorapi.so", "Elf")])
+        edges = finder._resolve_edges([("system/bin/surfaceflinger", ["libvendorapi.so"])], elf_list,
+                                      LibraryResolver(elf_list.paths), {})
+        self.assertEqual(edges, {"system/bin/surfaceflinger": ["vendor/lib64/hw/libvendorapi.so"]})
+
+    def test_dlopen_names_fall_back(self):
+        # names from strings are loaded from `hw/`, outside every namespace
+        finder = DependencyFinder.__new__(DependencyFinder)
+        finder.logger = logging.getLogger("depFinderLogger")
+        paths = PATHS + ["vendor/lib64/hw/keystore.msm8998.so"]
+        elf_list = ExecutableTable(Elf, [Elf(os.path.basename(p), p, "Elf") for p in paths])
+        results = [("vendor/bin/qseecomd", ["libc.so", "keystore.msm8998.so"])]
+        edges = finder._resolve_edges(results, elf_list, LibraryResolver(paths, {"": self.config}),
+                                      {"vendor/bin/qseecomd": ["libc.so"]})
+        self.assertEqual(edges, {"vendor/bin/qseecomd": ["system/lib64/libc.so",
+                                                         "vendor/lib64/hw/keystore.msm8998.so"]})
+
+    def test_synthetic_run_keeps_hw_modules(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spec = dataclasses.replace(FirmwareSpec.from_scale(30), linker_config=True)
+            manifest = generate_firmware(tmp, spec)
+            finder = BenchDependencyFinder(work_dir=os.path.join(tmp, "work"), target_lib=TARGET_LIB,
+                                           local_root=manifest["root"])
+            finder.run()
+        self.assertEqual(list(finder.linker_configs), [""])
+        self.assertIn(HW_SERVICE, finder.dependencies)
+        self.assertEqual(set(finder.dependencies), set(manifest["expected_closure"]))
+
+    def test_load_from_tree(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "system/etc"))
+            os.makedirs(os.path.join(root, "vendor"))
+            with open(os.path.join(root, "system/etc/ld.config.29.txt"), "w") as f:
+                f.write(LD_CONFIG)
+            with open(os.path.join(root, "vendor/build.prop"), "w") as f:
+                f.write("ro.vndk.version=29\n")
+            configs = load_linker_configs(LocalBackend(root))
+        self.assertEqual(list(configs), [""])
+        self.assertEqual(configs[""].sections["system"]["vndk"].search_paths, ["/system/lib64/vndk-sp-29"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import os
+import logging
+import tempfile
+import multiprocessing
+
+from utils.log import RateLimitFilter, get_logger, init_queue_log, stop_queue_log
+
+LOGGER_NAME = "queueTestLogger"
+
+
+def _log_from_worker(n):
+    logger = get_logger(LOGGER_NAME)
+    for i in range(20):
+        logger.debug("hot path %d/%d", n, i)
+    logger.info("worker %d done", n)
+    return n
+
+
+class TestQueueLog(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmp.name, "test.log")
+        self.handler = logging.FileHandler(self.log_file)
+        self.handler.setFormatter(logging.Formatter("%(process)d %(levelname)s %(message)s"))
+        self.logger = get_logger(LOGGER_NAME)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        stop_queue_log()
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _lines(self):
+        with open(self.log_file) as f:
+            return f.read().splitlines()
+
+    def test_workers_log_through_listener(self):
+        init_queue_log(names=[LOGGER_NAME])
+        self.assertNotIn(self.handler, self.logger.handlers)
+        with multiprocessing.Pool(2) as p:
+            p.map(_log_from_worker, range(4))
+        stop_queue_log()
+        self.assertIn(self.handler, self.logger.handlers)
+        lines = self._lines()
+        self.assertEqual(sum("done" in l for l in lines), 4)
+        self.assertEqual(sum("hot path" in l for l in lines), 80)
+
+    def test_debug_rate_limit(self):
+        init_queue_log(debug_rate=5, names=[LOGGER_NAME])
+        _log_from_worker(0)
+        stop_queue_log()
+        lines = self._lines()
+        self.assertEqual(sum("hot path" in l for l in lines), 5)
+        self.assertEqual(sum("done" in l for l in lines), 1)
+
+    def test_rate_limit_reports_suppressed(self):
+        rate_filter = RateLimitFilter(1)
+        records = [logging.LogRecord(LOGGER_NAME, logging.DEBUG, "f.py", 1, "msg", None, None)
+                   for _ in range(3)]
+        self.assertEqual([rate_filter.filter(r) for r in records], [True, False, False])
+        rate_filter._sites[("f.py", 1)][0] -= 1.0
+        record = logging.LogRecord(LOGGER_NAME, logging.DEBUG, "f.py", 1, "msg", None, None)
+        self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(record.getMessage(), "msg [2 similar records suppressed]")
+
+
+if __name__ == '__main__':
+    unittest.main()
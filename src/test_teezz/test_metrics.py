@@ -0,0 +1,77 @@
+import unittest
+import os
+import json
+import tempfile
+import multiprocessing
+import pstats
+
+from utils import metrics, profiling
+
+
+def _task(n):
+    metrics.count("test.items")
+    metrics.count("test.bytes", n)
+    return n * 2
+
+
+class TestMetricsModule(unittest.TestCase):
+
+    def setUp(self) -> None:
+        metrics.get_metrics().reset()
+        return super().setUp()
+
+    def test_pool_tasks_are_merged(self):
+        metrics.get_metrics().record_pool("work", 2)
+        with metrics.span("work"), multiprocessing.Pool(2) as p:
+            out = [metrics.collect(packed)
+                   for packed in p.map(metrics.instrument(_task, "work"), range(10))]
+        self.assertEqual(out, [n * 2 for n in range(10)])
+        summary = metrics.get_metrics().summary()
+        self.assertEqual(summary["counters"], {"test.bytes": 45, "test.items": 10})
+        self.assertEqual(summary["phases"]["work"]["tasks"], 10)
+        self.assertEqual(summary["phases"]["work"]["workers"], 2)
+        self.assertIn("utilization", summary["phases"]["work"])
+
+    def test_reports(self):
+        with metrics.span("phase"):
+            metrics.count("adb.commands", 3)
+        table = metrics.get_metrics().format_table()
+        self.assertIn("phase", table)
+        self.assertIn("adb.commands", table)
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.get_metrics().write_json(os.path.join(tmp, "metrics.json"))
+            metrics.get_metrics().write_trace(os.path.join(tmp, "trace.json"))
+            with open(os.path.join(tmp, "trace.json")) as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["phase"])
+        self.assertEqual(events[0]["ph"], "X")
+
+
+class TestProfilingModule(unittest.TestCase):
+
+    def setUp(self) -> None:
+        metrics.get_metrics().reset()
+        profiling.enable(["cprofile", "sample", "memory"], sample_interval=0.001)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        profiling.disable()
+        return super().tearDown()
+
+    def test_worker_profiles_are_merged(self):
+        with multiprocessing.Pool(2) as p:
+            for packed in p.map(metrics.instrument(_task, "work"), range(10)):
+                metrics.collect(packed)
+        with tempfile.TemporaryDirectory() as tmp:
+            summary = profiling.write_reports(tmp)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "work.pstats")))
+            self.assertTrue(os.path.exists(os.path.join(tmp, "summary.txt")))
+            stats = pstats.Stats(os.path.join(tmp, "work.pstats"))
+        calls = {func[2]: value[1] for func, value in stats.stats.items()}
+        self.assertEqual(calls["_task"], 10)
+        self.assertIn("== work ==", summary)
+        self.assertIn("peak traced memory", summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
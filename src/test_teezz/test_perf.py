@@ -0,0 +1,62 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_baseline.json")
+# ELF files of the generated firmware
+PERF_SCALE = 100
+# allowed regression against the baseline; the rate and RSS depend on the machine and
+# are only checked with TEEZZ_PERF=1, on the machine that recorded the baseline
+ADB_CALLS_SLACK = 1.1
+PARSE_RATE_FLOOR = 0.5
+PEAK_RSS_SLACK = 1.5
+
+
+class TestPerformance(unittest.TestCase):
+    """Full `DependencyFinder` runs on synthetic firmware through the fake
+    adb, checked against the expected graph and `perf_baseline.json`.
+    `TEEZZ_UPDATE_BASELINE=1` records a new baseline instead."""
+
+    def _bench(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "bench.json")
+            env = dict(os.environ, PYTHONPATH=SRC_DIR)
+            proc = subprocess.run([sys.executable, "-m", "bench_teezz", "--scales", str(PERF_SCALE),
+                                   "--backend", "adb", "--log_level", "ERROR", "-o", output],
+                                  env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            self.assertEqual(proc.returncode, 0, proc.stdout)
+            with open(output) as f:
+                run = json.load(f)["runs"][0]
+        return {
+            "adb_calls": run["adb_calls"],
+            "parsed_per_second": run["counters"]["elf.parsed"] / run["phases"]["elf_analysis"],
+            "peak_rss_kb": run["peak_rss_kb"],
+        }, run
+
+    def test_synthetic_run(self):
+        measured, run = self._bench()
+        self.assertEqual(run["missing_nodes"], [])
+        self.assertEqual(run["unexpected_nodes"], [])
+        self.assertEqual(run["graph_nodes"], run["expected_nodes"])
+        if os.environ.get("TEEZZ_UPDATE_BASELINE"):
+            with open(BASELINE, "w") as f:
+                json.dump(dict(measured, scale=PERF_SCALE), f, indent=4)
+                f.write("\n")
+            self.skipTest(f"baseline written to {BASELINE}")
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        self.assertEqual(baseline["scale"], PERF_SCALE)
+        self.assertLessEqual(measured["adb_calls"], baseline["adb_calls"] * ADB_CALLS_SLACK, measured)
+        if not os.environ.get("TEEZZ_PERF"):
+            return
+        self.assertGreaterEqual(measured["parsed_per_second"], baseline["parsed_per_second"] * PARSE_RATE_FLOOR,
+                                measured)
+        self.assertLessEqual(measured["peak_rss_kb"], baseline["peak_rss_kb"] * PEAK_RSS_SLACK, measured)
+
+
+if __name__ == '__main__':
+    unittest.main()
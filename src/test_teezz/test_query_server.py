@@ -0,0 +1,117 @@
+import unittest
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from dep_finder.graph_store import GraphStore
+from dep_finder.query_server import QueryServer, load_index
+from dep_finder.symbols import ElfInfo, SymbolIndex
+
+TARGET = "vendor/lib64/libMcClient.so"
+EDGES = {
+    "vendor/lib64/hw/keystore.so": ["vendor/lib64/libkeymaster.so"],
+    "vendor/lib64/libkeymaster.so": [TARGET, "system/lib64/libc.so"],
+    "vendor/bin/teed": [TARGET],
+    TARGET: ["system/lib64/libc.so"],
+}
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        store = GraphStore(os.path.join(self.tmp.name, "graph.db"))
+        store.replace("build/1", None, EDGES)
+        store.close()
+        symbols = SymbolIndex(os.path.join(self.tmp.name, "symbols.db"))
+        symbols.add(TARGET, ElfInfo(("arm64", 64), exports=["mcOpenDevice"]))
+        symbols.add("vendor/bin/teed", ElfInfo(("arm64", 64), needed=["libMcClient.so"], imports=["mcOpenDevice"]))
+        symbols.resolve()
+        symbols.close()
+        self.server = QueryServer(self.tmp.name, ("127.0.0.1", 0), reload_interval=0.05)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _get(self, query, method="GET"):
+        with urlopen(Request(self.url + query, method=method)) as response:
+            return json.load(response)
+
+    def test_queries(self):
+        self.assertEqual(self._get("/build"), {"build": "build/1", "nodes": 5})
+        self.assertEqual(self._get(f"/closure?node={TARGET}")["nodes"],
+                         ["vendor/bin/teed", "vendor/lib64/hw/keystore.so", "vendor/lib64/libkeymaster.so"])
+        self.assertEqual(self._get(f"/closure?node=/{TARGET}&match=*/hw/*")["nodes"],
+                         ["vendor/lib64/hw/keystore.so"])
+        self.assertEqual(self._get("/closure?node=vendor/bin/teed&direction=deps")["nodes"],
+                         ["system/lib64/libc.so", TARGET])
+        self.assertEqual(self._get(f"/path?from=vendor/lib64/hw/keystore.so&to={TARGET}")["path"],
+                         ["vendor/lib64/hw/keystore.so", "vendor/lib64/libkeymaster.so", TARGET])
+        self.assertEqual(self._get(f"/neighbors?node={TARGET}"),
+                         {"deps": ["system/lib64/libc.so"],
+                          "users": ["vendor/bin/teed", "vendor/lib64/libkeymaster.so"]})
+        self.assertEqual(self._get("/symbol?name=mcOpenDevice"),
+                         {"providers": [TARGET], "importers": [{"importer": "vendor/bin/teed", "provider": TARGET}]})
+        for query, status in (("/closure?node=nope", 404), ("/closure", 400), ("/nope", 404)):
+            with self.assertRaises(HTTPError) as error:
+                self._get(query)
+            self.assertEqual(error.exception.code, status)
+
+    def test_concurrent_clients(self):
+        answers = []
+
+        def client():
+            for _ in range(20):
+                answers.append(self._get(f"/path?from=vendor/lib64/hw/keystore.so&to={TARGET}")["path"])
+
+        clients = [threading.Thread(target=client) for _ in range(8)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        self.assertEqual(len(answers), 160)
+        self.assertEqual(len(set(map(tuple, answers))), 1)
+
+    def test_reload(self):
+        store = GraphStore(os.path.join(self.tmp.name, "graph.db"))
+        store.replace("build/2", None, dict(EDGES, **{"vendor/bin/new": [TARGET]}))
+        store.close()
+        deadline = time.monotonic() + 5
+        while self._get("/build")["build"] != "build/2" and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIn("vendor/bin/new", self._get(f"/closure?node={TARGET}")["nodes"])
+        self.assertEqual(self._get("/reload", method="POST"), {"build": "build/2"})
+
+    def test_read_only(self):
+        path = os.path.join(self.tmp.name, "graph.db")
+        with open(path, "rb") as f:
+            before = f.read()
+        self.assertEqual(load_index(self.tmp.name).fingerprint, "build/1")
+        store = GraphStore(path, read_only=True)
+        with self.assertRaises(sqlite3.OperationalError):
+            store.replace("build/2", None, EDGES)
+        store.close()
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        # nothing is created for a working directory without a run
+        with tempfile.TemporaryDirectory() as empty:
+            server = QueryServer(empty, ("127.0.0.1", 0))
+            self.assertIsNone(server.index.fingerprint)
+            self.assertIsNone(server.symbol_index())
+            server.server_close()
+            self.assertEqual(os.listdir(empty), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
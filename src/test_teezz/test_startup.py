@@ -0,0 +1,47 @@
+import unittest
+import os
+import sys
+import json
+import subprocess
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# only needed once a run or a query actually starts
+DEFERRED_MODULES = ["elftools", "cxxfilt", "concurrent_log_handler", "tracemalloc",
+                    "dep_finder.dependency_finder", "http.server", "sqlite3"]
+# runs `python -m dep_finder <args>` and prints the modules it loaded
+HELP_MODULES = """
+import sys, json, runpy
+sys.argv = ["dep_finder"] + sys.argv[1:]
+try:
+    runpy.run_module("dep_finder", run_name="__main__", alter_sys=True)
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class TestStartup(unittest.TestCase):
+
+    def _modules(self, *args):
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        proc = subprocess.run([sys.executable, "-c", HELP_MODULES] + list(args),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        usage, _, modules = proc.stdout.rstrip().rpartition("\n")
+        return usage, set(json.loads(modules))
+
+    def test_help_loads_no_heavy_modules(self):
+        usage, modules = self._modules("--help")
+        self.assertIn("--incremental", usage)
+        self.assertEqual([m for m in DEFERRED_MODULES if m in modules], [])
+
+    def test_import_does_not_configure_logging(self):
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+        proc = subprocess.run([sys.executable, "-c", "import logging, dep_finder.__main__; "
+                               "print(len(logging.getLogger('depFinderLogger').handlers))"],
+                              stdout=subprocess.PIPE, env=env, text=True)
+        self.assertEqual(proc.stdout.strip(), "0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import os
+import json
+import tempfile
+from unittest import mock
+
+from utils import metrics
+from dep_finder.journal import RunJournal
+from dep_finder.file_store import FileListStore
+from dep_finder.file_type import Elf
+from dep_finder.symbols import SymbolIndex, read_elf_info, library_names
+from dep_finder.dependency_finder import DependencyFinder
+from bench_teezz.runner import BenchDependencyFinder
+from bench_teezz.synth import APEX_DIR, FirmwareSpec, TARGET_LIB, build_elf, generate_firmware
+
+
+class TestSymbolIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = SymbolIndex(os.path.join(self.tmp.name, "symbols.db"))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.index.close()
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def _add(self, path, **kwargs):
+        local_path = os.path.join(self.tmp.name, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, "wb") as f:
+            f.write(build_elf(soname=os.path.basename(path), **kwargs))
+        self.index.add(path, read_elf_info(local_path))
+        return local_path
+
+    def test_read_elf_info(self):
+        local_path = self._add("vendor/bin/foo", needed=["libc.so"], imports=["malloc", "dlopen"],
+                               exports=["foo_main"], strings=["/vendor/lib64/libplugin.so"])
+        info = read_elf_info(local_path)
+        self.assertEqual(info.arch[1], 64)
+        self.assertEqual(info.needed, ["libc.so"])
+        self.assertEqual(info.soname, "foo")
+        self.assertEqual(info.imports, ["malloc", "dlopen"])
+        self.assertEqual(info.exports, ["foo_main"])
+        self.assertEqual(library_names(local_path), {"libc.so", "libplugin.so"})
+
+    def test_resolve_follows_needed_order(self):
+        self._add("system/lib64/libc.so", exports=["malloc", "free"])
+        self._add("vendor/lib64/libmalloc.so", needed=["libc.so"], exports=["malloc"])
+        self._add("vendor/lib64/libfoo.so", needed=["libmalloc.so"], imports=["malloc", "free", "missing"])
+        self._add("vendor/bin/bar", needed=["libc.so", "libmalloc.so"], imports=["malloc"])
+        self.assertEqual(self.index.resolve(), (3, 1))
+        # libmalloc.so comes first in the breadth first order of libfoo.so, libc.so of bar
+        self.assertEqual(self.index.imports_of("vendor/lib64/libfoo.so"),
+                         {"malloc": "vendor/lib64/libmalloc.so", "free": "system/lib64/libc.so", "missing": None})
+        self.assertEqual(self.index.importers("malloc"),
+                         [("vendor/bin/bar", "system/lib64/libc.so"),
+                          ("vendor/lib64/libfoo.so", "vendor/lib64/libmalloc.so")])
+        self.assertEqual(self.index.providers("malloc"), ["system/lib64/libc.so", "vendor/lib64/libmalloc.so"])
+
+    def test_add_replaces_and_prune_drops(self):
+        self._add("system/lib64/libc.so", exports=["malloc"])
+        self._add("vendor/bin/bar", needed=["libc.so"], imports=["malloc"])
+        self._add("vendor/bin/bar", needed=["libc.so"], imports=["free"])
+        self.assertEqual(self.index.importers("malloc"), [])
+        self.assertEqual(self.index.prune(["vendor/bin/bar"]), 1)
+        self.index.resolve()
+        self.assertEqual(self.index.providers("malloc"), [])
+        self.assertEqual(self.index.imports_of("vendor/bin/bar"), {"free": None})
+
+
+class TestSyntheticRun(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manifest = generate_firmware(self.tmp.name, FirmwareSpec.from_scale(30))
+        self.work_dir = os.path.join(self.tmp.name, "work")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        return super().tearDown()
+
+    def test_target_symbol_users(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=TARGET_LIB,
+                                       local_root=self.manifest["root"])
+        finder.run()
+        # dlopen users are found through the library names in their strings
+        self.assertEqual(set(finder.dependencies), set(self.manifest["expected_closure"]))
+        importers = sorted(path for path, provider in self.manifest["edges"] if provider == TARGET_LIB)
+        with open(os.path.join(self.work_dir, "target_symbols.json")) as f:
+            self.assertEqual(json.load(f), {"QSEECom_send_cmd": importers})
+        index = SymbolIndex(os.path.join(self.work_dir, "symbols.db"))
+        self.assertEqual(index.providers("QSEECom_send_cmd"), [TARGET_LIB])
+        index.close()
+
+    def test_archs_come_from_the_workers(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=TARGET_LIB,
+                                       local_root=self.manifest["root"])
+        # the parent only reads the architectures the analysis returned
+        with mock.patch.object(Elf, "get_arch", side_effect=AssertionError("parsed in the parent")):
+            finder.run()
+        self.assertEqual(set(finder.dependencies), set(self.manifest["expected_closure"]))
+        archs = FileListStore(os.path.join(self.work_dir, "files.db")).load(Elf).archs()
+        self.assertEqual(set(archs), set(self.manifest["elfs"]))
+
+    def test_finder_sent_to_workers_once(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=TARGET_LIB,
+                                       local_root=self.manifest["root"])
+        getstate = DependencyFinder.__getstate__
+        with mock.patch.object(DependencyFinder, "__getstate__", autospec=True, side_effect=getstate) as sent:
+            finder.run()
+        self.assertEqual(set(finder.dependencies), set(self.manifest["expected_closure"]))
+        # at most once per worker of the ELF and VDEX pools, not per task
+        self.assertLessEqual(sent.call_count, 2 * finder._thread_count)
+
+    def test_identical_copies_analysed_once(self):
+        finder = BenchDependencyFinder(work_dir=self.work_dir, target_lib=TARGET_LIB,
+                                       local_root=self.manifest["root"])
+        finder.run()
+        copies = [p for p in self.manifest["elfs"] if p.startswith(APEX_DIR)]
+        counters = metrics.get_metrics().summary()["counters"]
+        self.assertEqual(counters["elf.duplicates"], len(copies))
+        self.assertEqual(counters["elf.parsed"], len(self.manifest["elfs"]) - len(copies))
+        journal = RunJournal(os.path.join(self.work_dir, "journal.db"))
+        results = journal.results("elf_analysis")
+        journal.close()
+        index = SymbolIndex(os.path.join(self.work_dir, "symbols.db"))
+        for copy in copies:
+            original = "system/lib64/" + os.path.basename(copy)
+            self.assertEqual(results[copy], results[original])
+            self.assertEqual(index.exports_of(copy), index.exports_of(original))
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
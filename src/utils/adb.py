@@ -1,13 +1,28 @@
 import subprocess
 import os
+import io
 import string
 import random
+import shlex
+import shutil
+import tempfile
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from utils import metrics
 
 
 class Adb(object):
+    """Runs adb commands; shared by the device worker threads, so the
+    running processes and the privilege probe are guarded by locks."""
 
     def __init__(self, adb_path="adb", device=None, logger=None, listen=None):
         self.process = []
+        self._process_lock = threading.Lock()
         self.logger = logger
         self.adb_path = adb_path
         self.device_id = device
@@ -17,36 +32,114 @@ class Adb(object):
         self.adb_prefix: list = [self.adb_path]
         if device is not None:
             self.adb_prefix = self.adb_prefix + ["-s", device]
-        if self._has_su_cmd() and not self.adb_is_root():
-            self.used_su = True
-        else:
-            self.used_su = False
+        # probed on the first privileged call, not for every one
+        self._is_root: bool | None = None
+        self._has_su: bool | None = None
+        self._tried_adb_root = False
+        self._privilege_lock = threading.Lock()
+
+    def __getstate__(self):
+        # pickled along with a backend into pool workers, which run no commands
+        state = self.__dict__.copy()
+        del state["_process_lock"], state["_privilege_lock"]
+        state["process"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._process_lock = threading.Lock()
+        self._privilege_lock = threading.Lock()
+
+    def _track(self, proc: subprocess.Popen):
+        with self._process_lock:
+            self.process.append(proc)
+
+    def _untrack(self, proc: subprocess.Popen):
+        with self._process_lock:
+            self.process.remove(proc)
+
+    def _probe_privileges(self):
+        """Asks the device for `whoami` and `su` at the same time, once."""
+        with self._privilege_lock:
+            if self._is_root is not None:
+                return
+            with ThreadPoolExecutor(2) as pool:
+                whoami = pool.submit(self.call_adb_shell, ["whoami"])
+                su = pool.submit(self.call_adb_shell, ['su', '-c'])
+                self._has_su = su.result().find('/system/bin/sh: su:') == -1
+                self._is_root = "root" in whoami.result()
+
+    @property
+    def used_su(self) -> bool:
+        if self._is_root is None:
+            self._probe_privileges()
+        return self._has_su and not self._is_root
 
     def _run_cmd(self, args: list) -> str:
         out = ''
+        metrics.count("adb.commands")
+        start = time.perf_counter()
         try:
             proc = subprocess.Popen(args, 
                                     stdout=subprocess.PIPE, 
                                     stderr=subprocess.PIPE,
                                     stdin=subprocess.PIPE)
-            self.process.append(proc)
-            out, err = proc.communicate()
-            for local_proc in self.process:
-                if local_proc is proc:
-                    self.process.remove(proc)
+            self._track(proc)
+            try:
+                out, err = proc.communicate()
+            finally:
+                self._untrack(proc)
             if proc.returncode != 0:
                 return err.decode('utf-8', 'ignore')
         except OSError as e:
             if self.logger is not None:
                 self.logger.info("error result: %s", str(e))
             return str(e)
+        finally:
+            metrics.count("adb.seconds", time.perf_counter() - start)
         return out.decode("utf8", "ignore")
 
+    def _iter_cmd_lines(self, args: list) -> Iterator[str]:
+        """Yields the stdout lines of `args` while the command is running.
+
+        stderr is spooled to a temporary file and logged if the command
+        fails. Closing the generator early kills the command.
+        """
+        metrics.count("adb.commands")
+        start = time.perf_counter()
+        try:
+            with tempfile.TemporaryFile() as err:
+                try:
+                    proc = subprocess.Popen(args,
+                                            stdout=subprocess.PIPE,
+                                            stderr=err,
+                                            stdin=subprocess.DEVNULL)
+                except OSError as e:
+                    if self.logger is not None:
+                        self.logger.info("error result: %s", str(e))
+                    return
+                self._track(proc)
+                # universal newlines, as `splitlines()` on the buffered output
+                lines = io.TextIOWrapper(proc.stdout, encoding="utf8", errors="ignore")
+                try:
+                    for line in lines:
+                        yield line.rstrip("\n")
+                    proc.wait()
+                finally:
+                    if proc.poll() is None:
+                        proc.kill()
+                        proc.wait()
+                    lines.close()
+                    self._untrack(proc)
+                if proc.returncode != 0 and self.logger is not None:
+                    err.seek(0)
+                    self.logger.info("`%s` exited with %d: %s", " ".join(args[len(self.adb_prefix):]),
+                                     proc.returncode, err.read().decode("utf8", "ignore").strip())
+        finally:
+            metrics.count("adb.seconds", time.perf_counter() - start)
+
     def _system_adb_exist(self):
-        text = self._run_cmd(['adb'])
-        if "找不到" in text or "not found" in text:
-            return False
-        return True
+        return shutil.which("adb") is not None
 
     def call_adb(self, args: list) -> str:
         return self._run_cmd(self.adb_prefix + args) 
@@ -54,30 +147,75 @@ class Adb(object):
     def call_adb_shell(self, args: list) -> str:
         return self.call_adb(['shell'] + args)
 
-    def call_privileged_adb_shell(self, args: list) -> str:
-        if self.logger is not None:
+    def _privileged_shell_args(self, args: list) -> list:
+        if self.logger is not None and self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("Privileged call: %s", ' '.join(self.adb_prefix + args))
         if self.adb_is_root():
-            return self.call_adb_shell(args)
-        elif not self.adb_is_root() and self.used_su:
-            return self.call_adb_shell(["su", "-c"] + args)
-        elif not self.adb_is_root() and not self.used_su:
-            # Run oem self-defined command 
-            self.call_adb(["root"]) 
-            return self.call_adb_shell(args)
+            return args
+        elif self.used_su:
+            return ["su", "-c"] + args
+        else:
+            # Run oem self-defined command, once; other threads wait for its outcome
+            with self._privilege_lock:
+                if not self._tried_adb_root:
+                    self._tried_adb_root = True
+                    self.call_adb(["root"])
+                    self._is_root = "root" in self.call_adb_shell(["whoami"])
+            return args
+
+    def call_privileged_adb_shell(self, args: list) -> str:
+        return self.call_adb_shell(self._privileged_shell_args(args))
+
+    @contextmanager
+    def exec_out(self, cmd: str, privileged: bool = False) -> Iterator[subprocess.Popen]:
+        """Runs the shell command `cmd` through `adb exec-out` and yields the
+        process; its stdout is the raw byte stream of `cmd`. `exec-out` does
+        not report the exit status of `cmd`, the output has to tell."""
+        if privileged:
+            args = self._privileged_shell_args([cmd])
+            if args[0] == "su":
+                args = ["su", "-c", shlex.quote(cmd)]
+        else:
+            args = [cmd]
+        metrics.count("adb.commands")
+        start = time.perf_counter()
+        proc = subprocess.Popen(self.adb_prefix + ["exec-out"] + args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                stdin=subprocess.DEVNULL)
+        self._track(proc)
+        try:
+            yield proc
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            self._untrack(proc)
+            metrics.count("adb.seconds", time.perf_counter() - start)
+
+    def iter_adb_lines(self, args: list) -> Iterator[str]:
+        return self._iter_cmd_lines(self.adb_prefix + args)
+
+    def iter_shell_lines(self, args: list) -> Iterator[str]:
+        """Like `call_adb_shell`, but yields the output line by line as
+        the device produces it."""
+        return self.iter_adb_lines(['shell'] + args)
+
+    def iter_privileged_shell_lines(self, args: list) -> Iterator[str]:
+        return self.iter_shell_lines(self._privileged_shell_args(args))
 
 
     def adb_is_root(self):
-        out = self.call_adb_shell(["whoami"])
-        if "root" in out:
-            return True
-        return False
+        if self._is_root is None:
+            self._probe_privileges()
+        return self._is_root
 
     def _has_su_cmd(self):
-        text = self.call_adb_shell(['su', '-c'])
-        if text.find('/system/bin/sh: su:') != -1:
-            return False
-        return True
+        if self._has_su is None:
+            self._probe_privileges()
+        return self._has_su
 
     def adb_forward(self, lport, dport):
         out = self.call_adb(["forward", "tcp:{}".format(lport), "tcp:{}".format(dport)])
@@ -165,7 +303,9 @@ class Adb(object):
         return [new_path + element for element in split_list if element]
 
     def kill_all_adb_process(self):
-        for proc in self.process:
+        with self._process_lock:
+            running = list(self.process)
+        for proc in running:
             proc.kill()
 
 
@@ -0,0 +1,142 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator
+
+from utils import metrics, profiling
+from utils.log import get_logger
+
+logger = get_logger('utilsLogger')
+
+# bytes counted as one more unit of work when latencies are compared
+LATENCY_UNIT_BYTES = 1 << 20
+# smallest number of completions the controller decides on
+MIN_WINDOW = 4
+# windows the baseline latency is the minimum of, so it follows a device that got slower
+BASELINE_WINDOWS = 32
+# throughput loss after an increase that counts as congestion
+THROUGHPUT_DROP = 0.25
+
+
+class AimdController(object):
+    """Number of device operations allowed in flight, adapted additive
+    increase / multiplicative decrease style.
+
+    Operations `acquire()` a slot and `release()` it with their latency,
+    success and size. After every window of `limit` completions the limit
+    grows by one, unless the window saw errors, a median latency (per unit
+    of work, sizes normalized) more than `slack` times the baseline, or a
+    throughput drop after the last increase; then it is multiplied by
+    `backoff`. Until the first of these the limit doubles instead, so the
+    baseline is measured on an idle device and the limit still gets up
+    quickly. Independent of the number of CPUs.
+    """
+
+    def __init__(self, initial: int = 1, minimum: int = 1, maximum: int = 16,
+                 backoff: float = 0.5, slack: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.slack = slack
+        self.clock = clock
+        self.in_flight = 0
+        self.peak = int(self.limit)
+        self.decreases = 0
+        self._cond = threading.Condition()
+        self._reset_window()
+        self._medians = deque(maxlen=BASELINE_WINDOWS)
+        self._throughput = None
+        self._increased = False
+        self._slow_start = True
+
+    def __getstate__(self):
+        # pickled along with a backend into pool workers, which do not use it
+        state = self.__dict__.copy()
+        del state["_cond"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cond = threading.Condition()
+
+    def _reset_window(self):
+        self._window_start = self.clock()
+        self._latencies = []
+        self._errors = 0
+        self._units = 0.0
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, seconds: float, ok: bool = True, nbytes: int = 0):
+        with self._cond:
+            self.in_flight -= 1
+            units = 1 + nbytes / LATENCY_UNIT_BYTES
+            self._units += units
+            if ok:
+                self._latencies.append(seconds / units)
+            else:
+                self._errors += 1
+            if len(self._latencies) + self._errors >= max(int(self.limit), MIN_WINDOW):
+                self._adjust()
+            self._cond.notify_all()
+
+    def _adjust(self):
+        elapsed = self.clock() - self._window_start
+        throughput = self._units / elapsed if elapsed > 0 else None
+        latencies = sorted(self._latencies)
+        median = latencies[len(latencies) // 2] if latencies else None
+        if median is not None:
+            self._medians.append(median)
+        congested = (self._errors > 0
+                     or (median is not None and median > self.slack * min(self._medians))
+                     or (self._increased and throughput is not None and self._throughput is not None
+                         and throughput < self._throughput * (1 - THROUGHPUT_DROP)))
+        if congested:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self.decreases += 1
+            self._slow_start = False
+            logger.debug("Device concurrency down to %d (%d errors, median %.3fs)",
+                         int(self.limit), self._errors, median or 0.0)
+        else:
+            self.limit = min(self.maximum, self.limit * 2 if self._slow_start else self.limit + 1)
+            self.peak = max(self.peak, int(self.limit))
+        self._increased = not congested
+        self._throughput = throughput
+        self._reset_window()
+
+
+def run_adaptive(func: Callable, items: Iterable, controller: AimdController, phase: str,
+                 failed: Callable = lambda result: False, size: Callable = lambda item: 0) -> Iterator:
+    """Runs `func` on every item on threads, as many at a time as
+    `controller` allows, and yields the results as they complete. A result
+    is an error for the controller if `failed(result)` or `func` raised;
+    `size(item)`, called once `func` is done, is the bytes it moved."""
+    decreases = controller.decreases
+
+    def task(item):
+        controller.acquire()
+        start = time.perf_counter()
+        ok = False
+        try:
+            # the profiler of the phase only sees the thread that started it
+            with profiling.profile_thread(phase):
+                result = func(item)
+            ok = not failed(result)
+            return result
+        finally:
+            end = time.perf_counter()
+            controller.release(end - start, ok, size(item) if ok else 0)
+            metrics.get_metrics().record_task(phase, start, end)
+
+    with ThreadPoolExecutor(controller.maximum) as pool:
+        for future in as_completed([pool.submit(task, item) for item in items]):
+            yield future.result()
+    # workers of the phase: the most operations that were in flight
+    metrics.get_metrics().record_pool(phase, controller.peak)
+    metrics.count("device.backoffs", controller.decreases - decreases)
@@ -1,10 +1,133 @@
-from concurrent_log_handler import ConcurrentRotatingFileHandler
 from logging.config import fileConfig
+from logging.handlers import QueueHandler
+import multiprocessing
+import threading
 import logging
+import time
+
+LOGGER_NAMES = ("depFinderLogger", "utilsLogger")
+
 
 def init_ini_log(config_file) -> None:
+    # registers `handlers.ConcurrentRotatingFileHandler`; slow, so only imported here
+    import concurrent_log_handler  # noqa: F401
     fileConfig(config_file)
 
 def get_logger(logger_name) -> logging.Logger:
     logger = logging.getLogger(logger_name)
-    return logger
\ No newline at end of file
+    return logger
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `rate` DEBUG records per second through for every call
+    site; what gets dropped is reported on the next record that passes.
+    Records above DEBUG always pass."""
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        # (pathname, lineno) -> [window start, records in window, suppressed]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [now, 0, 0]
+            if now - site[0] >= 1.0:
+                site[0], site[1] = now, 0
+            if site[1] >= self.rate:
+                site[2] += 1
+                return False
+            site[1] += 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar records suppressed]"
+            record.args = None
+        return True
+
+
+class _SimpleQueueHandler(QueueHandler):
+    """`SimpleQueue` writes straight to its pipe: no feeder thread whose
+    buffer would be lost when a pool worker gets terminated."""
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+class _QueueLog(object):
+
+    def __init__(self, original, queue, listener, handlers):
+        self.original = original
+        self.queue = queue
+        self.listener = listener
+        self.handlers = handlers
+
+
+_queue_log: _QueueLog | None = None
+
+
+def _serve_queue(queue, handlers):
+    while True:
+        record = queue.get()
+        if record is None:
+            break
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+    for handler in handlers:
+        handler.flush()
+
+
+def init_queue_log(debug_rate: int | None = None, names=LOGGER_NAMES) -> None:
+    """Moves the handlers of the loggers `names` into one listener process.
+
+    The loggers, and the pool workers forked later on, only push records
+    into a queue, so no process contends on the log file lock anymore.
+    With `debug_rate` DEBUG records are rate limited per call site before
+    they are queued.
+    """
+    global _queue_log
+    if _queue_log is not None:
+        return
+    queue = multiprocessing.SimpleQueue()
+    handlers = []
+    for name in names:
+        for handler in get_logger(name).handlers:
+            if handler not in handlers:
+                handlers.append(handler)
+    listener = multiprocessing.Process(target=_serve_queue, args=(queue, handlers),
+                                       name="log-listener", daemon=True)
+    listener.start()
+    queue_handler = _SimpleQueueHandler(queue)
+    if debug_rate is not None:
+        queue_handler.addFilter(RateLimitFilter(debug_rate))
+    original = {}
+    for name in names:
+        logger = get_logger(name)
+        original[name] = list(logger.handlers)
+        for handler in original[name]:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+    _queue_log = _QueueLog(original, queue, listener, handlers)
+
+
+def stop_queue_log() -> None:
+    """Drains the queue, stops the listener and restores the handlers."""
+    global _queue_log
+    if _queue_log is None:
+        return
+    for name, handlers in _queue_log.original.items():
+        logger = get_logger(name)
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for handler in handlers:
+            logger.addHandler(handler)
+    _queue_log.queue.put(None)
+    _queue_log.listener.join()
+    _queue_log = None
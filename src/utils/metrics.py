@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+
+from utils import profiling
+
+
+class Metrics(object):
+    """Spans, counters and pool task records of one run.
+
+    Every process has its own current `Metrics`. Work sent to a
+    `multiprocessing.Pool` is wrapped with `instrument()`, which records
+    into a fresh instance inside the worker and ships it back with the
+    result; `collect()` merges it into the parent.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.origin = time.perf_counter()
+        # (name, pid, tid, start, end)
+        self.spans: List[tuple] = []
+        # (phase, pid, start, end)
+        self.tasks: List[tuple] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.pools: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            with profiling.profile_phase(name):
+                yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append((name, os.getpid(), threading.get_ident(), start, end))
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def record_task(self, phase: str, start: float, end: float):
+        """Records a task run on a thread of this process."""
+        with self._lock:
+            self.tasks.append((phase, os.getpid(), start, end))
+
+    def record_pool(self, phase: str, processes: int):
+        self.pools[phase] = max(self.pools.get(phase, 0), processes)
+
+    def export(self) -> dict:
+        return {"spans": self.spans, "tasks": self.tasks,
+                "counters": dict(self.counters), "pools": self.pools}
+
+    def merge(self, exported: dict):
+        with self._lock:
+            self.spans.extend(exported["spans"])
+            self.tasks.extend(exported["tasks"])
+            for name, value in exported["counters"].items():
+                self.counters[name] += value
+        for phase, processes in exported["pools"].items():
+            self.record_pool(phase, processes)
+        for phase, data in exported.get("profile", {}).items():
+            profiling.merge(phase, data)
+
+    ############################################################################
+    # Reports
+    ############################################################################
+
+    def summary(self) -> dict:
+        phases = {}
+        for name, pid, _, start, end in self.spans:
+            phase = phases.setdefault(name, {"seconds": 0.0, "calls": 0, "tasks": 0,
+                                             "busy_seconds": 0.0, "workers": 0})
+            phase["seconds"] += end - start
+            phase["calls"] += 1
+        for name, _, start, end in self.tasks:
+            phase = phases.setdefault(name, {"seconds": 0.0, "calls": 0, "tasks": 0,
+                                             "busy_seconds": 0.0, "workers": 0})
+            phase["tasks"] += 1
+            phase["busy_seconds"] += end - start
+        for name, phase in phases.items():
+            workers = self.pools.get(name, len({t[1] for t in self.tasks if t[0] == name}))
+            phase["workers"] = workers
+            if workers and phase["seconds"] > 0:
+                phase["utilization"] = phase["busy_seconds"] / (workers * phase["seconds"])
+        return {"phases": phases, "counters": dict(sorted(self.counters.items()))}
+
+    def format_table(self) -> str:
+        summary = self.summary()
+        rows = [["phase", "seconds", "tasks", "workers", "utilization"]]
+        for name, phase in summary["phases"].items():
+            utilization = phase.get("utilization")
+            rows.append([name, f"{phase['seconds']:.3f}", str(phase["tasks"]), str(phase["workers"]),
+                         f"{utilization:.0%}" if utilization is not None else "-"])
+        widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(c.ljust(w) for c, w in zip(r, widths)) for r in rows]
+        if summary["counters"]:
+            width = max(len(n) for n in summary["counters"])
+            lines.append("")
+            for name, value in summary["counters"].items():
+                value = f"{value:.3f}" if isinstance(value, float) and not value.is_integer() else f"{int(value)}"
+                lines.append(f"{name.ljust(width)}  {value}")
+        return "\n".join(lines)
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+    def write_trace(self, path: str):
+        """Writes a Chrome trace-event file (chrome://tracing, Perfetto)."""
+        events = []
+        for name, pid, tid, start, end in self.spans:
+            events.append({"name": name, "cat": "phase", "ph": "X", "pid": pid, "tid": tid,
+                           "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6})
+        for name, pid, start, end in self.tasks:
+            events.append({"name": name, "cat": "task", "ph": "X", "pid": pid, "tid": pid,
+                           "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_current = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _current
+
+
+def span(name: str):
+    return _current.span(name)
+
+
+def count(name: str, value: float = 1):
+    _current.count(name, value)
+
+
+class _InstrumentedTask(object):
+    """Picklable wrapper running a pool task against a fresh `Metrics`."""
+
+    def __init__(self, func, phase: str):
+        self.func = func
+        self.phase = phase
+        self.profile = profiling.get_options()
+
+    def __call__(self, *args):
+        global _current
+        outer, _current = _current, Metrics()
+        profiler = profiling.PhaseProfiler(self.profile) if self.profile is not None else profiling.NULL
+        start = time.perf_counter()
+        try:
+            with profiler:
+                result = self.func(*args)
+        finally:
+            _current.tasks.append((self.phase, os.getpid(), start, time.perf_counter()))
+            exported = _current.export()
+            if self.profile is not None and profiler.data:
+                exported["profile"] = {self.phase: profiler.data}
+            _current = outer
+        return result, exported
+
+
+def instrument(func, phase: str) -> _InstrumentedTask:
+    """Wraps `func` for a pool; pass what the pool returns to `collect()`."""
+    return _InstrumentedTask(func, phase)
+
+
+def collect(packed):
+    """Merges the worker metrics of an instrumented task and returns its result."""
+    result, exported = packed
+    _current.merge(exported)
+    return result
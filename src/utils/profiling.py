@@ -0,0 +1,278 @@
+import os
+import sys
+import marshal
+import threading
+from collections import Counter
+from typing import Dict, Iterable
+
+MODES = ("cprofile", "sample", "memory")
+CATEGORIES = [
+    ("pyelftools", ("elftools",)),
+    ("cxxfilt", ("cxxfilt",)),
+    ("subprocess", ("subprocess.py", "popen_", "selectors.py")),
+    ("multiprocessing", ("multiprocessing",)),
+]
+# built-ins where the main process sits while pool workers do the work
+WAITING = ("acquire' of '_thread.lock", "poll' of 'select.poll", "posix.waitpid")
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 20
+
+
+class ProfileOptions(object):
+
+    def __init__(self, modes: Iterable[str], sample_interval: float = 0.005):
+        self.modes = set(modes)
+        unknown = self.modes - set(MODES)
+        if unknown:
+            raise ValueError(f"Unknown profile mode(s) {', '.join(sorted(unknown))}")
+        self.sample_interval = sample_interval
+
+
+_options: ProfileOptions | None = None
+# phase -> {"cprofile": stats, "samples": Counter, "memory": {...}}
+_results: Dict[str, dict] = {}
+_results_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(modes: Iterable[str], sample_interval: float = 0.005):
+    global _options
+    _options = ProfileOptions(modes, sample_interval)
+    _results.clear()
+
+
+def disable():
+    global _options
+    _options = None
+
+
+def get_options() -> ProfileOptions | None:
+    return _options
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of one thread into folded `a;b;c` stacks."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class PhaseProfiler(object):
+    """Profiles the block it guards with the modes of `options`; the
+    results are left in `data`, ready for `merge()`."""
+
+    def __init__(self, options: ProfileOptions):
+        self.options = options
+        self.data = {}
+
+    def __enter__(self):
+        # a thread runs at most one profiler, nested phases count for the outer one
+        self.active = getattr(_local, "busy_pid", None) != os.getpid()
+        if not self.active:
+            return self
+        _local.busy_pid = os.getpid()
+        self._started_tracing = False
+        # cProfile and tracemalloc are imported when used, not at startup
+        if "memory" in self.options.modes:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+        self._sampler = None
+        if "sample" in self.options.modes:
+            self._sampler = _Sampler(threading.get_ident(), self.options.sample_interval)
+            self._sampler.start()
+        self._profile = None
+        if "cprofile" in self.options.modes:
+            import cProfile
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:
+                # a single profiler per process (Python 3.12+), the one of the phase already runs
+                self._profile = None
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.create_stats()
+            self.data["cprofile"] = self._profile.stats
+        if self._sampler is not None:
+            self.data["samples"] = self._sampler.stop()
+        if "memory" in self.options.modes:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                self.data["memory"] = {
+                    "peak": tracemalloc.get_traced_memory()[1],
+                    "sites": {str(stat.traceback[0]): stat.size
+                              for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]},
+                }
+                if self._started_tracing:
+                    tracemalloc.stop()
+        _local.busy_pid = None
+        return False
+
+
+def profile_phase(phase: str):
+    """Context manager profiling a phase run in this process, a no-op
+    unless profiling is enabled."""
+    return _MergingPhaseProfiler(phase, _options) if _options is not None else NULL
+
+
+def profile_thread(phase: str):
+    """Like `profile_phase()`, for a task on a worker thread, which the
+    profiler of the phase does not see. CPU only: allocations are traced
+    process wide by the phase."""
+    if _options is None or not _options.modes & {"cprofile", "sample"}:
+        return NULL
+    return _MergingPhaseProfiler(phase, ProfileOptions(_options.modes - {"memory"}, _options.sample_interval))
+
+
+class _MergingPhaseProfiler(PhaseProfiler):
+
+    def __init__(self, phase: str, options: ProfileOptions):
+        super().__init__(options)
+        self.phase = phase
+
+    def __exit__(self, *exc):
+        super().__exit__(*exc)
+        if self.data:
+            merge(self.phase, self.data)
+        return False
+
+
+def _after_fork_in_child():
+    # a forked pool worker must not keep feeding the parent's profiler
+    if getattr(_local, "busy_pid", None) is not None:
+        sys.setprofile(None)
+        _local.busy_pid = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _NullContext(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL = _NullContext()
+
+
+def _add_stats(target: dict, stats: dict):
+    """Adds cProfile stats the way `pstats.Stats.add` does."""
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        if func not in target:
+            target[func] = (cc, nc, tt, ct, dict(callers))
+            continue
+        old_cc, old_nc, old_tt, old_ct, old_callers = target[func]
+        for caller, value in callers.items():
+            if caller in old_callers:
+                old = old_callers[caller]
+                value = tuple(a + b for a, b in zip(old, value)) if isinstance(value, tuple) else old + value
+            old_callers[caller] = value
+        target[func] = (old_cc + cc, old_nc + nc, old_tt + tt, old_ct + ct, old_callers)
+
+
+def merge(phase: str, data: dict):
+    with _results_lock:
+        _merge(phase, data)
+
+
+def _merge(phase: str, data: dict):
+    result = _results.setdefault(phase, {})
+    if "cprofile" in data:
+        _add_stats(result.setdefault("cprofile", {}), data["cprofile"])
+    if "samples" in data:
+        result.setdefault("samples", Counter()).update(data["samples"])
+    if "memory" in data:
+        memory = result.setdefault("memory", {"peak": 0, "sites": {}})
+        memory["peak"] = max(memory["peak"], data["memory"]["peak"])
+        for site, size in data["memory"]["sites"].items():
+            memory["sites"][site] = max(memory["sites"].get(site, 0), size)
+
+
+def _category(filename: str, function: str) -> str:
+    if filename == "~" and any(w in function for w in WAITING):
+        return "waiting"
+    for name, needles in CATEGORIES:
+        if any(n in filename for n in needles):
+            return name
+    return "other"
+
+
+def _format_phase(phase: str, result: dict) -> str:
+    lines = [f"== {phase} =="]
+    stats = result.get("cprofile")
+    if stats:
+        by_category = Counter()
+        for (filename, _, name), (_, _, tt, _, _) in stats.items():
+            by_category[_category(filename, name)] += tt
+        total = sum(by_category.values()) or 1
+        lines.append("self time by category: " + ", ".join(
+            f"{name} {tt:.3f}s ({tt / total:.0%})" for name, tt in by_category.most_common()))
+        lines.append(f"{'tottime':>9} {'cumtime':>9} {'ncalls':>9}  function")
+        top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+        for (filename, lineno, name), (_, nc, tt, ct, _) in top:
+            lines.append(f"{tt:9.3f} {ct:9.3f} {nc:9d}  {name} ({os.path.basename(filename)}:{lineno})"
+                         f" [{_category(filename, name)}]")
+    memory = result.get("memory")
+    if memory:
+        lines.append(f"peak traced memory: {memory['peak'] / 1024:.1f} KiB")
+        for site, size in sorted(memory["sites"].items(), key=lambda s: s[1], reverse=True)[:10]:
+            lines.append(f"{size / 1024:9.1f} KiB  {site}")
+    return "\n".join(lines)
+
+
+def write_reports(out_dir: str) -> str:
+    """Writes `<phase>.pstats`, `<phase>.folded` and a `summary.txt` per
+    profiled phase to `out_dir`; returns the summary."""
+    os.makedirs(out_dir, exist_ok=True)
+    summaries = []
+    all_samples = Counter()
+    for phase, result in sorted(_results.items()):
+        if "cprofile" in result:
+            with open(os.path.join(out_dir, f"{phase}.pstats"), "wb") as f:
+                marshal.dump(result["cprofile"], f)
+        if "samples" in result:
+            with open(os.path.join(out_dir, f"{phase}.folded"), "w") as f:
+                for stack, n in result["samples"].most_common():
+                    f.write(f"{stack} {n}\n")
+            all_samples.update({f"{phase};{stack}": n for stack, n in result["samples"].items()})
+        summaries.append(_format_phase(phase, result))
+    if all_samples:
+        with open(os.path.join(out_dir, "all.folded"), "w") as f:
+            for stack, n in all_samples.most_common():
+                f.write(f"{stack} {n}\n")
+    summary = "\n\n".join(summaries)
+    with open(os.path.join(out_dir, "summary.txt"), "w") as f:
+        f.write(summary + "\n")
+    return summary
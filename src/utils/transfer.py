@@ -0,0 +1,154 @@
+import os
+import shlex
+import time
+import zlib
+import hashlib
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from utils import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HASH_COMMAND = "md5sum"
+CHUNK_SIZE = 1 << 16
+# bytes sent over the link, and compressed on the device, while calibrating
+PROBE_BYTES = 4 << 20
+# a codec has to beat the raw transfer by this factor to be used
+MIN_GAIN = 1.2
+
+
+class TransferError(Exception):
+    pass
+
+
+class Codec(NamedTuple):
+    name: str
+    # device command compressing stdin to stdout
+    command: str
+    decompressor: Optional[Callable]
+
+
+CODECS: Dict[str, Codec] = {
+    "gzip": Codec("gzip", "gzip -c -1", lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)),
+}
+DECOMPRESS_ERRORS: tuple = (zlib.error,)
+if zstandard is not None:
+    CODECS["zstd"] = Codec("zstd", "zstd -c -1 -q", lambda: zstandard.ZstdDecompressor().decompressobj())
+    DECOMPRESS_ERRORS += (zstandard.ZstdError,)
+
+
+class LinkStats(NamedTuple):
+    """What `calibrate()` measured: round trip seconds, link bytes/s and,
+    per codec, device compression bytes/s and compressed size ratio."""
+    latency: float
+    bandwidth: float
+    codecs: Dict[str, tuple]
+    verify: bool
+
+    def choose(self) -> str:
+        """Returns the fastest mode: `raw` or a codec name. With the device
+        compressing while the data is sent, a codec costs the slower of
+        compression and sending the compressed bytes."""
+        raw_cost = 1.0 / self.bandwidth
+        best, best_cost = "raw", raw_cost / MIN_GAIN
+        for name, (speed, ratio) in self.codecs.items():
+            cost = max(1.0 / speed, ratio / self.bandwidth)
+            if cost < best_cost:
+                best, best_cost = name, cost
+        return best
+
+
+def device_tools(adb, names: List[str]) -> List[str]:
+    """Returns which of the programs `names` exist on the device, in one call."""
+    cmd = f"for t in {' '.join(names)}; do which $t >/dev/null 2>&1 && echo $t; done"
+    return [line.strip() for line in adb.iter_shell_lines([cmd]) if line.strip()]
+
+
+def _timed_exec_out(adb, cmd: str) -> tuple:
+    start = time.perf_counter()
+    with adb.exec_out(cmd, privileged=True) as proc:
+        out = proc.stdout.read()
+    return out, time.perf_counter() - start
+
+
+def calibrate(adb, sample_paths: List[str]) -> LinkStats:
+    """Measures round trip time, link throughput and, on up to
+    `PROBE_BYTES` of the files to pull, how fast and how well each
+    available codec compresses on the device."""
+    tools = device_tools(adb, [HASH_COMMAND] + list(CODECS))
+    _, latency = _timed_exec_out(adb, "true")
+    out, seconds = _timed_exec_out(adb, f"head -c {PROBE_BYTES} /dev/zero")
+    bandwidth = len(out) / max(seconds - latency, 1e-6)
+    samples = " ".join(shlex.quote(p) for p in sample_paths)
+    read = f"cat {samples} 2>/dev/null | head -c {PROBE_BYTES}"
+    out, _ = _timed_exec_out(adb, f"{read} | wc -c")
+    sample_bytes = int(out.strip() or 0)
+    codecs = {}
+    for name, codec in CODECS.items():
+        if name not in tools or sample_bytes == 0:
+            continue
+        out, seconds = _timed_exec_out(adb, f"{read} | {codec.command} | wc -c")
+        if out.strip().isdigit():
+            codecs[name] = (sample_bytes / max(seconds - latency, 1e-6), int(out.strip()) / sample_bytes)
+    return LinkStats(latency, bandwidth, codecs, HASH_COMMAND in tools)
+
+
+def stream_pull(adb, what: str, where: str, mode: str = "raw", verify: bool = True) -> str:
+    """Pulls the device file `what` to `where` through one `exec-out`,
+    compressed on the device with codec `mode` unless it is `raw`, and
+    checks the device side hash of the file. Returns "" on success, the
+    error otherwise; a failed transfer leaves no file behind."""
+    path = shlex.quote(what)
+    trailer = f"{HASH_COMMAND} {path}" if verify else "echo -"
+    codec = CODECS.get(mode)
+    if codec is None:
+        cmd = f"stat -c %s {path} && cat {path} && {trailer}"
+    else:
+        cmd = f"{codec.command} < {path} && {trailer}"
+    digest = hashlib.md5()
+    try:
+        with adb.exec_out(cmd, privileged=True) as proc, open(where, "wb") as out:
+            stream = proc.stdout
+            wire = 0
+            if codec is None:
+                header = stream.readline()
+                if not header.strip().isdigit():
+                    raise TransferError(f"no such file: {header.decode('utf8', 'ignore').strip()}")
+                remaining = int(header)
+                while remaining:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise TransferError("transfer truncated")
+                    out.write(chunk)
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                    wire += len(chunk)
+                rest = stream.read()
+            else:
+                decompressor = codec.decompressor()
+                while not decompressor.eof:
+                    chunk = stream.read1(CHUNK_SIZE)
+                    if not chunk:
+                        raise TransferError("transfer truncated")
+                    wire += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    out.write(data)
+                    digest.update(data)
+                rest = decompressor.unused_data + stream.read()
+        fields = rest.split()
+        if not fields:
+            raise TransferError("hash missing")
+        expected = fields[0].decode("ascii", "ignore")
+        if expected != "-" and expected != digest.hexdigest():
+            raise TransferError(f"hash mismatch {digest.hexdigest()} != {expected}")
+    except (OSError, TransferError) + DECOMPRESS_ERRORS as e:
+        try:
+            os.unlink(where)
+        except OSError:
+            pass
+        return f"{what}: {e}"
+    metrics.count("pull.wire_bytes", wire)
+    return ""